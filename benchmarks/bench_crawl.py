@@ -0,0 +1,248 @@
+# benchmarks/bench_crawl.py
+#
+# End-to-end crawl benchmark: serves a synthetic site on localhost and runs
+# run.py against it, reporting pages per second, peak RSS, CPU time per
+# spider callback and the time spent in closed() writing the export.
+# The site is generated from --seed, so two runs with the same options
+# crawl exactly the same pages.
+#
+#   python benchmarks/bench_crawl.py --pages 2000 --fanout 8 --depth 5 --output before.json
+#   python benchmarks/bench_crawl.py --pages 2000 --fanout 8 --depth 5 --compare before.json
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from statistics import median
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = Path(__file__).resolve().parent.parent
+LAST_MODIFIED = "Mon, 05 Jan 2026 10:00:00 GMT"
+
+
+class SyntheticSite:
+    # Pages form a tree with `fanout` children per page, cut off at
+    # `depth`, plus `fanout` random cross links per page. A share of the
+    # pages links an asset, a share has a duplicate under /dup/ with the
+    # same body, and a share responds only after `slow_delay` seconds.
+    def __init__(self, pages, fanout, depth, assets, duplicates, slow, slow_delay, asset_size, seed):
+        self.fanout = fanout
+        self.slow_delay = slow_delay
+        self.asset_body = b"%PDF-1.4\n" + b"0" * max(0, asset_size * 1024 - 9)
+        rng = random.Random(seed)
+
+        levels = [0]
+        while len(levels) < pages:
+            parent = (len(levels) - 1) // fanout
+            if levels[parent] + 1 > depth:
+                break
+            levels.append(levels[parent] + 1)
+        self.levels = levels
+        self.count = len(levels)
+        self.cross = [
+            [rng.randrange(self.count) for _ in range(fanout)]
+            for _ in range(self.count)
+        ]
+        self.assets = {i for i in range(self.count) if rng.random() < assets}
+        self.duplicates = {i for i in range(1, self.count) if rng.random() < duplicates}
+        self.slow = {i for i in range(1, self.count) if rng.random() < slow}
+
+    def page_path(self, i):
+        return "/" if i == 0 else f"/s{i % 10}/page-{i}.html"
+
+    def render(self, i):
+        children = range(i * self.fanout + 1, min(self.count, i * self.fanout + self.fanout + 1))
+        parts = [f"<html><head><title>Page {i}</title></head><body><h1>Page {i}</h1><nav>"]
+        for j in [*children, *self.cross[i]]:
+            parts.append(f'<a href="{self.page_path(j)}">Page {j}</a> ')
+        parts.append("</nav><main>")
+        if i in self.assets:
+            parts.append(f'<a href="/files/report-{i}.pdf">Report {i}</a>')
+        if i in self.duplicates:
+            parts.append(f'<a href="/dup/{i}.html">Printable version</a>')
+        parts.append("<p>" + " ".join(f"word{(i * 7 + k) % 97}" for k in range(200)) + "</p>")
+        parts.append("</main></body></html>")
+        return "".join(parts).encode("utf-8")
+
+    def resolve(self, path):
+        # (status, content type, body, delay) for a request path
+        path = path.split("?", 1)[0]
+        if path == "/":
+            return 200, "text/html", self.render(0), 0
+        if path.startswith("/files/report-") and path.endswith(".pdf"):
+            return 200, "application/pdf", self.asset_body, 0
+        try:
+            if path.startswith("/dup/"):
+                i = int(path[len("/dup/"):-len(".html")])
+                if i in self.duplicates:
+                    return 200, "text/html", self.render(i), 0
+            else:
+                i = int(path.rsplit("page-", 1)[1][:-len(".html")])
+                if 0 < i < self.count and path == self.page_path(i):
+                    return 200, "text/html", self.render(i), self.slow_delay if i in self.slow else 0
+        except (IndexError, ValueError):
+            pass
+        return 404, "text/plain", b"not found", 0
+
+
+def serve(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            status, content_type, body, delay = site.resolve(self.path)
+            if delay:
+                time.sleep(delay)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Last-Modified", LAST_MODIFIED)
+            self.send_header("ETag", '"%s"' % hashlib.sha1(body).hexdigest()[:16])
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # The default listen backlog of 5 makes connection bursts wait for
+        # SYN retries, which would show up as seconds of crawl latency
+        request_queue_size = 1024
+        daemon_threads = True
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_crawl(url, args, workdir):
+    stats_file = workdir / "stats.json"
+    command = [
+        sys.executable, str(ROOT / "run.py"),
+        "--url", url,
+        "--max-pages", str(args.max_pages),
+        "--export", args.export,
+        "--stats-file", str(stats_file),
+        "--set", "CLOSESPIDER_PAGECOUNT=0",
+        "--set", "DEPTH_LIMIT=0",
+        *(["--download"] if args.download else []),
+        *[f"--set={s}" for s in args.set],
+    ]
+    started = time.perf_counter()
+    with open(workdir / "crawl.log", "w", encoding="utf-8") as log:
+        process = subprocess.Popen(command, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0 or not stats_file.exists():
+        raise SystemExit(f"[!] Crawl failed with exit code {process.returncode}, see {workdir / 'crawl.log'}")
+
+    stats = json.loads(stats_file.read_text(encoding="utf-8"))
+    pages = stats.get("spidercore/pages", 0)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {
+        "seconds": round(elapsed, 3),
+        "pages": pages,
+        "responses": stats.get("response_received_count", 0),
+        "pages_per_second": round(pages / elapsed, 2) if elapsed else 0,
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1),
+        "callback_cpu": {
+            key.split("/", 1)[1]: round(value, 4)
+            for key, value in stats.items() if key.startswith("callback_cpu/")
+        },
+        "callback_count": {
+            key.split("/", 1)[1]: value
+            for key, value in stats.items() if key.startswith("callback_count/")
+        },
+        "close_seconds": stats.get("spidercore/close_seconds"),
+        "bytes": stats.get("downloader/response_bytes", 0),
+    }
+
+
+def summarize(runs):
+    keys = ["seconds", "pages", "pages_per_second", "cpu_seconds", "peak_rss_mb", "close_seconds"]
+    summary = {}
+    for key in keys:
+        values = [r[key] for r in runs if r[key] is not None]
+        summary[key] = median(values) if values else None
+    callbacks = {name for r in runs for name in r["callback_cpu"]}
+    summary["callback_cpu"] = {name: median(r["callback_cpu"].get(name, 0) for r in runs) for name in callbacks}
+    return summary
+
+
+def compare(summary, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))["summary"]
+    print(f"  compared with {baseline_path}:")
+    for key in ["pages_per_second", "seconds", "cpu_seconds", "peak_rss_mb", "close_seconds"]:
+        before, after = baseline.get(key), summary.get(key)
+        if before and after is not None:
+            print(f"    {key:18} {before:10.2f} -> {after:10.2f}  ({(after - before) / before * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a full crawl against a synthetic local site.")
+    parser.add_argument("--pages", type=int, default=1000, help="Pages on the synthetic site")
+    parser.add_argument("--fanout", type=int, default=8, help="Child pages and cross links per page")
+    parser.add_argument("--depth", type=int, default=4, help="Depth of the page tree")
+    parser.add_argument("--assets", type=float, default=0.1, help="Share of pages linking an asset")
+    parser.add_argument("--asset-size", type=int, default=64, help="Asset size in KB")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="Share of pages with a duplicate URL")
+    parser.add_argument("--slow", type=float, default=0.02, help="Share of slow pages")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="Seconds a slow page takes to respond")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the site layout")
+    parser.add_argument("--export", default="xml", help="Export format passed to run.py")
+    parser.add_argument("--download", action="store_true", help="Also download the assets")
+    parser.add_argument("--max-pages", type=int, default=1000000, help="--max-pages passed to run.py")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="Setting override passed to run.py (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3, help="Crawls to run; the median is reported")
+    parser.add_argument("--output", default="bench-crawl.json", help="Where to save the results")
+    parser.add_argument("--compare", help="Earlier results file to compare the median with")
+    args = parser.parse_args()
+
+    site = SyntheticSite(args.pages, args.fanout, args.depth, args.assets, args.duplicates,
+                         args.slow, args.slow_delay, args.asset_size, args.seed)
+    server = serve(site)
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    print(f"Synthetic site: {site.count} pages, {len(site.assets)} assets, {len(site.duplicates)} duplicates, "
+          f"{len(site.slow)} slow pages at {url}")
+
+    runs = []
+    for n in range(args.repeat):
+        with tempfile.TemporaryDirectory(prefix="bench-crawl-") as tmp:
+            result = run_crawl(url, args, Path(tmp))
+        runs.append(result)
+        callbacks = ", ".join(f"{k} {v:.3f}s" for k, v in sorted(result["callback_cpu"].items()))
+        print(f"  run {n + 1}: {result['pages']} pages in {result['seconds']:.2f}s "
+              f"({result['pages_per_second']:.1f} pages/s), cpu {result['cpu_seconds']:.2f}s, "
+              f"peak rss {result['peak_rss_mb']} MB, closed() {result['close_seconds']}s, callbacks: {callbacks}")
+    server.shutdown()
+
+    summary = summarize(runs)
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "runs": runs,
+        "summary": summary,
+    }
+    Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"  median: {summary['pages_per_second']:.1f} pages/s over {args.repeat} runs -> {args.output}")
+    if args.compare:
+        compare(summary, args.compare)
+
+
+if __name__ == "__main__":
+    main()
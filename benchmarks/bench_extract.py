@@ -0,0 +1,104 @@
+# benchmarks/bench_extract.py
+#
+# Micro-benchmark of per-page link extraction: the original selector code
+# from BasicSpider.parse against each LinkExtractor backend.
+#
+#   python benchmarks/bench_extract.py --links 500 --pages 200
+
+import re
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+from urllib.parse import urlparse
+from scrapy.http import HtmlResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from spidercore.extract import LinkExtractor, BACKENDS
+
+
+def make_page(links, seed):
+    rng = random.Random(seed)
+    parts = ["<html><head><title>Benchmark page</title>",
+             '<link rel="stylesheet" href="/static/site.css">',
+             '<script src="/static/app.js"></script></head><body><nav>']
+    # Navigation repeated on every page, like a real site header
+    for i in range(20):
+        parts.append(f'<a href="/section-{i}/">Section {i}</a>')
+    parts.append("</nav><main>")
+    for i in range(links):
+        kind = rng.random()
+        if kind < 0.6:
+            href = f"/section-{rng.randrange(20)}/page-{rng.randrange(5000)}.html"
+        elif kind < 0.75:
+            href = f"https://example.com/section-{rng.randrange(20)}/page-{rng.randrange(5000)}"
+        elif kind < 0.85:
+            href = f"../files/report-{rng.randrange(300)}.{rng.choice(['pdf', 'zip', 'docx', 'PDF'])}"
+        elif kind < 0.9:
+            href = f"mailto:user{i}@example.com"
+        elif kind < 0.95:
+            href = f"tel:+1555{i:04d}"
+        else:
+            href = f"page-{i}.html#section"
+        parts.append(f'<p>Paragraph {i} <a href="{href}">link {i}</a> <img src="/img/{i % 50}.png"></p>')
+    parts.append("</main></body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def selector_baseline(response):
+    # The extraction BasicSpider.parse performed before LinkExtractor
+    assets = []
+    for asset in response.css("a::attr(href), link::attr(href), script::attr(src), img::attr(src)"):
+        asset_url = response.urljoin(asset.get())
+        if re.search(r"\.(pdf|zip|docx|xlsx|pptx)$", asset_url, re.IGNORECASE):
+            assets.append(asset_url)
+    links = []
+    for href in response.css("a::attr(href)").getall():
+        if not href or href.startswith(("tel:", "mailto:", "javascript:")):
+            continue
+        full_url = response.urljoin(href)
+        if urlparse(full_url).scheme not in ["http", "https"]:
+            continue
+        links.append(full_url)
+    response.xpath("//title/text()").get()
+    return links, assets
+
+
+def run(name, func, bodies, repeat):
+    best = None
+    for _ in range(repeat):
+        # Fresh responses every round so document parsing is always included
+        responses = [HtmlResponse(f"https://example.com/section-1/page-{i}.html", body=b, encoding="utf-8")
+                     for i, b in enumerate(bodies)]
+        start = time.perf_counter()
+        for response in responses:
+            func(response)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return name, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark link extraction backends.")
+    parser.add_argument("--pages", type=int, default=200, help="Pages per round")
+    parser.add_argument("--links", type=int, default=300, help="Links per page")
+    parser.add_argument("--repeat", type=int, default=5, help="Rounds; the best one is reported")
+    args = parser.parse_args()
+
+    bodies = [make_page(args.links, seed) for seed in range(args.pages)]
+    results = [run("selectors (original)", selector_baseline, bodies, args.repeat)]
+    for backend in BACKENDS:
+        extractor = LinkExtractor(backend)
+        results.append(run(f"LinkExtractor[{backend}]", extractor.extract, bodies, args.repeat))
+
+    baseline = results[0][1]
+    print(f"{args.pages} pages x {args.links} links, best of {args.repeat}")
+    for name, elapsed in results:
+        per_page = elapsed / args.pages * 1000
+        print(f"  {name:28} {per_page:8.3f} ms/page  {baseline / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
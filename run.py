@@ -1,102 +1,358 @@
-# run.py
-
-import argparse
-import logging
-import time
-import sys
-from scrapy.utils.log import configure_logging
-from scrapy.crawler import CrawlerProcess
-from scrapy.settings import Settings
-from spidercore.spiders.basic import BasicSpider
-from spidercore import settings as project_settings
-
-def main():
-    parser = argparse.ArgumentParser(description="Run the basic sitemap spider.")
-    parser.add_argument("--url", required=True, help="Start URL for the crawl")
-    parser.add_argument("--filter-url", help="Only keep URLs matching this substring")
-    parser.add_argument("--pattern", help="Regex pattern to match URLs")
-    parser.add_argument("--download", action="store_true", help="Download matching assets (PDF, ZIP, etc)")
-    parser.add_argument("--max-pages", type=int, default=250, help="Maximum number of pages to crawl")
-    parser.add_argument("--export", choices=["json", "csv", "xml", "html"], default="html", help="Export format")
-    parser.add_argument("--content", action="store_true", help="Also extract page titles for context")
-
-    args = parser.parse_args()
-
-    # 1. Disable Scrapy's default root handler
-    configure_logging(install_root_handler=False)
-
-    # 2. Remove any existing root handlers
-    for handler in logging.root.handlers[:]:
-        logging.root.removeHandler(handler)
-
-    # 3. Define the custom formatter and handler
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(logging.Formatter('[%(levelname)s] [%(name)s] %(message)s'))
-
-    # 4. Define only the loggers you want active
-    allowed_loggers = {
-        "scrapy.crawler": logging.INFO,
-        "scrapy.statscollectors": logging.INFO,
-        "basic": logging.INFO,
-    }
-
-    for name in logging.root.manager.loggerDict.keys():
-        logger = logging.getLogger(name)
-        if name in allowed_loggers:
-            logger.handlers = [handler]
-            logger.setLevel(allowed_loggers[name])
-            logger.propagate = False
-        else:
-            logger.handlers = []
-            logger.setLevel(logging.CRITICAL + 1)
-            logger.propagate = False
-
-    # 5. Load Scrapy project settings
-    settings = Settings()
-    for key in dir(project_settings):
-        if key.isupper():
-            settings.set(key, getattr(project_settings, key))
-
-    # ASCII flair
-    print(r"""
-                  :                        ___
-                  :                       -   ---___- ,,
-       ,,         :         ,,               (' ||    ||
-       ::         :         ::              ((  ||    ||/\\  _-_
-,,     ::         :         ::     ,,      ((   ||    || || || \\
-::     ::         :         ::     ::       (( //     || || ||/
- '::.   '::.      :      .::'   .::'          -____-  \\ |/ \\,/
-    '::.  '::.  _/~\_  .::'  .::'       -_-/            |\
-      '::.  :::/     \:::  .::'        (_ /          '   \\
-        ':::::(       ):::::'         (_ --_  -_-_  \\  / \\  _-_  ,._-_
-               \ ___ /                  --_ ) || \\ || || || || \\  ||
-         .:::::/`   `\:::::.           _/  )) || || || || || ||/    ||
-       .::'   .:\o o/:.   '::.        (_-_-   ||-'  \\  \\/  \\,/   \\,
-     .::'   .::  :":  ::.   '::.              |/
-   .::'    ::'   ' '   '::    '::.      -_-/  '                 ,,
-  ::      ::             ::      ::    (_ /                 _   ||
-  ^^      ::             ::      ^^   (_ --_  -_-_   _-_   ( \, ||/\  _-_,
-          ::             ::             --_ ) || \\ || \\  /-|| ||_( ||_.
-          ^^             ^^            _/  )) || || ||/   (( || || |  ~ ||
-                                      (_-_-   ||-'  \\,/   \/\\ \\,\ ,-_-
-                                              |/
-                                              '
-    """)
-    print("[*] Spider is crawling")
-    time.sleep(2)
-
-    process = CrawlerProcess(settings)
-    process.crawl(
-        BasicSpider,
-        url=args.url,
-        filter=args.filter_url,
-        pattern=args.pattern,
-        download=args.download,
-        max_pages=args.max_pages,
-        export=args.export,
-        content=args.content,
-    )
-    process.start()
-
-if __name__ == "__main__":
-    main()
+# run.py
+
+import os
+import argparse
+import json
+import logging
+import time
+import sys
+import subprocess
+from urllib.parse import urlparse
+from scrapy.utils.log import configure_logging
+from scrapy.crawler import CrawlerProcess
+from scrapy.settings import Settings
+from spidercore.spiders.basic import BasicSpider, create_exporter, output_dir_for
+from spidercore.distributed import TOKEN_ENV, Coordinator, SqliteFrontier, merge_pages, parse_address, reset_finished
+from spidercore.batch import BatchRun, read_seeds
+from spidercore.daemon import CrawlService
+from spidercore import settings as project_settings
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the basic sitemap spider.")
+    start = parser.add_mutually_exclusive_group(required=True)
+    start.add_argument("--url", help="Start URL for the crawl")
+    start.add_argument("--seeds", help="File with one start URL per line; crawls all sites in one process")
+    start.add_argument("--serve", metavar="ADDRESS", help="Keep running and accept crawl jobs over HTTP on HOST:PORT or unix:PATH")
+    parser.add_argument("--max-jobs", type=int, default=4, help="With --serve, number of jobs crawled at the same time")
+    parser.add_argument("--max-sites", type=int, default=8, help="With --seeds, number of sites crawled at the same time")
+    parser.add_argument("--concurrency", type=int, help="With --seeds, cap on concurrent requests across all sites")
+    parser.add_argument("--summary", default="batch-summary.json", help="With --seeds, where to write the per-site summary")
+    parser.add_argument("--filter-url", help="Only keep URLs matching this substring")
+    parser.add_argument("--pattern", help="Regex pattern to match URLs")
+    parser.add_argument("--follow", action="append", help="Regex for hub pages to fetch for their links even if they are not kept (repeatable)")
+    parser.add_argument("--exclude", action="append", help="Regex for URLs never kept in the sitemap (repeatable)")
+    parser.add_argument("--no-follow", action="append", help="Regex for URLs never fetched (repeatable)")
+    parser.add_argument("--strict-follow", action="store_true", help="Only fetch pages matching --filter-url/--pattern or hub pages leading to them")
+    parser.add_argument("--download", action="store_true", help="Download matching assets (PDF, ZIP, etc)")
+    parser.add_argument("--max-asset-size", type=int, help="Skip downloaded assets larger than this many MB")
+    parser.add_argument("--asset-types", help="Comma-separated file extensions downloaded as assets (default: pdf,zip,docx,xlsx,pptx)")
+    parser.add_argument("--asset-concurrency", type=int, help="Asset requests downloading at the same time, next to the pages")
+    parser.add_argument("--asset-bandwidth", type=int, help="Cap asset downloads at this many KB/s")
+    parser.add_argument("--asset-head-check", action="store_true", help="Check the size and type of every asset with a HEAD request before downloading it")
+    parser.add_argument("--max-pages", type=int, default=250, help="Maximum number of pages to crawl")
+    parser.add_argument("--export", choices=["json", "jsonl", "csv", "xml", "html"], default="html", help="Export format")
+    parser.add_argument("--store", nargs="+", choices=["sqlite", "parquet"], default=[], help="Also store the page records in pages.sqlite3 and/or pages.parquet")
+    parser.add_argument("--content", action="store_true", help="Also extract page titles for context")
+    parser.add_argument("--rich-content", action="store_true", help="Also extract description, canonical URL, h1, language, word and link counts in a worker pool")
+    parser.add_argument("--content-workers", type=int, help="Processes parsing pages for --rich-content (default: one per CPU)")
+    parser.add_argument("--parser", choices=["lxml", "htmlparser", "selectors"], default="lxml", help="Link extraction backend")
+    parser.add_argument("--html-split", type=int, help="Links per HTML sitemap file before sections are split into linked files (0 = one file)")
+    parser.add_argument("--gzip", action="store_true", help="Gzip-compress json, jsonl, csv and xml exports")
+    parser.add_argument("--check-links", action="store_true", help="Check every link and asset URL found, external ones included, and report the broken ones")
+    parser.add_argument("--near-duplicates", action="store_true", help="Mark near-duplicate pages, skip their links and stop following URL patterns that keep producing them")
+    parser.add_argument("--link-graph", action="store_true", help="Keep the page link graph, write it with click depth, in-degree and PageRank per page, and base XML sitemap priorities on it")
+    parser.add_argument("--discover", action="store_true", help="Also seed the crawl from robots.txt sitemaps and report pages missing from them or from the links")
+    parser.add_argument("--state-dir", help="Keep the frontier and visited URLs here so an interrupted crawl can resume")
+    parser.add_argument("--incremental", action="store_true", help="Recrawl with conditional GETs against the previous run and report a diff")
+    parser.add_argument("--archive", action="store_true", help="Also write every fetched response to gzipped WARC files in downloads_<domain>/archive")
+    parser.add_argument("--replay", nargs="?", const=True, metavar="DIR", help="Crawl the responses archived by --archive (or in DIR) instead of the network")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="Override a setting from spidercore/settings.py (repeatable)")
+    parser.add_argument("--metrics-port", type=int, help="Serve live metrics in Prometheus format on this local port")
+    parser.add_argument("--profile", action="store_true", help="Profile callbacks, middlewares, pipelines and exporters and write the results to downloads_<domain>/profile")
+    parser.add_argument("--stats-file", help="Write the crawl stats to this JSON file when the crawl ends")
+    parser.add_argument("--workers", type=int, help="Crawl --url with this many worker processes sharing one frontier")
+    parser.add_argument("--worker", help="Run as worker INDEX/COUNT of a distributed crawl (started by --workers, or by hand)")
+    parser.add_argument("--frontier", help="Shared frontier: a SQLite file (default downloads_<domain>/frontier.sqlite3) or tcp://HOST:PORT")
+    parser.add_argument("--coordinator", help="Serve the frontier to --workers workers on other machines at [HOST]:PORT (default host 127.0.0.1), then merge their results")
+    return parser
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    distributed = args.workers or args.worker or args.coordinator
+    if distributed and (args.seeds or args.state_dir or args.incremental):
+        parser.error("--workers, --worker and --coordinator cannot be combined with --seeds, --state-dir or --incremental")
+    if args.coordinator and not args.workers:
+        parser.error("--coordinator needs --workers")
+    if args.worker and not args.frontier:
+        parser.error("--worker needs --frontier")
+    if args.serve and (distributed or args.state_dir):
+        parser.error("--serve cannot be combined with --workers, --worker, --coordinator or --state-dir")
+    if args.replay and (args.archive or args.download):
+        parser.error("--replay cannot be combined with --archive or --download")
+
+    # 1. Disable Scrapy's default root handler
+    configure_logging(install_root_handler=False)
+
+    # 2. Remove any existing root handlers
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    # 3. Define the custom formatter and handler
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('[%(levelname)s] [%(name)s] %(message)s'))
+
+    # 4. Define only the loggers you want active
+    allowed_loggers = {
+        "scrapy.crawler": logging.INFO,
+        "scrapy.statscollectors": logging.INFO,
+        "basic": logging.INFO,
+        "spidercore.batch": logging.INFO,
+        "spidercore.distributed": logging.INFO,
+        "spidercore.metrics": logging.INFO,
+        "spidercore.profiling": logging.INFO,
+        "spidercore.pipelines": logging.INFO,
+        "spidercore.daemon": logging.INFO,
+    }
+
+    # Allowed loggers of modules Scrapy imports later are configured up front
+    for name in set(logging.root.manager.loggerDict) | set(allowed_loggers):
+        logger = logging.getLogger(name)
+        if name in allowed_loggers:
+            logger.handlers = [handler]
+            logger.setLevel(allowed_loggers[name])
+            logger.propagate = False
+        else:
+            logger.handlers = []
+            logger.setLevel(logging.CRITICAL + 1)
+            logger.propagate = False
+
+    settings = build_settings(args)
+
+    # ASCII flair, once per run rather than once per worker
+    if not args.worker:
+        print_banner()
+        if args.serve:
+            serve(args, settings)
+            return
+        print("[*] Spider is crawling")
+        time.sleep(2)
+
+    spider_kwargs = spider_kwargs_for(args)
+
+    if args.workers and not args.worker:
+        run_distributed(args)
+        return
+
+    process = CrawlerProcess(settings)
+    if not args.seeds:
+        crawler = process.create_crawler(BasicSpider)
+        process.crawl(crawler, url=args.url, worker=args.worker, frontier=args.frontier, **spider_kwargs)
+        process.start()
+        if args.stats_file:
+            with open(args.stats_file, "w", encoding="utf-8") as f:
+                json.dump(crawler.stats.get_stats(), f, indent=2, default=str)
+        return
+
+    seeds = read_seeds(args.seeds)
+    print(f"[*] Crawling {len(seeds)} sites, {args.max_sites} at a time")
+    batch = BatchRun(process, seeds, spider_kwargs, max_sites=args.max_sites, state_dir=args.state_dir)
+
+    def finished(_):
+        from twisted.internet import reactor
+        batch.write_summary(args.summary)
+        reactor.stop()
+
+    batch.start().addBoth(finished)
+    process.start(stop_after_crawl=False)
+
+def build_settings(args):
+    # 5. Load Scrapy project settings
+    settings = Settings()
+    for key in dir(project_settings):
+        if key.isupper():
+            settings.set(key, getattr(project_settings, key))
+    for override in args.set:
+        name, _, value = override.partition("=")
+        settings.set(name.strip(), value)
+    if args.store:
+        settings.set("PAGE_STORES", args.store)
+    if args.content_workers:
+        settings.set("CONTENT_WORKERS", args.content_workers)
+    if args.metrics_port:
+        settings.set("METRICS_PORT", args.metrics_port)
+    if args.profile:
+        settings.set("PROFILE_ENABLED", True)
+    if args.max_asset_size is not None:
+        settings.set("ASSET_MAX_SIZE", args.max_asset_size * 1024 * 1024)
+    if args.asset_types:
+        settings.set("ASSET_EXTENSIONS", args.asset_types)
+    if args.asset_concurrency:
+        settings.set("ASSET_CONCURRENCY", args.asset_concurrency)
+    if args.asset_bandwidth:
+        settings.set("ASSET_BANDWIDTH", args.asset_bandwidth * 1024)
+    if args.asset_head_check:
+        settings.set("ASSET_HEAD_CHECK", True)
+    if args.state_dir:
+        settings.set("SCHEDULER", "spidercore.state.SqliteScheduler")
+    if args.worker:
+        settings.set("SCHEDULER", "spidercore.distributed.SharedScheduler")
+    if args.replay:
+        # Responses come from local files, nothing to be polite to
+        settings.set("DOWNLOAD_DELAY", 0)
+        settings.set("ADAPTIVE_CONCURRENCY_ENABLED", False)
+        settings.set("CONCURRENT_REQUESTS_PER_DOMAIN", settings.getint("CONCURRENT_REQUESTS"))
+    if args.seeds and args.concurrency:
+        # BatchRun shares it out between the sites running at once
+        settings.set("CONCURRENT_REQUESTS", args.concurrency)
+    return settings
+
+def print_banner():
+    print(r"""
+                  :                        ___
+                  :                       -   ---___- ,,
+       ,,         :         ,,               (' ||    ||
+       ::         :         ::              ((  ||    ||/\\  _-_
+,,     ::         :         ::     ,,      ((   ||    || || || \\
+::     ::         :         ::     ::       (( //     || || ||/
+ '::.   '::.      :      .::'   .::'          -____-  \\ |/ \\,/
+    '::.  '::.  _/~\_  .::'  .::'       -_-/            |\
+      '::.  :::/     \:::  .::'        (_ /          '   \\
+        ':::::(       ):::::'         (_ --_  -_-_  \\  / \\  _-_  ,._-_
+               \ ___ /                  --_ ) || \\ || || || || \\  ||
+         .:::::/`   `\:::::.           _/  )) || || || || || ||/    ||
+       .::'   .:\o o/:.   '::.        (_-_-   ||-'  \\  \\/  \\,/   \\,
+     .::'   .::  :":  ::.   '::.              |/
+   .::'    ::'   ' '   '::    '::.      -_-/  '                 ,,
+  ::      ::             ::      ::    (_ /                 _   ||
+  ^^      ::             ::      ^^   (_ --_  -_-_   _-_   ( \, ||/\  _-_,
+          ::             ::             --_ ) || \\ || \\  /-|| ||_( ||_.
+          ^^             ^^            _/  )) || || ||/   (( || || |  ~ ||
+                                      (_-_-   ||-'  \\,/   \/\\ \\,\ ,-_-
+                                              |/
+                                              '
+        """)
+
+def spider_kwargs_for(args):
+    return dict(
+        filter=args.filter_url,
+        pattern=args.pattern,
+        follow=args.follow,
+        exclude=args.exclude,
+        no_follow=args.no_follow,
+        strict_follow=args.strict_follow,
+        download=args.download,
+        max_pages=args.max_pages,
+        export=args.export,
+        content=args.content,
+        parser=args.parser,
+        gzip=args.gzip,
+        html_split=args.html_split,
+        discover=args.discover,
+        rich_content=args.rich_content,
+        check_links=args.check_links,
+        near_duplicates=args.near_duplicates,
+        state_dir=args.state_dir,
+        incremental=args.incremental,
+        archive=args.archive,
+        replay=args.replay,
+        link_graph=args.link_graph,
+    )
+
+def serve(args, settings):
+    # One warm reactor for every job. It has to be the configured one
+    # before anything imports twisted.internet.reactor.
+    from scrapy.utils.reactor import install_reactor
+    install_reactor(settings["TWISTED_REACTOR"], settings["ASYNCIO_EVENT_LOOP"])
+    from twisted.internet import reactor
+
+    process = CrawlerProcess(settings)
+    service = CrawlService(process, lambda options: prepare_job(options, args.set), max_jobs=args.max_jobs)
+    service.listen(args.serve)
+    print(f"[*] Serving crawl jobs on {args.serve}, {args.max_jobs} at a time")
+    process.start(stop_after_crawl=False)
+
+def job_argv(parser, options):
+    # {"url": ..., "max_pages": 50, "store": ["sqlite"], "content": true}
+    # -> the equivalent run.py command line
+    actions = {action.dest: action for action in parser._actions}
+    argv = []
+    for name, value in options.items():
+        action = actions.get(name.replace("-", "_"))
+        if action is None or not action.option_strings:
+            raise ValueError(f"Unknown crawl option: {name}")
+        flag = action.option_strings[0]
+        if value is True:
+            argv.append(flag)
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, list):
+            if action.nargs in ("+", "*"):
+                argv += [flag, *map(str, value)]
+            else:
+                for item in value:
+                    argv += [flag, str(item)]
+        else:
+            argv += [flag, str(value)]
+    return argv
+
+def prepare_job(options, overrides=()):
+    # A --serve job: the same options as a single-site command line, given
+    # as {"argv": [...]} or as {"option": value, ...}
+    parser = build_parser()
+    argv = options["argv"] if "argv" in options else job_argv(parser, options)
+    try:
+        args = parser.parse_args([str(arg) for arg in argv])
+    except SystemExit:
+        raise ValueError(f"Invalid crawl options: {' '.join(map(str, argv))}")
+    if not args.url or args.workers or args.worker or args.coordinator or args.state_dir:
+        raise ValueError("Jobs crawl one --url in the daemon process, without --workers, --worker, --coordinator or --state-dir")
+    args.set = list(overrides) + args.set
+    return args.url, build_settings(args), spider_kwargs_for(args), args.stats_file
+
+def run_distributed(args):
+    # Either start --workers local worker processes on a SQLite frontier,
+    # or serve the frontier to remote workers with --coordinator. Both
+    # merge the workers' records into the usual sitemap_* export at the end.
+    url = args.url if "://" in args.url else "https://" + args.url
+    location = args.frontier or str(output_dir_for(urlparse(url).netloc) / "frontier.sqlite3")
+    if location.startswith("tcp://"):
+        raise SystemExit("[!] --frontier for --workers and --coordinator must be a SQLite file")
+    location = location.removeprefix("sqlite://")
+    reset_finished(location)
+
+    if args.coordinator:
+        token = os.environ.get(TOKEN_ENV)
+        server = Coordinator(parse_address(args.coordinator), location, args.workers, token)
+        host, port = server.server_address[:2]
+        print(f"[*] Coordinator listening on {host}:{port} for {args.workers} workers")
+        if not token:
+            print(f"[*] Start the workers with {TOKEN_ENV}={server.token}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            server.frontier.close()
+    else:
+        # Same command line minus --workers, plus each worker's slot
+        argv = []
+        skip = False
+        for arg in sys.argv[1:]:
+            if skip:
+                skip = False
+            elif arg == "--workers":
+                skip = True
+            elif not arg.startswith("--workers="):
+                argv.append(arg)
+        print(f"[*] Starting {args.workers} workers on {location}")
+        workers = [
+            subprocess.Popen([sys.executable, sys.argv[0], *argv, "--worker", f"{i}/{args.workers}", "--frontier", location])
+            for i in range(args.workers)
+        ]
+        failed = [i for i, worker in enumerate(workers) if worker.wait() != 0]
+        if failed:
+            print(f"[!] Workers {', '.join(map(str, failed))} exited with an error")
+
+    frontier = SqliteFrontier(location)
+    exporter = create_exporter(
+        url, args.export, logging.getLogger("spidercore.distributed"), args.gzip, args.content, args.html_split,
+        args.rich_content, args.near_duplicates,
+    )
+    if exporter:
+        merge_pages(frontier, exporter)
+    print(f"[✓] Distributed crawl complete: {frontier.visited_count()} pages")
+    frontier.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,3 @@
-# nanositemap/__init__.py
-
+# nanositemap/__init__.py
+
 # Empty init file to mark this directory as a package.
\ No newline at end of file
@@ -0,0 +1,212 @@
+# spidercore/archive.py
+
+import json
+import time
+import uuid
+import zlib
+import base64
+import hashlib
+from http import HTTPStatus
+from pathlib import Path
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+
+# A new WARC file is started once the current one grows past this size
+ARCHIVE_MAX_SIZE = 1024 * 1024 * 1024
+ARCHIVE_COMPRESS_LEVEL = 6
+
+# Framing headers that no longer describe the body as Scrapy hands it over
+HOP_HEADERS = (b"Transfer-Encoding", b"Content-Length")
+
+
+def warc_date(timestamp=None):
+    moment = datetime.fromtimestamp(timestamp or time.time(), timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def block_digest(block):
+    return "sha1:" + base64.b32encode(hashlib.sha1(block).digest()).decode("ascii")
+
+
+def header_lines(headers):
+    lines = []
+    for name, values in headers.items():
+        if name in HOP_HEADERS:
+            continue
+        for value in values:
+            lines.append(name + b": " + value)
+    return lines
+
+
+def http_request_block(request):
+    parts = urlsplit(request.url)
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    lines = [f"{request.method} {target} HTTP/1.1".encode("latin-1"), b"Host: " + parts.netloc.encode("latin-1")]
+    lines += header_lines(request.headers)
+    if request.body:
+        lines.append(f"Content-Length: {len(request.body)}".encode("ascii"))
+    return b"\r\n".join(lines) + b"\r\n\r\n" + request.body
+
+
+def http_response_block(response):
+    try:
+        reason = HTTPStatus(response.status).phrase
+    except ValueError:
+        reason = ""
+    protocol = response.protocol or "HTTP/1.1"
+    lines = [f"{protocol} {response.status} {reason}".rstrip().encode("latin-1")]
+    lines += header_lines(response.headers)
+    lines.append(f"Content-Length: {len(response.body)}".encode("ascii"))
+    return b"\r\n".join(lines) + b"\r\n\r\n" + response.body
+
+
+def warc_record(record_type, url, block, record_id, content_type, extra=()):
+    headers = [
+        ("WARC-Type", record_type),
+        ("WARC-Record-ID", record_id),
+        ("WARC-Date", warc_date()),
+    ]
+    if url:
+        headers.append(("WARC-Target-URI", url))
+    headers += list(extra)
+    headers += [
+        ("Content-Type", content_type),
+        ("WARC-Block-Digest", block_digest(block)),
+        ("Content-Length", str(len(block))),
+    ]
+    head = "WARC/1.1\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers) + "\r\n"
+    return head.encode("utf-8") + block + b"\r\n\r\n"
+
+
+def new_record_id():
+    return f"<urn:uuid:{uuid.uuid4()}>"
+
+
+class WarcWriter:
+    # Appends every fetched request/response pair to gzipped WARC files,
+    # one gzip member per record so any record can be read on its own.
+    # An index of JSON lines (method, url, status, file, offset, length)
+    # is written next to them for ArchiveReader.
+    def __init__(self, directory, name="crawl", max_size=ARCHIVE_MAX_SIZE, level=ARCHIVE_COMPRESS_LEVEL):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix = f"{name}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}"
+        self.max_size = max_size
+        self.level = level
+        self.index = open(self.directory / f"{self.prefix}.index.jsonl", "w", encoding="utf-8")
+        self.file = None
+        self.file_number = 0
+        self.records = 0
+
+    def open_file(self):
+        if self.file:
+            self.file.close()
+        self.path = self.directory / f"{self.prefix}-{self.file_number:05d}.warc.gz"
+        self.file_number += 1
+        self.file = open(self.path, "wb")
+        info = f"software: spidercore\r\nformat: WARC File Format 1.1\r\n".encode("utf-8")
+        self.append(warc_record("warcinfo", None, info, new_record_id(), "application/warc-fields"))
+
+    def append(self, record):
+        # Offset and length of the record's gzip member
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        data = compressor.compress(record) + compressor.flush()
+        offset = self.file.tell()
+        self.file.write(data)
+        return offset, len(data)
+
+    def write(self, request, response):
+        if self.file is None or self.file.tell() >= self.max_size:
+            self.open_file()
+        response_id = new_record_id()
+        offset, length = self.append(warc_record(
+            "response", response.url, http_response_block(response), response_id,
+            "application/http; msgtype=response",
+        ))
+        self.append(warc_record(
+            "request", request.url, http_request_block(request), new_record_id(),
+            "application/http; msgtype=request", [("WARC-Concurrent-To", response_id)],
+        ))
+        entry = {
+            "method": request.method,
+            "url": response.url,
+            "status": response.status,
+            "file": self.path.name,
+            "offset": offset,
+            "length": length,
+        }
+        self.index.write(json.dumps(entry) + "\n")
+        self.records += 1
+
+    def close(self):
+        if self.file:
+            self.file.close()
+        self.index.close()
+
+
+class ArchiveReader:
+    # Serves archived responses by (method, URL) from every index in the
+    # archive directory; where a URL was archived more than once, the
+    # latest copy wins.
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.entries = {}
+        self.files = {}
+        for index in sorted(self.directory.glob("*.index.jsonl")):
+            with open(index, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A crawl killed mid-write leaves a partial last line
+                        continue
+                    self.entries[(entry["method"], entry["url"])] = (entry["file"], entry["offset"], entry["length"])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, request):
+        return (request.method, request.url) in self.entries
+
+    def read(self, file_name, offset, length):
+        f = self.files.get(file_name)
+        if f is None:
+            f = self.files[file_name] = open(self.directory / file_name, "rb")
+        f.seek(offset)
+        return zlib.decompress(f.read(length), 31)
+
+    def response_for(self, request):
+        location = self.entries.get((request.method, request.url))
+        if location is None:
+            return None
+        record = self.read(*location)
+        warc_head, _, rest = record.partition(b"\r\n\r\n")
+        warc_headers = dict(
+            line.split(b": ", 1) for line in warc_head.split(b"\r\n")[1:] if b": " in line
+        )
+        block = rest[:int(warc_headers[b"Content-Length"])]
+        http_head, _, body = block.partition(b"\r\n\r\n")
+        status_line, *lines = http_head.split(b"\r\n")
+        protocol, status = status_line.split(b" ", 2)[:2]
+        headers = Headers()
+        for line in lines:
+            name, _, value = line.partition(b":")
+            headers.appendlist(name.strip(), value.strip())
+        cls = responsetypes.from_args(headers=headers, url=request.url, body=body)
+        return cls(
+            url=request.url,
+            status=int(status),
+            headers=headers,
+            body=body,
+            request=request,
+            flags=["archived"],
+            protocol=protocol.decode("latin-1"),
+        )
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
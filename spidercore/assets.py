@@ -0,0 +1,295 @@
+# spidercore/assets.py
+
+import os
+import re
+import json
+import base64
+import hashlib
+import logging
+from collections import deque
+from fnmatch import fnmatchcase
+from pathlib import Path
+from urllib.parse import urlparse
+
+ASSET_CHUNK_SIZE = 8 * 1024 * 1024
+ASSET_MAX_SIZE = 512 * 1024 * 1024
+# Content types downloaded (shell-style patterns, empty = any) and skipped
+ASSET_MIME_TYPES = []
+ASSET_SKIP_MIME_TYPES = ["text/html", "application/xhtml+xml"]
+# Check the headers of every new asset on a HEAD request first
+ASSET_HEAD_CHECK = False
+
+# Asset lane: assets share one download slot, ASSET_SLOT, with its own
+# concurrency, delay and bandwidth cap (bytes/s, 0 = none), and are
+# scheduled at ASSET_PRIORITY; LinkScorer keeps page links above it
+ASSET_SLOT = "assets"
+ASSET_CONCURRENCY = 2
+ASSET_DELAY = 0.0
+ASSET_BANDWIDTH = 0
+ASSET_PRIORITY = -100
+
+CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+def parse_content_range(value):
+    # "bytes 0-1023/4096" -> (0, 1023, 4096); total is None when unknown
+    match = CONTENT_RANGE_RE.match(value or "")
+    if not match:
+        return None
+    start, end, total = match.groups()
+    return int(start), int(end), None if total == "*" else int(total)
+
+
+def content_type_matches(content_type, patterns):
+    return any(fnmatchcase(content_type, p.lower()) for p in patterns)
+
+
+def advertised_sha256(headers):
+    # sha-256 from a Digest / Repr-Digest response header, as hex
+    for name in ("Repr-Digest", "Digest"):
+        value = headers.get(name)
+        if not value:
+            continue
+        value = value.decode("latin-1")
+        match = re.search(r"sha-256=:?([A-Za-z0-9+/=]+):?", value, re.IGNORECASE)
+        if match:
+            try:
+                return base64.b64decode(match.group(1)).hex()
+            except ValueError:
+                return None
+    return None
+
+
+class AssetStore:
+    # Content-addressed asset storage. Downloads are fetched in Range
+    # chunks that are appended to a part file while a running SHA-256 is
+    # updated, so no asset is ever held in memory as a whole. A server that
+    # ignores Range sends the whole file at once; it is streamed to the part
+    # file as it arrives instead (start_stream/write_stream). Finished files
+    # are stored as <root>/<hash[:2]>/<hash><ext> and every URL is recorded
+    # in an append-only JSON Lines manifest (url -> sha256, size, path).
+    def __init__(
+        self,
+        root,
+        manifest_path,
+        max_size=ASSET_MAX_SIZE,
+        chunk_size=ASSET_CHUNK_SIZE,
+        mime_types=ASSET_MIME_TYPES,
+        skip_mime_types=ASSET_SKIP_MIME_TYPES,
+        logger=None,
+    ):
+        self.root = Path(root)
+        self.partial_dir = self.root / ".partial"
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = Path(manifest_path)
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.mime_types = [p for p in mime_types if p]
+        self.skip_mime_types = [p for p in skip_mime_types if p]
+        self.logger = logger or logging.getLogger(__name__)
+        self.hashers = {}
+        self.streams = {}
+        self.manifest = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.manifest[record["url"]] = record
+        self.manifest_file = open(self.manifest_path, "a", encoding="utf-8")
+
+    def close(self):
+        for stream in self.streams.values():
+            stream.close()
+        self.streams.clear()
+        if not self.manifest_file.closed:
+            self.manifest_file.close()
+
+    def part_path(self, url):
+        return self.partial_dir / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.part"
+
+    def resume_offset(self, url):
+        # Bytes already on disk from an interrupted download of this URL
+        part = self.part_path(url)
+        return part.stat().st_size if part.exists() else 0
+
+    def validator(self, url):
+        meta = self.part_path(url).with_suffix(".json")
+        if not meta.exists():
+            return None
+        return json.loads(meta.read_text(encoding="utf-8")).get("validator")
+
+    def content_path(self, digest, url):
+        ext = os.path.splitext(urlparse(url).path)[1].lower()
+        return self.root / digest[:2] / f"{digest}{ext}"
+
+    def check_headers(self, url, headers, known_hashes, check_type=True):
+        # Reasons to stop a download before its body is transferred
+        content_range = parse_content_range((headers.get("Content-Range") or b"").decode("latin-1"))
+        length = headers.get("Content-Length")
+        total = content_range[2] if content_range else (int(length) if length else None)
+        if total is not None and self.max_size and total > self.max_size:
+            return f"size {total} exceeds limit {self.max_size}"
+
+        content_type = (headers.get("Content-Type") or b"").decode("latin-1").partition(";")[0].strip().lower()
+        if check_type and content_type and (
+            content_type_matches(content_type, self.skip_mime_types)
+            or (self.mime_types and not content_type_matches(content_type, self.mime_types))
+        ):
+            return f"content type {content_type}"
+
+        digest = advertised_sha256(headers)
+        if digest and digest in known_hashes:
+            return f"known hash {digest}"
+
+        previous = self.manifest.get(url)
+        etag = (headers.get("ETag") or b"").decode("latin-1")
+        if (previous and etag and previous.get("etag") == etag and previous.get("size") == total
+                and Path(previous["path"]).exists()):
+            return f"unchanged since last download ({etag})"
+        return None
+
+    def discard(self, url):
+        self.end_stream(url)
+        self.hashers.pop(url, None)
+        part = self.part_path(url)
+        part.unlink(missing_ok=True)
+        part.with_suffix(".json").unlink(missing_ok=True)
+
+    def hasher(self, url, offset):
+        # Running hash for this download, rebuilt from the part file when
+        # resuming after a restart
+        hasher = self.hashers.get(url)
+        if hasher is None or offset == 0:
+            hasher = hashlib.sha256()
+            if offset:
+                with open(self.part_path(url), "rb") as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b""):
+                        hasher.update(block)
+            self.hashers[url] = hasher
+        return hasher
+
+    def write_meta(self, url, headers):
+        validator = headers.get("ETag") or headers.get("Last-Modified")
+        meta = {"url": url, "validator": validator.decode("latin-1") if validator else None}
+        self.part_path(url).with_suffix(".json").write_text(json.dumps(meta), encoding="utf-8")
+
+    def start_stream(self, url, headers):
+        # The response is the whole file, not a range: start the part file
+        # over and append the body to it as it arrives
+        self.discard(url)
+        self.write_meta(url, headers)
+        self.hashers[url] = hashlib.sha256()
+        self.streams[url] = open(self.part_path(url), "wb")
+
+    def write_stream(self, url, data):
+        # Returns a reason to stop the download, or None
+        stream = self.streams.get(url)
+        if stream is None:
+            return None
+        stream.write(data)
+        self.hashers[url].update(data)
+        received = stream.tell()
+        if self.max_size and received > self.max_size:
+            return f"size {received} exceeds limit {self.max_size}"
+        return None
+
+    def end_stream(self, url):
+        stream = self.streams.pop(url, None)
+        if stream is not None:
+            stream.close()
+
+    def write_chunk(self, response, offset):
+        # Append one response body to the part file. Returns the offset of
+        # the next chunk to request, or None once the download is complete.
+        url = response.meta.get("asset_url", response.url)
+        content_range = None
+        if response.status == 206:
+            content_range = parse_content_range(response.headers.get("Content-Range", b"").decode("latin-1"))
+        if content_range is None or content_range[0] != offset or offset > self.resume_offset(url):
+            # Full body, or a range we did not ask for: start over
+            self.discard(url)
+            offset = 0
+            if content_range is not None and content_range[0] != 0:
+                return 0
+
+        part = self.part_path(url)
+        if offset == 0:
+            self.write_meta(url, response.headers)
+
+        hasher = self.hasher(url, offset)
+        with open(part, "r+b" if offset else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            f.write(response.body)
+        hasher.update(response.body)
+
+        received = offset + len(response.body)
+        if self.max_size and received > self.max_size:
+            self.discard(url)
+            raise ValueError(f"size {received} exceeds limit {self.max_size}")
+        if content_range is None:
+            return None
+        total = content_range[2]
+        if (total is None and len(response.body) < self.chunk_size) or (total is not None and received >= total):
+            return None
+        return received
+
+    def finish(self, response, known_hashes):
+        # Move a complete part file to its content-addressed path and record
+        # it in the manifest. Returns (digest, path, duplicate).
+        url = response.meta.get("asset_url", response.url)
+        part = self.part_path(url)
+        digest = self.hasher(url, self.resume_offset(url)).hexdigest()
+        size = part.stat().st_size
+        path = self.content_path(digest, url)
+        duplicate = digest in known_hashes or path.exists()
+        if duplicate:
+            part.unlink()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            part.replace(path)
+        self.discard(url)
+
+        etag = response.headers.get("ETag")
+        record = {
+            "url": url,
+            "sha256": digest,
+            "size": size,
+            "path": str(path),
+            "etag": etag.decode("latin-1") if etag else None,
+        }
+        self.manifest[url] = record
+        self.manifest_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.manifest_file.flush()
+        return digest, path, duplicate
+
+
+class AssetLane:
+    # Holds asset requests back in the scheduler while `concurrency` of
+    # them are already in the downloader, so a backlog of downloads never
+    # takes the CONCURRENT_REQUESTS that pages need. Requests held here
+    # are the first to go once the lane has room.
+    def __init__(self, crawler, concurrency=ASSET_CONCURRENCY):
+        self.crawler = crawler
+        self.concurrency = max(1, concurrency)
+        self.held = deque()
+
+    def has_room(self):
+        active = self.crawler.engine.downloader.active
+        return sum(1 for request in active if "asset_url" in request.meta) < self.concurrency
+
+    def hold(self, request):
+        # True when the request was set aside until the lane has room
+        if "asset_url" in request.meta and not self.has_room():
+            self.held.append(request)
+            return True
+        return False
+
+    def release(self):
+        if self.held and self.has_room():
+            return self.held.popleft()
+        return None
+
+    def __len__(self):
+        return len(self.held)
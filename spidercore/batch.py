@@ -0,0 +1,113 @@
+# spidercore/batch.py
+
+import json
+import time
+import logging
+from pathlib import Path
+from urllib.parse import urlparse
+from scrapy import signals
+from twisted.internet import defer
+from spidercore.spiders.basic import BasicSpider, site_slug
+
+logger = logging.getLogger(__name__)
+
+
+def read_seeds(path):
+    # One start URL per line; blank lines and "#" comments are ignored.
+    # Only the first seed of each domain is kept since every domain has a
+    # single output directory.
+    seeds = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            url = line.split("#", 1)[0].strip()
+            if not url:
+                continue
+            if not urlparse(url).scheme:
+                url = "https://" + url
+            domain = urlparse(url).netloc
+            if domain in seeds:
+                logger.warning(f"[!] Skipping duplicate seed for {domain}: {url}")
+                continue
+            seeds[domain] = url
+    return list(seeds.values())
+
+
+class BatchRun:
+    # Runs one BasicSpider per seed inside a single CrawlerProcess, so the
+    # reactor, settings, DNS cache and robots.txt cache are shared. At most
+    # max_sites crawls run at once; the next seed starts as soon as one
+    # finishes. Each site still writes to its own downloads_<domain> dir.
+    #
+    # `concurrency` requests at most are in flight across all sites: every
+    # running site gets an equal share of it as its downloader's cap, handed
+    # out again whenever a site starts or finishes, so the last sites of a
+    # batch get the whole budget.
+    def __init__(self, process, seeds, spider_kwargs, max_sites=8, state_dir=None, concurrency=None):
+        self.process = process
+        self.seeds = seeds
+        self.spider_kwargs = spider_kwargs
+        self.state_dir = Path(state_dir) if state_dir else None
+        self.semaphore = defer.DeferredSemaphore(max(1, max_sites))
+        self.concurrency = concurrency or process.settings.getint("CONCURRENT_REQUESTS")
+        self.running = []
+        self.results = []
+
+    def start(self):
+        # Fires once every site has finished, whether it succeeded or not
+        return defer.DeferredList([self.semaphore.run(self.crawl_site, url) for url in self.seeds])
+
+    def crawl_site(self, url):
+        domain = urlparse(url).netloc
+        kwargs = dict(self.spider_kwargs, url=url)
+        if self.state_dir:
+            kwargs["state_dir"] = str(self.state_dir / site_slug(domain))
+
+        crawler = self.process.create_crawler(BasicSpider)
+        self.running.append(crawler)
+        crawler.signals.connect(self.share_concurrency, signal=signals.spider_opened)
+        started = time.monotonic()
+        logger.info(f"[*] Starting {domain}")
+        d = self.process.crawl(crawler, **kwargs)
+        d.addCallback(lambda _: self.site_done(crawler, url, domain, started, None))
+        d.addErrback(lambda failure: self.site_done(crawler, url, domain, started, failure))
+        return d
+
+    def share_concurrency(self):
+        share = max(1, self.concurrency // max(1, len(self.running)))
+        for crawler in self.running:
+            if crawler.engine is not None and crawler.engine.downloader is not None:
+                crawler.engine.downloader.total_concurrency = share
+
+    def site_done(self, crawler, url, domain, started, failure):
+        self.running.remove(crawler)
+        self.share_concurrency()
+        stats = crawler.stats.get_stats() if crawler.stats else {}
+        result = {
+            "url": url,
+            "domain": domain,
+            "pages": stats.get("spidercore/pages", 0),
+            "bytes": stats.get("downloader/response_bytes", 0),
+            "duration": round(stats.get("elapsed_time_seconds", time.monotonic() - started), 2),
+            "finish_reason": stats.get("finish_reason"),
+        }
+        if failure is not None:
+            result["error"] = failure.getErrorMessage()
+            logger.warning(f"[!] {domain} failed: {result['error']}")
+        else:
+            logger.info(
+                f"[✓] Finished {domain}: {result['pages']} pages, "
+                f"{result['bytes']} bytes in {result['duration']}s"
+            )
+        self.results.append(result)
+
+    def write_summary(self, path):
+        results = sorted(self.results, key=lambda r: r["domain"])
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+        width = max([len(r["domain"]) for r in results] + [6])
+        lines = [f"{'domain':{width}}  {'pages':>7}  {'bytes':>12}  {'seconds':>8}  status"]
+        for r in results:
+            status = "error: " + r["error"] if "error" in r else r["finish_reason"]
+            lines.append(f"{r['domain']:{width}}  {r['pages']:7}  {r['bytes']:12}  {r['duration']:8.2f}  {status}")
+        logger.info("[✓] Batch summary written to: %s\n%s", path, "\n".join(lines))
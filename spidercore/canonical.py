@@ -0,0 +1,150 @@
+# spidercore/canonical.py
+
+import re
+from collections import Counter
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, unquote_plus
+from spidercore.urlstore import UrlSet
+
+# Query parameters dropped from every link (shell-style patterns, matched
+# case-insensitively). A non-empty CANONICAL_KEEP_PARAMS keeps only the
+# parameters it matches instead.
+CANONICAL_DROP_PARAMS = [
+    "utm_*", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga",
+    "sessionid", "session_id", "sid", "phpsessid", "jsessionid", "aspsessionid*",
+]
+CANONICAL_KEEP_PARAMS = []
+CANONICAL_SORT_QUERY = True
+CANONICAL_LOWERCASE_PATH = False
+CANONICAL_TRAILING_SLASH = "keep"  # keep, add or strip
+CANONICAL_CACHE_SIZE = 65536
+
+# Crawl-trap guard: at most TRAP_MAX_PER_TEMPLATE URLs per template (see
+# url_template; 0 = no cap) and no path segment more than
+# TRAP_MAX_SEGMENT_REPEATS times
+TRAP_MAX_PER_TEMPLATE = 5000
+TRAP_MAX_SEGMENT_REPEATS = 2
+
+NUMBER_RE = re.compile(r"\d+")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+TRAILING_SLASH_MODES = ("keep", "add", "strip")
+
+
+def url_template(url):
+    # Host, path with numbers generalised and the names of the query
+    # parameters: "/shop/12?color=red&sid=1" -> "host/shop/{n}?color&sid"
+    parts = urlsplit(url)
+    names = sorted({name for name, _ in parse_qsl(parts.query, keep_blank_values=True)})
+    path = NUMBER_RE.sub("{n}", parts.path or "/")
+    return f"{parts.netloc}{path}" + (f"?{'&'.join(names)}" if names else "")
+
+
+def compile_params(patterns):
+    patterns = [p.lower() for p in patterns if p]
+    if not patterns:
+        return None
+    exact = {p for p in patterns if not any(c in p for c in "*?[")}
+    wildcards = [p for p in patterns if p not in exact]
+    return lambda name: name in exact or any(fnmatchcase(name, p) for p in wildcards)
+
+
+class UrlCanonicalizer:
+    # Rewrites every link to one spelling before it is deduplicated, so
+    # tracking parameters, session IDs, parameter order, fragments, host
+    # case and default ports don't turn one page into many URLs. Results
+    # are cached, as the same navigation links show up on every page.
+    def __init__(
+        self,
+        drop_params=CANONICAL_DROP_PARAMS,
+        keep_params=CANONICAL_KEEP_PARAMS,
+        sort_query=CANONICAL_SORT_QUERY,
+        lowercase_path=CANONICAL_LOWERCASE_PATH,
+        trailing_slash=CANONICAL_TRAILING_SLASH,
+        cache_size=CANONICAL_CACHE_SIZE,
+    ):
+        if trailing_slash not in TRAILING_SLASH_MODES:
+            raise ValueError(
+                f"Unknown trailing slash mode: {trailing_slash} (choose from {', '.join(TRAILING_SLASH_MODES)})"
+            )
+        self.keep = compile_params(keep_params)
+        self.drop = None if self.keep else compile_params(drop_params)
+        self.sort_query = sort_query
+        self.lowercase_path = lowercase_path
+        self.trailing_slash = trailing_slash
+        self.canonicalize = lru_cache(maxsize=cache_size)(self.rewrite)
+
+    def keeps(self, name):
+        name = name.lower()
+        if self.keep:
+            return self.keep(name)
+        return not (self.drop and self.drop(name))
+
+    def rewrite(self, url):
+        try:
+            parts = urlsplit(url)
+            port = parts.port
+        except ValueError:
+            return url
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or "").lower()
+        if ":" in host:
+            host = f"[{host}]"
+        if port and port != DEFAULT_PORTS.get(scheme):
+            host = f"{host}:{port}"
+        if parts.username is not None:
+            credentials = parts.username + (f":{parts.password}" if parts.password is not None else "")
+            host = f"{credentials}@{host}"
+
+        path = parts.path or "/"
+        if ";" in path:
+            # Path parameters like ";jsessionid=..." follow the query rules
+            segments = path.split(";")
+            path = ";".join(segments[:1] + [s for s in segments[1:] if self.keeps(s.partition("=")[0])])
+        if self.lowercase_path:
+            path = path.lower()
+        if self.trailing_slash == "add" and not path.endswith("/") and "." not in path.rpartition("/")[2]:
+            path += "/"
+        elif self.trailing_slash == "strip" and path != "/" and path.endswith("/"):
+            path = path.rstrip("/") or "/"
+
+        query = parts.query
+        if query:
+            # Parameters stay encoded as they were, only names are decoded
+            params = [p for p in query.split("&") if p and self.keeps(unquote_plus(p.partition("=")[0]))]
+            if self.sort_query:
+                params.sort()
+            query = "&".join(params)
+        # The fragment never reaches the server
+        return urlunsplit((scheme, host, path, query, ""))
+
+
+class TrapGuard:
+    # Keeps endless URL spaces (calendars, paginations, faceted filters,
+    # relative links that nest forever) from eating the page budget.
+    # admit() returns None for a URL that may be followed, or the reason
+    # it is not. Given the spider's UrlStore, admitted URLs are kept as IDs.
+    def __init__(
+        self, max_per_template=TRAP_MAX_PER_TEMPLATE, max_segment_repeats=TRAP_MAX_SEGMENT_REPEATS, urls=None,
+    ):
+        self.max_per_template = max_per_template
+        self.max_segment_repeats = max_segment_repeats
+        self.templates = Counter()
+        self.admitted = UrlSet(urls) if urls is not None else set()
+
+    def admit(self, url):
+        if url in self.admitted:
+            return None
+        if self.max_segment_repeats:
+            segments = Counter(s for s in urlsplit(url).path.split("/") if s)
+            if segments:
+                segment, repeats = segments.most_common(1)[0]
+                if repeats > self.max_segment_repeats:
+                    return f"crawl trap: path segment '{segment}' repeated {repeats} times"
+        if self.max_per_template:
+            template = url_template(url)
+            if self.templates[template] >= self.max_per_template:
+                return f"crawl trap: over {self.max_per_template} URLs like {template}"
+            self.templates[template] += 1
+        self.admitted.add(url)
+        return None
@@ -0,0 +1,155 @@
+# spidercore/content.py
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from urllib.parse import urljoin
+from lxml import html as lxml_html
+from twisted.internet import defer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_POOL = "process"
+CONTENT_WORKERS = 0  # 0 = one per CPU, leaving one for the crawl itself
+CONTENT_BATCH_SIZE = 16
+CONTENT_FLUSH_DELAY = 0.2
+
+# Columns of --rich-content records, in export order
+CONTENT_FIELDS = [
+    "url", "title", "lastmod", "depth", "description", "canonical",
+    "h1", "language", "word_count", "link_count", "duplicate_of",
+]
+
+SKIPPED_TEXT_TAGS = ("script", "style", "noscript", "template")
+
+
+def analyze(url, body, encoding):
+    # Runs in a pool worker, so it only takes and returns plain values
+    parser = lxml_html.HTMLParser(encoding=encoding)
+    doc = lxml_html.document_fromstring(body, parser=parser)
+
+    title = doc.findtext(".//title") or ""
+    description = ""
+    language = doc.get("lang") or ""
+    for meta in doc.iter("meta"):
+        name = (meta.get("name") or "").lower()
+        if name == "description" and not description:
+            description = meta.get("content") or ""
+        elif not language and (meta.get("http-equiv") or "").lower() == "content-language":
+            language = meta.get("content") or ""
+
+    canonical = ""
+    for link in doc.iter("link"):
+        if "canonical" in (link.get("rel") or "").lower().split():
+            canonical = urljoin(url, (link.get("href") or "").strip())
+            break
+
+    h1 = next(doc.iter("h1"), None)
+    h1 = " ".join(h1.text_content().split()) if h1 is not None else ""
+
+    body_element = doc.find("body")
+    words = 0
+    if body_element is not None:
+        for element in list(body_element.iter(*SKIPPED_TEXT_TAGS)):
+            element.drop_tree()
+        words = len(body_element.text_content().split())
+
+    return {
+        "title": " ".join(title.split()),
+        "description": " ".join(description.split()),
+        "canonical": canonical,
+        "h1": h1,
+        "language": language.strip(),
+        "word_count": words,
+    }
+
+
+def analyze_batch(pages):
+    results = []
+    for url, body, encoding in pages:
+        try:
+            results.append(analyze(url, body, encoding))
+        except Exception as e:
+            results.append({"error": f"{type(e).__name__}: {e}"})
+    return results
+
+
+class ContentPool:
+    # Runs analyze() for many pages off the reactor thread. Pages are sent
+    # in batches of batch_size (or whatever arrived within flush_delay
+    # seconds) to keep the pickling overhead per page low, and each page's
+    # Deferred fires on the reactor thread with its result. Callbacks
+    # awaiting a result keep their response in Scrapy's scraper slot, so
+    # the downloader backs off on its own when the pool falls behind.
+    def __init__(
+        self,
+        kind=CONTENT_POOL,
+        workers=CONTENT_WORKERS,
+        batch_size=CONTENT_BATCH_SIZE,
+        flush_delay=CONTENT_FLUSH_DELAY,
+    ):
+        workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        if kind == "process":
+            # Forking a process that already runs reactor threads is unsafe
+            context = multiprocessing.get_context("spawn")
+            self.executor = ProcessPoolExecutor(workers, mp_context=context)
+        elif kind == "thread":
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix="content")
+        else:
+            raise ValueError(f"Unknown content pool: {kind} (choose from process, thread)")
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_delay = flush_delay
+        self.batch = []
+        self.deferreds = []
+        self.timer = None
+        self.outstanding = {}
+
+    def submit(self, url, body, encoding):
+        from twisted.internet import reactor
+
+        d = defer.Deferred()
+        self.batch.append((url, body, encoding))
+        self.deferreds.append(d)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = reactor.callLater(self.flush_delay, self.flush)
+        return d
+
+    def flush(self):
+        from twisted.internet import reactor
+
+        if self.timer is not None:
+            if self.timer.active():
+                self.timer.cancel()
+            self.timer = None
+        if not self.batch:
+            return
+        future = self.executor.submit(analyze_batch, self.batch)
+        self.outstanding[future] = self.deferreds
+        self.batch = []
+        self.deferreds = []
+        future.add_done_callback(lambda f: reactor.callFromThread(self.deliver, f))
+
+    def deliver(self, future):
+        deferreds = self.outstanding.pop(future, None)
+        if deferreds is None:
+            # Already delivered by close()
+            return
+        try:
+            results = future.result()
+        except Exception as e:
+            logger.warning(f"[!] Content extraction batch failed: {e}")
+            results = [{"error": str(e)} for _ in deferreds]
+        for d, result in zip(deferreds, results):
+            d.callback(result)
+
+    def close(self):
+        # Anything still queued is delivered before the workers stop
+        self.flush()
+        wait(list(self.outstanding))
+        for future in list(self.outstanding):
+            self.deliver(future)
+        self.executor.shutdown(wait=True)
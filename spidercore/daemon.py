@@ -0,0 +1,243 @@
+# spidercore/daemon.py
+
+import json
+import time
+import logging
+import itertools
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from twisted.internet import defer
+from scrapy.utils.defer import deferred_from_coro
+from spidercore.spiders.basic import BasicSpider
+
+logger = logging.getLogger(__name__)
+
+DAEMON_MAX_JOBS = 4
+# Finished jobs kept for status queries; older ones are forgotten
+DAEMON_KEEP_JOBS = 200
+
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def iso_time(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(microsecond=0).isoformat()
+
+
+class CrawlJob:
+    __slots__ = (
+        "id", "url", "domain", "settings", "spider_kwargs", "stats_file", "state", "crawler",
+        "created", "started", "finished", "error", "stats", "outputs",
+    )
+
+    def __init__(self, job_id, url, settings, spider_kwargs, stats_file=None):
+        self.id = job_id
+        self.url = url
+        self.domain = urlparse(url).netloc
+        self.settings = settings
+        self.spider_kwargs = spider_kwargs
+        self.stats_file = stats_file
+        self.state = "queued"
+        self.crawler = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.stats = {}
+        self.outputs = {}
+
+    def collect_outputs(self):
+        spider = self.crawler.spider if self.crawler else None
+        if spider is not None:
+            self.outputs["directory"] = str(spider.output_dir.resolve())
+            if spider.exporter:
+                self.outputs["sitemap"] = str(spider.output_file.resolve())
+        if self.stats_file:
+            self.outputs["stats"] = self.stats_file
+
+    def describe(self):
+        stats = self.crawler.stats.get_stats() if self.crawler and self.crawler.stats else self.stats
+        if self.crawler and not self.outputs:
+            self.collect_outputs()
+        return {
+            "id": self.id,
+            "url": self.url,
+            "state": self.state,
+            "created": iso_time(self.created),
+            "started": iso_time(self.started),
+            "finished": iso_time(self.finished),
+            "pages": stats.get("spidercore/pages", stats.get("response_received_count", 0)),
+            "finish_reason": stats.get("finish_reason"),
+            "error": self.error,
+            "outputs": self.outputs,
+        }
+
+
+class CrawlService:
+    # Runs crawl jobs in one long-lived CrawlerProcess, so the reactor,
+    # imports, DNS and robots.txt caches stay warm between jobs. prepare()
+    # turns a job request into (url, settings, spider kwargs, stats file)
+    # the same way run.py does for its command line. At most max_jobs crawl
+    # at once, the rest wait their turn; one site only crawls in one job at
+    # a time since each site has a single output directory.
+    def __init__(self, process, prepare, max_jobs=DAEMON_MAX_JOBS, keep_jobs=DAEMON_KEEP_JOBS):
+        self.process = process
+        self.prepare = prepare
+        self.semaphore = defer.DeferredSemaphore(max(1, max_jobs))
+        self.keep_jobs = keep_jobs
+        self.jobs = OrderedDict()
+        self.ids = itertools.count(1)
+
+    def submit(self, options):
+        try:
+            url, settings, spider_kwargs, stats_file = self.prepare(options)
+        except ValueError as e:
+            raise JobError(400, str(e))
+        if not urlparse(url).scheme:
+            url = "https://" + url
+        domain = urlparse(url).netloc
+        busy = next((j for j in self.jobs.values() if j.domain == domain and j.state in ACTIVE_STATES), None)
+        if busy:
+            raise JobError(409, f"Job {busy.id} is already crawling {domain}")
+        job = CrawlJob(str(next(self.ids)), url, settings, spider_kwargs, stats_file)
+        self.jobs[job.id] = job
+        self.forget_old_jobs()
+        logger.info(f"[+] Job {job.id} queued: {job.url}")
+        self.semaphore.run(self.run, job)
+        return job
+
+    def run(self, job):
+        if job.state != "queued":
+            return None
+        job.crawler = self.process.create_crawler(BasicSpider)
+        # The process merges its own settings into the crawler again when
+        # it starts, so the job's values go in at a higher priority
+        settings = job.crawler.settings
+        for name in job.settings:
+            value = job.settings[name]
+            if settings[name] != value:
+                settings.set(name, value, priority="cmdline")
+        job.state = "running"
+        job.started = time.time()
+        logger.info(f"[*] Job {job.id} started: {job.url}")
+        d = self.process.crawl(job.crawler, url=job.url, **job.spider_kwargs)
+        d.addCallbacks(lambda _: self.done(job, None), lambda failure: self.done(job, failure))
+        return d
+
+    def done(self, job, failure):
+        job.finished = time.time()
+        job.stats = job.crawler.stats.get_stats() if job.crawler.stats else {}
+        job.collect_outputs()
+        if failure is not None:
+            job.state = "failed"
+            job.error = failure.getErrorMessage()
+            logger.warning(f"[!] Job {job.id} failed: {job.error}")
+        else:
+            if job.state != "cancelled":
+                job.state = "finished"
+            logger.info(f"[✓] Job {job.id} {job.state}: {job.describe()['pages']} pages")
+        if job.stats_file:
+            with open(job.stats_file, "w", encoding="utf-8") as f:
+                json.dump(job.stats, f, indent=2, default=str)
+        # The spider, its sets and exporter are not needed any more
+        job.crawler = None
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job.state not in ACTIVE_STATES:
+            raise JobError(409, f"Job {job.id} is already {job.state}")
+        running = job.state == "running"
+        job.state = "cancelled"
+        if running and job.crawler.engine is not None:
+            logger.info(f"[-] Cancelling job {job.id}")
+            deferred_from_coro(job.crawler.engine.close_spider_async(reason="cancelled"))
+        elif not running:
+            job.finished = time.time()
+        return job
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise JobError(404, f"No job {job_id}")
+        return job
+
+    def forget_old_jobs(self):
+        finished = [j.id for j in self.jobs.values() if j.state not in ACTIVE_STATES]
+        for job_id in finished[:max(0, len(finished) - self.keep_jobs)]:
+            del self.jobs[job_id]
+
+    def listen(self, address):
+        # "HOST:PORT" for local TCP or "unix:/path/to.sock"
+        from twisted.internet import reactor
+        from twisted.web import server
+
+        site = server.Site(job_api(self))
+        if address.startswith("unix:"):
+            path = address[len("unix:"):]
+            port = reactor.listenUNIX(path, site, wantPID=True)
+            logger.info(f"[*] Accepting crawl jobs on unix:{path}")
+        else:
+            host, _, port_number = address.rpartition(":")
+            port = reactor.listenTCP(int(port_number), site, interface=host or "127.0.0.1")
+            logger.info(f"[*] Accepting crawl jobs at http://{host or '127.0.0.1'}:{port_number}/jobs")
+        return port
+
+
+def job_api(service):
+    # GET /jobs, POST /jobs, GET /jobs/<id>, DELETE /jobs/<id>. Bodies and
+    # replies are JSON; errors come back as {"error": ...}.
+    from twisted.web import resource
+
+    class JobsResource(resource.Resource):
+        isLeaf = True
+
+        def reply(self, request, status, data):
+            request.setResponseCode(status)
+            request.setHeader(b"Content-Type", b"application/json")
+            return json.dumps(data, indent=2).encode("utf-8") + b"\n"
+
+        def handle(self, request, action):
+            path = [p.decode("utf-8") for p in request.postpath if p]
+            try:
+                return action(request, path)
+            except JobError as e:
+                return self.reply(request, e.status, {"error": str(e)})
+
+        def render_GET(self, request):
+            def action(request, path):
+                if not path:
+                    return self.reply(request, 200, [job.describe() for job in service.jobs.values()])
+                return self.reply(request, 200, service.get(path[0]).describe())
+            return self.handle(request, action)
+
+        def render_POST(self, request):
+            def action(request, path):
+                if path:
+                    raise JobError(404, "Jobs are created with POST /jobs")
+                try:
+                    options = json.loads(request.content.read() or b"{}")
+                except ValueError as e:
+                    raise JobError(400, f"Invalid JSON: {e}")
+                if not isinstance(options, dict):
+                    raise JobError(400, "Expected a JSON object of crawl options")
+                return self.reply(request, 201, service.submit(options).describe())
+            return self.handle(request, action)
+
+        def render_DELETE(self, request):
+            def action(request, path):
+                if not path:
+                    raise JobError(404, "Cancel a job with DELETE /jobs/<id>")
+                return self.reply(request, 200, service.cancel(path[0]).describe())
+            return self.handle(request, action)
+
+    root = resource.Resource()
+    root.putChild(b"jobs", JobsResource())
+    return root
@@ -0,0 +1,112 @@
+# spidercore/discovery.py
+
+import io
+import gzip
+import json
+from lxml import etree
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def sitemaps_from_robots(text):
+    # "Sitemap:" lines may appear anywhere in robots.txt, in any case
+    urls = []
+    for line in text.splitlines():
+        name, _, value = line.partition(":")
+        value = value.split("#", 1)[0].strip()
+        if name.strip().lower() == "sitemap" and value and value not in urls:
+            urls.append(value)
+    return urls
+
+
+def iter_sitemap(body):
+    # Yields ("sitemap", loc) for every entry of a <sitemapindex> and
+    # ("url", loc) for every entry of a <urlset>. Gzipped sitemaps are
+    # decompressed as they are read and each element is dropped once its
+    # <loc> has been seen, so memory stays flat however large the file is.
+    stream = io.BytesIO(body)
+    if body[:2] == b"\x1f\x8b":
+        stream = gzip.GzipFile(fileobj=stream)
+    parser = etree.iterparse(
+        stream,
+        events=("end",),
+        resolve_entities=False,
+        no_network=True,
+        huge_tree=True,
+        recover=True,
+    )
+    try:
+        for _, element in parser:
+            tag = element.tag if isinstance(element.tag, str) else ""
+            name = tag.rpartition("}")[2]
+            if name == "loc":
+                parent = element.getparent()
+                loc = (element.text or "").strip()
+                if loc and parent is not None:
+                    kind = parent.tag.rpartition("}")[2]
+                    if kind in ("sitemap", "url"):
+                        yield kind, loc
+            elif name in ("sitemap", "url"):
+                element.clear()
+                # Siblings already handled would otherwise stay attached to the root
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+    except (etree.XMLSyntaxError, OSError, EOFError):
+        # Truncated or corrupt sitemap: keep what was read so far
+        return
+
+
+class SitemapCoverage:
+    # Compares the URLs listed in the site's sitemaps with the pages that
+    # can be reached by following links from the start page. Links of every
+    # parsed page are kept, so pages fetched only because a sitemap listed
+    # them do not count as linked, and neither do the pages they link to.
+    def __init__(self):
+        self.sitemaps = 0
+        self.listed = set()
+        self.roots = []
+        self.links = {}
+        # Redirecting URL -> page it ended on; these are not pages themselves
+        self.redirects = {}
+
+    def add_listed(self, url):
+        self.listed.add(url)
+
+    def add_page(self, url, links, redirects=(), root=False):
+        if root:
+            self.roots.append(redirects[0] if redirects else url)
+        self.links[url] = tuple(links)
+        for source in redirects:
+            # A link to the redirecting URL reaches the final page
+            self.redirects.setdefault(source, url)
+
+    def reachable(self):
+        seen = set(self.roots)
+        queue = list(self.roots)
+        while queue:
+            url = queue.pop()
+            targets = self.links.get(url)
+            if targets is None:
+                targets = (self.redirects[url],) if url in self.redirects else ()
+            for url in targets:
+                if url not in seen:
+                    seen.add(url)
+                    queue.append(url)
+        return seen
+
+    def write(self, path):
+        # Orphans: listed in a sitemap but not reachable through links.
+        # Unlisted: parsed pages reachable through links but in no sitemap.
+        reachable = self.reachable()
+        orphans = sorted(self.listed - reachable)
+        unlisted = sorted(url for url in self.links if url in reachable and url not in self.listed)
+        report = {
+            "sitemaps": self.sitemaps,
+            "sitemap_urls": len(self.listed),
+            "pages_reached_by_links": len(reachable & self.links.keys()),
+            "in_sitemap_not_linked": orphans,
+            "linked_not_in_sitemap": unlisted,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return len(orphans), len(unlisted)
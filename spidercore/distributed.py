@@ -0,0 +1,581 @@
+# spidercore/distributed.py
+
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+import secrets
+import threading
+import socket
+import socketserver
+from collections import deque
+from pathlib import Path
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.request import request_from_dict
+from spidercore.assets import AssetLane, ASSET_CONCURRENCY
+from spidercore.priority import PageBudget
+from spidercore.state import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+# Requests a worker takes from the shared frontier per sync (and pushes it
+# sends without waiting for one), and how often an empty frontier is polled
+# again
+FRONTIER_BATCH = 16
+FRONTIER_POLL_INTERVAL = 0.5
+# Shared secret a coordinator and its workers read from the environment
+TOKEN_ENV = "SPIDERCORE_TOKEN"
+
+
+def partition(url, workers):
+    # Stable across processes and machines, unlike hash()
+    return int.from_bytes(hashlib.sha1(url.encode("utf-8")).digest()[:8], "big") % workers
+
+
+def parse_worker(value):
+    # "2/8" -> (2, 8)
+    index, _, total = str(value).partition("/")
+    index, total = int(index), int(total)
+    if not 0 <= index < total:
+        raise ValueError(f"Invalid worker {value}: expected INDEX/COUNT with 0 <= INDEX < COUNT")
+    return index, total
+
+
+def parse_address(value):
+    # "host:port" -> (host, port); a bare ":port" stays on this machine
+    host, _, port = value.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def open_frontier(location):
+    # "tcp://host:port" talks to a coordinator; anything else is a SQLite
+    # file shared by the workers of one machine
+    if location.startswith("tcp://"):
+        host, port = parse_address(location[len("tcp://"):])
+        return WorkerFrontier(CoordinatorClient(host, port, os.environ.get(TOKEN_ENV, "")))
+    return WorkerFrontier(SqliteFrontier(location.removeprefix("sqlite://"), check_same_thread=False))
+
+
+def request_to_json(request, spider):
+    # JSON rather than pickle: a frontier row or a coordinator reply can
+    # only ever turn into a Request, whoever wrote it
+    data = request.to_dict(spider=spider)
+    data["headers"] = {
+        name.decode("latin-1"): [value.decode("latin-1") for value in values]
+        for name, values in data["headers"].items()
+    }
+    data["body"] = base64.b64encode(data["body"]).decode("ascii")
+    return json.dumps(data, ensure_ascii=False)
+
+
+def request_from_json(text, spider):
+    data = json.loads(text)
+    data["headers"] = {
+        name.encode("latin-1"): [value.encode("latin-1") for value in values]
+        for name, values in data["headers"].items()
+    }
+    data["body"] = base64.b64decode(data["body"])
+    return request_from_dict(data, spider=spider)
+
+
+class SqliteFrontier(SqliteStore):
+    # Frontier, dedup store, visited pages and exported records shared by
+    # every worker of a distributed crawl. Each queued request belongs to
+    # the partition of its URL. A worker marks the rows it takes with its
+    # own id and acknowledges them only once it is idle, that is after their
+    # callbacks have run and pushed the links they found; the crawl is over
+    # when no row is queued or taken. The page budget is shared too: page
+    # rows are counted as they are taken, and dropped once it is spent.
+    #
+    # Workers are separate processes, so every call is its own short
+    # transaction instead of SqliteStore's batched commits.
+    schema = """
+        CREATE TABLE IF NOT EXISTS frontier (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            partition INTEGER NOT NULL,
+            priority INTEGER NOT NULL,
+            taken INTEGER,
+            page INTEGER NOT NULL DEFAULT 0,
+            request TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS frontier_order ON frontier (partition, taken, priority DESC, id);
+        CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS seen (fingerprint TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, record TEXT NOT NULL);
+    """
+
+    def __init__(self, path, check_same_thread=True):
+        super().__init__(path, commit_every=1, check_same_thread=check_same_thread)
+        self.db.execute("PRAGMA busy_timeout = 30000")
+
+    def register(self, worker):
+        # Rows a previous run of this worker took but never finished
+        with self.db:
+            self.db.execute("UPDATE frontier SET taken = NULL WHERE taken = ?", (worker,))
+
+    def push(self, items):
+        # items: (partition, priority, fingerprint or None, counts against
+        # the page budget, request JSON). Returns how many were queued; the
+        # rest were already seen.
+        added = 0
+        with self.db:
+            for part, priority, fingerprint, page, data in items:
+                if fingerprint is not None:
+                    cursor = self.db.execute("INSERT OR IGNORE INTO seen (fingerprint) VALUES (?)", (fingerprint,))
+                    if not cursor.rowcount:
+                        continue
+                self.db.execute(
+                    "INSERT INTO frontier (partition, priority, page, request) VALUES (?, ?, ?, ?)",
+                    (part, priority, int(bool(page)), data),
+                )
+                added += 1
+        return added
+
+    def pop(self, worker, part, limit, budget=None):
+        # Up to `limit` requests of the partition, and how many page
+        # requests were dropped because `budget` pages were already taken
+        with self.db:
+            # Take the write lock before reading the page counter, or two
+            # workers can both admit the last pages of the budget
+            self.db.execute("BEGIN IMMEDIATE")
+            used = self.counter("pages")
+            rows = self.db.execute(
+                "SELECT id, page, request FROM frontier WHERE partition = ? AND taken IS NULL "
+                "ORDER BY priority DESC, id LIMIT ?",
+                (part, limit),
+            ).fetchall()
+            taken = []
+            for row in rows:
+                if row[1] and budget is not None:
+                    if used >= budget:
+                        continue
+                    used += 1
+                taken.append(row)
+            self.db.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('pages', ?)", (used,))
+            self.db.executemany("UPDATE frontier SET taken = ? WHERE id = ?", [(worker, r[0]) for r in taken])
+            dropped = 0
+            if budget is not None and used >= budget:
+                # Spent: no queued page request of any partition will be fetched
+                dropped = self.db.execute("DELETE FROM frontier WHERE page = 1 AND taken IS NULL").rowcount
+        return [data for _, _, data in taken], dropped
+
+    def counter(self, name):
+        row = self.db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def ack(self, worker):
+        with self.db:
+            self.db.execute("DELETE FROM frontier WHERE taken = ?", (worker,))
+
+    def pending(self, part):
+        sql = "SELECT COUNT(*) FROM frontier WHERE partition = ? AND taken IS NULL"
+        return self.db.execute(sql, (part,)).fetchone()[0]
+
+    def active(self):
+        return self.db.execute("SELECT COUNT(*) FROM frontier").fetchone()[0]
+
+    def visited_count(self):
+        return self.db.execute("SELECT COUNT(*) FROM visited").fetchone()[0]
+
+    def iter_pages(self):
+        for (record,) in self.db.execute("SELECT record FROM pages ORDER BY rowid"):
+            yield json.loads(record)
+
+    def sync(self, worker, pushes=(), visits=(), pages=(), pop=0, budget=None, ack=False):
+        # Everything a worker has to send and ask for in one call: its
+        # queued requests, visited pages and records, then with `ack` the
+        # rows it has finished, then up to `pop` rows of its partition
+        added = self.push(pushes) if pushes else 0
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO visited (url) VALUES (?)", [(url,) for url in visits])
+            self.db.executemany(
+                "INSERT OR REPLACE INTO pages (url, record) VALUES (?, ?)",
+                [(entry["url"], json.dumps(entry, ensure_ascii=False)) for entry in pages],
+            )
+        if ack:
+            self.ack(worker)
+        rows, dropped = self.pop(worker, worker, pop, budget) if pop else ([], 0)
+        return {
+            "added": added,
+            "rows": rows,
+            "dropped": dropped,
+            "active": self.active(),
+            "visited": self.visited_count(),
+        }
+
+    def finish(self, worker):
+        self.ack(worker)
+
+
+# SqliteFrontier methods a Coordinator serves
+COORDINATOR_CALLS = {"register", "sync", "pending", "active", "visited_count", "finish"}
+
+
+class WorkerFrontier:
+    # A worker's end of the shared frontier (SqliteFrontier or
+    # CoordinatorClient), which the reactor never waits on. Requests,
+    # visited pages and records are queued here and go out in one sync()
+    # per batch, run with the pops and acks on a single background thread,
+    # so they reach the frontier in order.
+    #
+    # Visited pages are answered from the pages this worker parsed: a URL
+    # is only fetched by the worker owning its partition, and links into
+    # other partitions are deduplicated by the frontier's seen table.
+    def __init__(self, frontier):
+        self.frontier = frontier
+        self.pushes = []
+        self.visits = []
+        self.pages = []
+        self.visited = set()
+        self.visited_total = 0
+        self.pool = None
+        self.closed = False
+
+    def run(self, function, *args):
+        from twisted.internet import reactor
+        from twisted.internet.threads import deferToThreadPool
+        from twisted.python.threadpool import ThreadPool
+
+        if self.pool is None:
+            self.pool = ThreadPool(minthreads=1, maxthreads=1, name="frontier")
+            self.pool.start()
+            reactor.addSystemEventTrigger("during", "shutdown", self.stop)
+        return deferToThreadPool(reactor, self.pool, function, *args)
+
+    def stop(self):
+        # Runs the calls already queued, then ends the thread
+        if self.pool is not None and not self.pool.joined:
+            self.pool.stop()
+
+    def register(self, worker):
+        return self.run(self.frontier.register, worker)
+
+    def push(self, items):
+        self.pushes.extend(items)
+
+    def add_page(self, entry):
+        self.pages.append(entry)
+
+    def visit(self, url):
+        if url not in self.visited:
+            self.visited.add(url)
+            self.visits.append(url)
+
+    def visited_count(self):
+        # Every worker's pages as of the last sync, plus this worker's since
+        return self.visited_total + len(self.visits)
+
+    def unsent(self):
+        return len(self.pushes) + len(self.visits) + len(self.pages)
+
+    def take(self):
+        queued = (self.pushes, self.visits, self.pages)
+        self.pushes, self.visits, self.pages = [], [], []
+        return queued
+
+    def sync(self, worker, pop=0, budget=None, ack=False):
+        # Deferred firing with the frontier's reply, plus "pushed"
+        pushes, visits, pages = self.take()
+        d = self.run(self.frontier.sync, worker, pushes, visits, pages, pop, budget, ack)
+        d.addCallback(self.synced, len(pushes))
+        return d
+
+    def synced(self, result, pushed):
+        self.visited_total = result["visited"]
+        result["pushed"] = pushed
+        return result
+
+    def visited_set(self):
+        return VisitedSet(self)
+
+    def finish(self, worker):
+        # Spider closed: wait for the syncs still running, send what is
+        # left and mark the worker finished
+        self.stop()
+        pushes, visits, pages = self.take()
+        self.frontier.sync(worker, pushes, visits, pages)
+        self.frontier.finish(worker)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.stop()
+        self.frontier.close()
+
+
+class VisitedSet:
+    # The subset of the set API the spider uses on visited_urls
+    def __init__(self, frontier):
+        self.frontier = frontier
+
+    def __contains__(self, url):
+        return url in self.frontier.visited
+
+    def add(self, url):
+        self.frontier.visit(url)
+
+    def __len__(self):
+        return self.frontier.visited_count()
+
+
+class CoordinatorClient:
+    # SqliteFrontier API over a socket to a Coordinator, for workers on
+    # other machines. One JSON line per call, after the shared token.
+    def __init__(self, host, port, token):
+        self.address = (host, port)
+        self.sock = socket.create_connection(self.address)
+        self.stream = self.sock.makefile("rwb")
+        self.closed = False
+        self.call("auth", token)
+
+    def call(self, op, *args):
+        self.stream.write(json.dumps({"op": op, "args": args}).encode("utf-8") + b"\n")
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError(f"Coordinator at {self.address[0]}:{self.address[1]} closed the connection")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(f"Coordinator error in {op}: {reply['error']}")
+        return reply["result"]
+
+    def register(self, worker):
+        return self.call("register", worker)
+
+    def sync(self, worker, pushes=(), visits=(), pages=(), pop=0, budget=None, ack=False):
+        return self.call("sync", worker, pushes, visits, pages, pop, budget, ack)
+
+    def pending(self, part):
+        return self.call("pending", part)
+
+    def active(self):
+        return self.call("active")
+
+    def visited_count(self):
+        return self.call("visited_count")
+
+    def finish(self, worker):
+        return self.call("finish", worker)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.stream.close()
+        self.sock.close()
+
+
+class Coordinator(socketserver.ThreadingTCPServer):
+    # Serves a SqliteFrontier to workers on other machines. A connection
+    # is only served once it has sent the shared token (TOKEN_ENV, or one
+    # made up and printed at start). Calls from all connections are
+    # serialised on one lock; the server shuts down once every worker has
+    # finished and the frontier is empty.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, frontier_path, workers, token=None):
+        super().__init__(address, CoordinatorHandler)
+        self.frontier = SqliteFrontier(frontier_path, check_same_thread=False)
+        self.workers = workers
+        self.token = token or secrets.token_urlsafe(24)
+        self.finished = set()
+        self.lock = threading.Lock()
+
+    def authenticate(self, token):
+        return hmac.compare_digest(str(token).encode("utf-8"), self.token.encode("utf-8"))
+
+    def dispatch(self, op, args):
+        if op not in COORDINATOR_CALLS:
+            raise ValueError(f"unknown call {op}")
+        with self.lock:
+            result = getattr(self.frontier, op)(*args)
+            if op == "register":
+                self.finished.discard(args[0])
+            elif op == "finish":
+                self.finished.add(args[0])
+                logger.info(f"[✓] Worker {args[0]} finished ({len(self.finished)}/{self.workers})")
+                if len(self.finished) >= self.workers and not self.frontier.active():
+                    threading.Thread(target=self.shutdown, daemon=True).start()
+        return result
+
+
+class CoordinatorHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        authenticated = False
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                op, args = message["op"], message.get("args", [])
+            except (ValueError, TypeError, KeyError):
+                return
+            if not authenticated:
+                # Nothing but the token is answered; a wrong one ends the connection
+                if op != "auth" or not args or not self.server.authenticate(args[0]):
+                    logger.warning(f"[!] Rejected coordinator connection from {self.client_address[0]}")
+                    self.wfile.write(json.dumps({"error": "authentication failed"}).encode("utf-8") + b"\n")
+                    return
+                authenticated = True
+                reply = {"result": True}
+            else:
+                try:
+                    reply = {"result": self.server.dispatch(op, args)}
+                except Exception as e:
+                    reply = {"error": str(e)}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+
+class SharedScheduler:
+    # Scrapy scheduler for one worker of a distributed crawl. Every request
+    # goes to the shared frontier under the partition of its URL; the worker
+    # only dequeues its own partition and keeps the spider open while any
+    # other worker can still push work. The spider's max_pages is a budget
+    # shared by every worker, kept in the frontier. Asset requests of the
+    # partition go through this worker's AssetLane. Enabled by run.py with
+    # --worker.
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.spider = None
+        self.frontier = None
+        self.buffer = deque()
+        self.next_poll = 0.0
+        self.syncing = False
+        self.settled = False
+        self.batch = crawler.settings.getint("FRONTIER_BATCH", FRONTIER_BATCH)
+        self.lane = AssetLane(crawler, crawler.settings.getint("ASSET_CONCURRENCY", ASSET_CONCURRENCY))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = cls(crawler)
+        crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        self.frontier = spider.frontier
+        if self.frontier is None:
+            raise ValueError("SharedScheduler requires the spider to be started with frontier and worker")
+        self.worker, self.workers = spider.worker, spider.workers
+        self.budget = PageBudget(spider.max_pages)
+        self.frontier.register(self.worker)
+
+    def close(self, reason):
+        pass
+
+    def enqueue_request(self, request):
+        # Start requests are dont_filter, but every worker yields them; only
+        # asset chunk continuations really need to bypass the dedup store.
+        # The request only leaves with the next sync, so duplicates are
+        # counted when the frontier reports how many it queued.
+        fingerprint = None
+        if not (request.dont_filter and "asset_url" in request.meta):
+            fingerprint = self.crawler.request_fingerprinter.fingerprint(request).hex()
+        try:
+            data = request_to_json(request, self.spider)
+        except (TypeError, ValueError) as e:
+            self.spider.logger.warning(f"[!] Unable to persist request {request.url}: {e}")
+            return False
+        part = partition(request.url, self.workers)
+        page = self.budget.counts(request, self.spider)
+        self.frontier.push([(part, request.priority, fingerprint, page, data)])
+        self.settled = False
+        self.stats.inc_value(f"scheduler/enqueued/partition/{part}")
+        return True
+
+    def sync(self, pop=0, ack=False):
+        # Send what is queued and ask for more work on the frontier thread;
+        # the reactor carries on and synced() picks up the reply
+        self.syncing = True
+        d = self.frontier.sync(self.worker, pop, self.budget.limit, ack)
+        d.addCallbacks(self.synced, self.sync_failed)
+        return d
+
+    def synced(self, result):
+        self.syncing = False
+        rows = result["rows"]
+        self.buffer.extend(rows)
+        self.stats.inc_value("scheduler/enqueued", result["added"])
+        if result["pushed"] > result["added"]:
+            self.stats.inc_value("dupefilter/filtered", result["pushed"] - result["added"])
+        if result["dropped"]:
+            self.stats.inc_value("spidercore/over_budget", result["dropped"])
+        # Nothing queued or taken anywhere, this worker's rows included until
+        # it acknowledges them: no worker can push it more work
+        self.settled = not rows and not result["active"] and not self.frontier.unsent()
+        if not rows:
+            self.next_poll = time.monotonic() + FRONTIER_POLL_INTERVAL
+
+    def sync_failed(self, failure):
+        self.syncing = False
+        self.next_poll = time.monotonic() + FRONTIER_POLL_INTERVAL
+        self.spider.logger.error(f"[!] Frontier sync failed: {failure.getErrorMessage()}")
+
+    def refill(self):
+        # Ask for the next batch while half of this one is still buffered,
+        # and flush a full batch of pushes without waiting for it
+        if self.syncing:
+            return
+        if len(self.buffer) < self.batch // 2 and time.monotonic() >= self.next_poll:
+            self.sync(pop=self.batch)
+        elif self.frontier.unsent() >= self.batch:
+            self.sync()
+
+    def next_request(self):
+        request = self.lane.release()
+        if request is not None:
+            return request
+        self.refill()
+        while self.buffer:
+            request = request_from_json(self.buffer.popleft(), self.spider)
+            self.stats.inc_value("scheduler/dequeued")
+            if not self.lane.hold(request):
+                return request
+            # Set aside; a page may still be queued behind it
+        return None
+
+    def has_pending_requests(self):
+        # A pop still on its way is not pending work: counting it would keep
+        # the engine from ever going idle, and so from acknowledging
+        return bool(self.buffer) or len(self.lane) > 0
+
+    def __len__(self):
+        return len(self.buffer) + len(self.lane)
+
+    def spider_idle(self, spider):
+        # Everything this worker took has been fully processed: acknowledge
+        # it with the next sync, and stay open until a sync finds the
+        # frontier empty
+        if self.settled:
+            return
+        if not self.syncing:
+            self.sync(pop=self.batch, ack=True)
+        raise DontCloseSpider
+
+def reset_finished(path):
+    # A frontier left by a finished crawl would dedup every URL of the next
+    # one; a frontier with queued or taken rows is resumed instead
+    path = Path(path)
+    if not path.exists():
+        return
+    frontier = SqliteFrontier(path)
+    active = frontier.active()
+    frontier.close()
+    if active:
+        logger.info(f"[*] Resuming distributed crawl with {active} queued requests")
+        return
+    for stale in (path, Path(f"{path}-wal"), Path(f"{path}-shm")):
+        stale.unlink(missing_ok=True)
+
+
+def merge_pages(frontier, exporter):
+    # Feed the records every worker stored into the site's exporter
+    for entry in frontier.iter_pages():
+        exporter.write(entry)
+    exporter.close()
@@ -0,0 +1,489 @@
+# spidercore/exporters.py
+
+import csv
+import gzip
+import html
+import json
+import logging
+import datetime
+from pathlib import Path
+from urllib.parse import urlparse, urljoin
+from spidercore.urlstore import PageList, UrlStore
+
+SITEMAP_MAX_URLS = 50000
+# <priority> of every URL unless a link graph ranks them
+SITEMAP_PRIORITY = 0.8
+CSV_BATCH_SIZE = 1000
+# Links per HTML sitemap file before sections move to files of their own
+HTML_MAX_LINKS = 5000
+
+
+def open_output(path, compress=False, newline=None):
+    # Text-mode handle on either a plain or a gzip-compressed file
+    if compress:
+        return gzip.open(f"{path}.gz", "wt", encoding="utf-8", newline=newline)
+    return open(path, "w", encoding="utf-8", newline=newline)
+
+
+class SitemapExporter:
+    # Base class for exporters that receive one record per accepted page
+    # while the crawl runs and finish their output in close().
+    label = "Sitemap"
+
+    def __init__(self, output_file, logger=None, compress=False, include_content=False, **kwargs):
+        self.output_file = Path(output_file)
+        self.logger = logger or logging.getLogger(__name__)
+        self.compress = compress
+        self.include_content = include_content
+        self.count = 0
+        self.closed = False
+
+    @property
+    def output_path(self):
+        return Path(f"{self.output_file}.gz") if self.compress else self.output_file
+
+    def open(self):
+        pass
+
+    def write(self, entry):
+        self.count += 1
+
+    def finish(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.finish()
+            self.logger.info(f"[✓] {self.label} written to: {self.output_path}")
+        except Exception as e:
+            self.logger.error(f"[!] Failed to write {self.label}: {e}")
+
+
+class JsonExporter(SitemapExporter):
+    # Streams a JSON array, one entry per line, so nothing is held in memory
+    label = "JSON sitemap"
+
+    def open(self):
+        self.file = open_output(self.output_file, self.compress)
+        self.file.write("[")
+
+    def write(self, entry):
+        sep = "," if self.count else ""
+        self.file.write(f"{sep}\n  {json.dumps(entry, ensure_ascii=False)}")
+        super().write(entry)
+
+    def finish(self):
+        self.file.write("\n]\n")
+        self.file.close()
+
+
+class JsonLinesExporter(SitemapExporter):
+    label = "JSON Lines sitemap"
+
+    def open(self):
+        self.file = open_output(self.output_file, self.compress)
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+        super().write(entry)
+
+    def finish(self):
+        self.file.close()
+
+
+class CsvExporter(SitemapExporter):
+    label = "CSV sitemap"
+
+    def __init__(self, *args, batch_size=CSV_BATCH_SIZE, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self.fields = fields or (["url", "title"] if self.include_content else ["url"])
+        self.rows = []
+
+    def open(self):
+        self.file = open_output(self.output_file, self.compress, newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.fields)
+
+    def write(self, entry):
+        self.rows.append([entry.get(field, "") for field in self.fields])
+        super().write(entry)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.writer.writerows(self.rows)
+        self.file.flush()
+        self.rows = []
+
+    def finish(self):
+        self.flush()
+        self.file.close()
+
+
+class XmlSitemapExporter(SitemapExporter):
+    # Writes sitemap part files of at most max_urls entries each. A single
+    # part is renamed to the output file; several parts are tied together
+    # by a <sitemapindex> written to the output file instead. Given the
+    # crawl's LinkGraph, the URLs are held (as URL IDs) until the crawl is
+    # over and written with the priority the graph gives them.
+    label = "XML sitemap"
+
+    def __init__(self, *args, base_url=None, max_urls=SITEMAP_MAX_URLS, graph=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.base_url = base_url
+        self.max_urls = max_urls
+        self.graph = graph
+        self.pending = PageList(graph.urls) if graph is not None else None
+        self.parts = []
+        self.file = None
+        self.part_count = 0
+
+    def open(self):
+        self.now = datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "+00:00"
+
+    def part_path(self, number):
+        return self.output_file.with_name(f"{self.output_file.stem}-{number}{self.output_file.suffix}")
+
+    def start_part(self):
+        path = self.part_path(len(self.parts) + 1)
+        self.parts.append(path)
+        self.file = open_output(path, self.compress)
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.file.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        self.part_count = 0
+
+    def end_part(self):
+        self.file.write("</urlset>\n")
+        self.file.close()
+        self.file = None
+
+    def write(self, entry):
+        # Near-duplicates stay out of the sitemap, only their original is listed
+        if entry.get("duplicate_of"):
+            return
+        super().write(entry)
+        if self.pending is not None:
+            self.pending.append(entry["url"], entry.get("lastmod"))
+            return
+        self.write_url(entry["url"], entry.get("lastmod"), SITEMAP_PRIORITY)
+
+    def write_url(self, url, lastmod, priority):
+        if self.file is None:
+            self.start_part()
+        self.file.write("  <url>\n")
+        self.file.write(f"    <loc>{html.escape(url)}</loc>\n")
+        self.file.write(f"    <lastmod>{lastmod or self.now}</lastmod>\n")
+        self.file.write(f"    <priority>{priority:.2f}</priority>\n")
+        self.file.write("  </url>\n")
+        self.part_count += 1
+        if self.part_count >= self.max_urls:
+            self.end_part()
+
+    def finish(self):
+        if self.pending is not None:
+            for url, lastmod in self.pending:
+                priority = self.graph.priority(url)
+                self.write_url(url, lastmod, SITEMAP_PRIORITY if priority is None else priority)
+        if self.file is not None:
+            self.end_part()
+        if not self.parts:
+            self.start_part()
+            self.end_part()
+
+        suffix = ".gz" if self.compress else ""
+        if len(self.parts) == 1:
+            Path(f"{self.parts[0]}{suffix}").replace(self.output_path)
+            return
+
+        with open_output(self.output_file, self.compress) as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+            for path in self.parts:
+                loc = html.escape(urljoin(self.base_url or "", f"{path.name}{suffix}"))
+                f.write("  <sitemap>\n")
+                f.write(f"    <loc>{loc}</loc>\n")
+                f.write(f"    <lastmod>{self.now}</lastmod>\n")
+                f.write("  </sitemap>\n")
+            f.write("</sitemapindex>\n")
+
+
+class SitemapNode:
+    # One directory of the HTML sitemap; count covers the whole subtree
+    __slots__ = ("children", "pages", "count")
+
+    def __init__(self, urls):
+        self.children = {}
+        self.pages = PageList(urls)
+        self.count = 0
+
+
+class HtmlSitemapExporter(SitemapExporter):
+    # The HTML sitemap groups pages by path, so (url, title) pairs are
+    # collected into a directory tree whose page counts are kept up to date
+    # as entries arrive. The page is streamed to the file once the crawl has
+    # finished. With max_links set, sections that would push a file past
+    # that many links get a file of their own, linked from their parent,
+    # and directories with more pages than that are split into numbered
+    # pages with previous/next links. Page URLs are kept as IDs in a
+    # UrlStore, the spider's own when it passes one in.
+    label = "HTML sitemap"
+
+    def __init__(self, *args, domain="", start_url="", max_links=HTML_MAX_LINKS, urls=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The HTML report is meant to be opened in a browser, never gzip it
+        self.compress = False
+        self.domain = domain
+        self.start_url = start_url
+        self.max_links = max_links
+        self.urls = urls if urls is not None else UrlStore()
+        self.root = SitemapNode(self.urls)
+        self.files = 0
+
+    def write(self, entry):
+        path = urlparse(entry["url"]).path
+        # Group root-level URLs like "/" and "/foo.html" under "/"
+        if path.count("/") <= 1:
+            keys = ["/"]
+        else:
+            keys = [p for p in path.strip("/").split("/") if p]
+            if keys and "." in keys[-1]:  # Don't create children for files like .html
+                keys.pop()
+
+        node = self.root
+        node.count += 1
+        for key in keys:
+            child = node.children.get(key)
+            if child is None:
+                child = node.children[key] = SitemapNode(self.urls)
+            node = child
+            node.count += 1
+        node.pages.append(entry["url"], entry.get("title"))
+        super().write(entry)
+
+    def finish(self):
+        self.now = datetime.datetime.utcnow().strftime("%Y, %B %d")
+        # Section files left over from an earlier, larger crawl
+        stem, suffix = self.output_file.stem, self.output_file.suffix
+        for stale in self.output_file.parent.glob(f"{stem}-*{suffix}"):
+            if stale.name[len(stem) + 1:-len(suffix)].isdigit():
+                stale.unlink()
+        # Files still to render: (node, section label, path, parent file name)
+        pending = [(self.root, "", self.output_file, None)]
+        while pending:
+            self.render_file(*pending.pop(0), pending)
+        if self.files:
+            self.logger.info(f"[*] HTML sitemap split into {self.files + 1} files")
+
+    def next_path(self):
+        self.files += 1
+        return self.output_file.with_name(f"{self.output_file.stem}-{self.files}{self.output_file.suffix}")
+
+    def render_file(self, node, name, path, up, pending):
+        budget = self.max_links
+        with open(path, "w", encoding="utf-8") as f:
+            self.write_head(f, name, node.count, up)
+            f.write('<ul class="level-0">\n')
+            if budget and len(node.pages) > budget:
+                used = self.write_chunks(f, node.pages, name, path.name)
+            else:
+                self.write_pages(f, node.pages)
+                used = len(node.pages)
+
+            for key, child in node.children.items():
+                label = key if key == "/" else f"{name}{key}/"
+                if budget and used + child.count > budget:
+                    child_path = self.next_path()
+                    pending.append((child, label, child_path, path.name))
+                    f.write(
+                        f'<li class="lhead"><a href="{html.escape(child_path.name)}">{html.escape(label)}</a>'
+                        f'  <span class="lcount">{child.count} pages</span></li>\n'
+                    )
+                    used += 1
+                else:
+                    self.write_section(f, label, child)
+                    used += child.count
+            f.write("</ul></div></body></html>\n")
+
+    def write_section(self, f, label, node):
+        # Depth first without recursion, so deep URL paths cannot hit the
+        # recursion limit; every entry on the stack closes one open section
+        self.open_section(f, label, node, 0)
+        stack = [(iter(node.children.items()), 1)]
+        while stack:
+            items, level = stack[-1]
+            item = next(items, None)
+            if item is None:
+                stack.pop()
+                f.write("</ul></details></li>\n")
+                continue
+            key, child = item
+            self.open_section(f, f"{key}/", child, level)
+            stack.append((iter(child.children.items()), level + 1))
+
+    def open_section(self, f, label, node, level):
+        # Top-level sections start expanded, deeper ones collapsed
+        expanded = " open" if level == 0 else ""
+        f.write(
+            f'<li><details{expanded}><summary class="lhead">{html.escape(label)}'
+            f'  <span class="lcount">{node.count} pages</span></summary>\n'
+            f'<ul class="level-{level + 1}">\n'
+        )
+        self.write_pages(f, node.pages)
+
+    def write_pages(self, f, pages):
+        last = len(pages) - 1
+        for i, (url, title) in enumerate(pages):
+            url = html.escape(url)
+            title = html.escape(title) if title else url
+            end = " last-page" if i == last else ""
+            f.write(f'<li class="lpage{end}"><a href="{url}" title="{title}">{title}</a></li>\n')
+
+    def write_chunks(self, f, pages, name, parent):
+        # A directory with more pages than fit in one file: numbered files
+        # of max_links pages each, chained with previous/next links
+        size = self.max_links
+        paths = [self.next_path() for _ in range(0, len(pages), size)]
+        for n, chunk_path in enumerate(paths):
+            first = n * size
+            chunk = pages[first:first + size]
+            span = f"{first + 1}-{first + len(chunk)}"
+            f.write(f'<li class="lpage"><a href="{html.escape(chunk_path.name)}">Pages {span}</a></li>\n')
+
+            links = [f'<a href="{html.escape(parent)}">Up</a>']
+            if n:
+                links.append(f'<a href="{html.escape(paths[n - 1].name)}">Previous</a>')
+            if n + 1 < len(paths):
+                links.append(f'<a href="{html.escape(paths[n + 1].name)}">Next</a>')
+            with open(chunk_path, "w", encoding="utf-8") as out:
+                self.write_head(out, f"{name or '/'} pages {span}", len(pages), parent)
+                out.write(f'<div class="nav">{"".join(links)}</div>\n<ul class="level-0">\n')
+                self.write_pages(out, chunk)
+                out.write(f'</ul><div class="nav">{"".join(links)}</div></div></body></html>\n')
+        return len(paths)
+
+    def write_head(self, f, section, total, up):
+        section_line = f"<span>Section: {html.escape(section)}</span>" if section else ""
+        back = f'<a class="homepage-button" href="{html.escape(up)}">Back to index</a>\n' if up else ""
+        f.write(f"""<!DOCTYPE html>
+                <html lang="en"><head><meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
+                <title>{self.domain} Site Map</title>
+                <meta content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=0" name="viewport">
+                <style type="text/css">
+                body {{
+                    background-color: #fff;
+                    font-family: "Roboto", "Helvetica", "Arial", sans-serif;
+                    margin: 0;
+                }}
+
+                #top {{
+                    background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
+                    color: #fff;
+                    text-align: center;
+                    padding: 40px 20px 60px;
+                    box-shadow: 0 10px 30px rgba(0,0,0,0.2);
+                    border-bottom-left-radius: 8px;
+                    border-bottom-right-radius: 8px;
+                }}
+
+                .header-wrapper {{
+                    max-width: 700px;
+                    margin: auto;
+                }}
+
+                .site-title {{
+                    font-size: 32px;
+                    font-weight: bold;
+                    margin: 0 0 10px;
+                    letter-spacing: 0.5px;
+                }}
+
+                .meta {{
+                    font-size: 16px;
+                    margin-bottom: 20px;
+                }}
+
+                .meta span {{
+                    display: block;
+                    margin: 4px 0;
+                }}
+
+                .homepage-button {{
+                    display: inline-block;
+                    margin-top: 10px;
+                    background-color: #ffffff;
+                    color: #4facfe;
+                    padding: 10px 20px;
+                    border-radius: 25px;
+                    text-decoration: none;
+                    font-weight: bold;
+                    box-shadow: 0 4px 8px rgba(0,0,0,0.15);
+                    transition: all 0.3s ease;
+                }}
+
+                .homepage-button:hover {{
+                    background-color: #e8f6ff;
+                    color: #007acc;
+                    box-shadow: 0 6px 14px rgba(0,0,0,0.2);
+                }}
+
+                #cont {{
+                    position: relative;
+                    border-radius: 6px;
+                    box-shadow: 0 16px 24px 2px rgba(0, 0, 0, 0.14), 0 6px 30px 5px rgba(0, 0, 0, 0.12), 0 8px 10px -5px rgba(0, 0, 0, 0.2);
+                    background: #f3f3f3;
+                    margin: -20px 30px 0px 30px;
+                    padding: 20px;
+                }}
+
+                a:link, a:visited {{ color: #0180AF; text-decoration: underline; }}
+                a:hover {{ color: #666; }}
+                #footer {{ padding: 10px; text-align: center; }}
+                ul {{ margin: 0px; padding: 0px; list-style: none; }}
+                li {{ margin: 0px; }}
+                li ul {{ margin-left: 20px; }}
+                .lhead {{ background: #ddd; padding: 10px; margin: 10px 0px; }}
+                .lcount {{ padding: 0px 10px; }}
+                .lpage {{ border-bottom: #ddd 1px solid; padding: 5px; }}
+                .last-page {{ border: none; }}
+                summary.lhead {{ cursor: pointer; }}
+                .nav {{ margin: 10px 0px; }}
+                .nav a {{ margin-right: 15px; }}
+                </style>
+                </head>
+                <body>
+                <div id="top">
+                    <div class="header-wrapper">
+                        <h1 class="site-title">{self.domain} Site Map</h1>
+                        <div class="meta">
+                            <span>Last updated: {self.now}</span>
+                            <span>Total pages: {total}</span>
+                            {section_line}
+                        </div>
+                        {back}<a class="homepage-button" href="{self.start_url}" target="_blank">Go to Target Site</a>
+                    </div>
+                </div>
+                <div id="cont">
+                """)
+
+
+EXPORTERS = {
+    "html": HtmlSitemapExporter,
+    "xml": XmlSitemapExporter,
+    "json": JsonExporter,
+    "jsonl": JsonLinesExporter,
+    "csv": CsvExporter,
+}
+
+
+def get_exporter(export, output_file, **kwargs):
+    exporter_cls = EXPORTERS.get(export)
+    if exporter_cls is None:
+        return None
+    exporter = exporter_cls(output_file, **kwargs)
+    exporter.open()
+    return exporter
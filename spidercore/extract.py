@@ -0,0 +1,194 @@
+# spidercore/extract.py
+
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from w3lib.html import strip_html5_whitespace
+
+ASSET_EXTENSIONS = frozenset({"pdf", "zip", "docx", "xlsx", "pptx"})
+
+UNUSUAL_PREFIXES = {
+    "tel:": "tel link",
+    "mailto:": "mailto link",
+    "javascript:": "javascript link",
+}
+
+# Attribute holding the URL for every tag the extractor looks at
+URL_ATTRIBUTES = {"a": "href", "link": "href", "script": "src", "img": "src"}
+
+
+class PageLinks:
+    __slots__ = ("links", "assets", "unusual", "title", "anchors")
+
+    def __init__(self, links, assets, unusual, title, anchors=None):
+        self.links = links
+        self.assets = assets
+        self.unusual = unusual
+        self.title = title
+        # Link URL -> text of its first non-empty anchor, when requested
+        self.anchors = anchors or {}
+
+
+class LinkExtractor:
+    # Sorts every URL of a page in one pass: <a href> targets become page
+    # links, any tag URL with an asset extension becomes an asset, and
+    # tel:/mailto:/javascript: or non-http schemes are reported as unusual.
+    # Each distinct href is resolved once against the page (or <base>) URL.
+    #
+    # Backends only differ in how they walk the document and yield
+    # (tag, url) pairs, plus the <a> texts when anchors is set; see BACKENDS.
+    def __init__(self, backend="lxml", asset_extensions=ASSET_EXTENSIONS, anchors=False):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown extractor backend: {backend} (choose from {', '.join(BACKENDS)})")
+        self.backend = backend
+        self.walk = BACKENDS[backend]
+        self.anchors = anchors
+        self.asset_extensions = frozenset(e.lower().lstrip(".") for e in asset_extensions)
+
+    def is_asset(self, url):
+        return url.rpartition(".")[2].lower() in self.asset_extensions
+
+    def extract(self, response):
+        base_url, title, pairs, texts = self.walk(response, self.anchors)
+        base_url = urljoin(response.url, base_url) if base_url else response.url
+
+        hrefs = {}
+        others = {}
+        # Anchor texts by href as stripped below; the walkers key them by
+        # the attribute value as written
+        href_texts = {}
+        for tag, raw in pairs:
+            value = strip_html5_whitespace(raw)
+            if not value:
+                continue
+            if tag == "a":
+                hrefs[value] = None
+                if texts.get(raw) and not href_texts.get(value):
+                    href_texts[value] = texts[raw]
+            else:
+                others[value] = None
+
+        resolved = {}
+        for value in {**hrefs, **others}:
+            if value.startswith(("http://", "https://")):
+                resolved[value] = value
+            else:
+                resolved[value] = urljoin(base_url, value)
+
+        links = []
+        unusual = []
+        anchors = {}
+        for href in hrefs:
+            reason = next((r for p, r in UNUSUAL_PREFIXES.items() if href.startswith(p)), None)
+            if reason:
+                unusual.append((href, reason))
+                continue
+            url = resolved[href]
+            scheme = url.partition(":")[0].lower()
+            if scheme not in ("http", "https"):
+                unusual.append((url, f"non-http scheme: {scheme}"))
+                continue
+            links.append(url)
+            if href_texts.get(href):
+                anchors.setdefault(url, href_texts[href])
+
+        assets = [
+            url for url in dict.fromkeys(resolved.values())
+            if url.startswith(("http://", "https://")) and self.is_asset(url)
+        ]
+        return PageLinks(links, assets, unusual, title, anchors)
+
+
+def walk_lxml(response, anchors=False):
+    # Reuses the lxml tree parsel builds for response.xpath/css, so pages
+    # that are also queried with selectors are only parsed once
+    base_url = None
+    title = None
+    pairs = []
+    texts = {}
+    for element in response.selector.root.iter("a", "link", "script", "img", "base", "title"):
+        tag = element.tag
+        if tag == "title":
+            if title is None:
+                title = element.text or ""
+        elif tag == "base":
+            if base_url is None:
+                base_url = element.get("href")
+        else:
+            value = element.get(URL_ATTRIBUTES[tag])
+            if value is not None:
+                pairs.append((tag, value))
+                if anchors and tag == "a" and not texts.get(value):
+                    texts[value] = " ".join(element.text_content().split())
+    return base_url, title, pairs, texts
+
+
+class _StreamingWalker(HTMLParser):
+    def __init__(self, anchors=False):
+        super().__init__(convert_charrefs=True)
+        self.base_url = None
+        self.title = None
+        self.pairs = []
+        self.in_title = False
+        self.anchors = anchors
+        self.texts = {}
+        self.anchor = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and self.title is None:
+            self.in_title = True
+            self.title = ""
+        elif tag == "base" and self.base_url is None:
+            self.base_url = dict(attrs).get("href")
+        elif tag in URL_ATTRIBUTES:
+            value = dict(attrs).get(URL_ATTRIBUTES[tag])
+            if value is not None:
+                self.pairs.append((tag, value))
+                if self.anchors and tag == "a":
+                    self.anchor = (value, [])
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.in_title = False
+        elif tag == "a" and self.anchor:
+            value, parts = self.anchor
+            if not self.texts.get(value):
+                self.texts[value] = " ".join("".join(parts).split())
+            self.anchor = None
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+        elif self.anchor:
+            self.anchor[1].append(data)
+
+
+def walk_htmlparser(response, anchors=False):
+    # Stdlib streaming tokenizer; never builds a tree
+    walker = _StreamingWalker(anchors)
+    walker.feed(response.text)
+    walker.close()
+    return walker.base_url, walker.title, walker.pairs, walker.texts
+
+
+def walk_selectors(response, anchors=False):
+    # The original per-tag CSS selector queries, kept for comparison
+    base_url = response.css("base::attr(href)").get()
+    title = response.xpath("//title/text()").get()
+    pairs = [("a", v) for v in response.css("a::attr(href)").getall()]
+    pairs += [("link", v) for v in response.css("link::attr(href)").getall()]
+    pairs += [("script", v) for v in response.css("script::attr(src)").getall()]
+    pairs += [("img", v) for v in response.css("img::attr(src)").getall()]
+    texts = {}
+    if anchors:
+        for a in response.css("a[href]"):
+            value = a.attrib["href"]
+            if not texts.get(value):
+                texts[value] = " ".join(" ".join(a.css("::text").getall()).split())
+    return base_url, title, pairs, texts
+
+
+BACKENDS = {
+    "lxml": walk_lxml,
+    "htmlparser": walk_htmlparser,
+    "selectors": walk_selectors,
+}
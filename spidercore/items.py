@@ -1,8 +1,18 @@
-# spidercore/items.py
-
-import scrapy
-
-class SitemapItem(scrapy.Item):
-    url = scrapy.Field()
-    title = scrapy.Field()
-    depth = scrapy.Field()
+# spidercore/items.py
+
+import scrapy
+
+class SitemapItem(scrapy.Item):
+    url = scrapy.Field()
+    title = scrapy.Field()
+    depth = scrapy.Field()
+    lastmod = scrapy.Field()
+    # Filled by --rich-content, see spidercore/content.py
+    description = scrapy.Field()
+    canonical = scrapy.Field()
+    h1 = scrapy.Field()
+    language = scrapy.Field()
+    word_count = scrapy.Field()
+    link_count = scrapy.Field()
+    # Set by --near-duplicates to the URL of the page this one duplicates
+    duplicate_of = scrapy.Field()
@@ -0,0 +1,84 @@
+# spidercore/linkcheck.py
+
+import json
+from collections import Counter
+
+# Pages kept per target as "linked_from"; the total is always counted
+LINK_SOURCES_LIMIT = 50
+# Statuses some servers answer HEAD with although GET works
+HEAD_FALLBACK_STATUSES = frozenset({400, 403, 405, 501})
+# Passed to HttpErrorMiddleware so error responses reach the callback
+# while 3xx responses are still followed by RedirectMiddleware
+ERROR_STATUSES = list(range(400, 600))
+
+
+def redirect_chain(response):
+    # [[url, status], ...] for every hop RedirectMiddleware followed, ending
+    # with the final URL; empty when there was no redirect
+    urls = response.meta.get("redirect_urls", [])
+    reasons = response.meta.get("redirect_reasons", [])
+    if not urls:
+        return []
+    return [[url, reason] for url, reason in zip(urls, reasons)] + [[response.url, response.status]]
+
+
+class LinkChecker:
+    # Every link target seen on a crawled page, the pages linking to it
+    # and, once known, its result. Each target is checked once: pages the
+    # crawl fetches anyway take their status from that response, the rest
+    # get a HEAD request (or a GET cut off after the headers).
+    def __init__(self):
+        self.sources = {}
+        self.source_counts = Counter()
+        self.results = {}
+        self.swept = set()
+
+    def add(self, target, source):
+        # True the first time a target is seen
+        sources = self.sources.get(target)
+        new = sources is None
+        if new:
+            sources = self.sources[target] = []
+        self.source_counts[target] += 1
+        if len(sources) < LINK_SOURCES_LIMIT:
+            sources.append(source)
+        return new
+
+    def record(self, url, status=None, redirects=(), method="GET", error=None):
+        if url in self.results:
+            return
+        self.results[url] = {
+            "status": status,
+            "method": method,
+            "redirects": list(redirects),
+            "error": error,
+        }
+
+    def unresolved(self):
+        # Targets without a result that were not checked directly yet
+        return [url for url in self.sources if url not in self.results and url not in self.swept]
+
+    def is_broken(self, result):
+        return result["error"] is not None or result["status"] is None or result["status"] >= 400
+
+    def write_report(self, path):
+        statuses = Counter()
+        broken = []
+        redirected = []
+        for url in self.sources:
+            result = self.results.get(url) or {"status": None, "method": None, "redirects": [], "error": "not checked"}
+            statuses[str(result["status"] if result["error"] is None else "error")] += 1
+            linked = {"linked_from": self.sources[url], "linked_from_count": self.source_counts[url]}
+            if self.is_broken(result):
+                broken.append({"url": url, **result, **linked})
+            elif result["redirects"]:
+                redirected.append({"url": url, "redirects": result["redirects"], "status": result["status"], **linked})
+        report = {
+            "checked": len(self.sources),
+            "statuses": dict(statuses.most_common()),
+            "broken": broken,
+            "redirected": redirected,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return len(self.sources), len(broken)
@@ -0,0 +1,218 @@
+# spidercore/linkgraph.py
+
+import sys
+import json
+import math
+from array import array
+from collections import Counter, deque
+from spidercore.urlstore import UrlSet
+
+# PageRank: damping factor, and power iterations until the ranks move
+# less than PAGERANK_TOLERANCE in total or PAGERANK_ITERATIONS are done
+PAGERANK_DAMPING = 0.85
+PAGERANK_ITERATIONS = 50
+PAGERANK_TOLERANCE = 1e-6
+# XML sitemap <priority> of the page ranked lowest; the best gets 1.0
+SITEMAP_MIN_PRIORITY = 0.1
+# Pages listed in the report under top_pagerank
+LINK_GRAPH_TOP = 25
+
+GRAPH_MAGIC = b"SPLG"
+GRAPH_VERSION = 1
+# Column order and array types of link-graph.bin
+GRAPH_COLUMNS = (
+    ("offsets", "Q"),
+    ("targets", "I"),
+    ("depth", "i"),
+    ("in_degree", "I"),
+    ("pagerank", "d"),
+)
+
+
+class LinkGraph:
+    # Page-to-page links seen during the crawl, kept as URL IDs of the
+    # spider's UrlStore: one row of link targets per parsed page, appended
+    # to flat arrays (CSR: row i is targets[offsets[i]:offsets[i + 1]]).
+    # analysis() renumbers the parsed pages 0..n-1, drops links that lead
+    # nowhere parsed and computes click depth from the start page,
+    # in-degree, orphans and PageRank over those arrays.
+    def __init__(
+        self,
+        urls,
+        damping=PAGERANK_DAMPING,
+        iterations=PAGERANK_ITERATIONS,
+        tolerance=PAGERANK_TOLERANCE,
+        min_priority=SITEMAP_MIN_PRIORITY,
+    ):
+        self.urls = urls
+        self.damping = damping
+        self.iterations = iterations
+        self.tolerance = tolerance
+        self.min_priority = min_priority
+        self.parsed = UrlSet(urls)
+        self.rows = array("I")
+        self.offsets = array("Q", [0])
+        self.targets = array("I")
+        self.roots = []
+        # Redirecting URL ID -> ID of the page it ended on
+        self.redirects = {}
+        self.result = None
+
+    def add_page(self, url, links, redirects=(), root=False):
+        url_id = self.urls.add(url)
+        if self.parsed.has_id(url_id):
+            return
+        self.parsed.add_id(url_id)
+        if root:
+            self.roots.append(url_id)
+        for source in redirects:
+            # A link to the redirecting URL reaches the final page
+            self.redirects.setdefault(self.urls.add(source), url_id)
+        self.rows.append(url_id)
+        self.targets.extend(map(self.urls.add, links))
+        self.offsets.append(len(self.targets))
+
+    def analysis(self):
+        if self.result is None:
+            self.result = self.analyze()
+        return self.result
+
+    def analyze(self):
+        n = len(self.rows)
+        # URL ID -> page number + 1, 0 for URLs that were never parsed
+        node_of = array("I", bytes(4 * len(self.urls)))
+        for node, url_id in enumerate(self.rows):
+            node_of[url_id] = node + 1
+        for source, url_id in self.redirects.items():
+            if not node_of[source]:
+                node_of[source] = node_of[url_id]
+
+        offsets = array("Q", [0])
+        targets = array("I")
+        for node in range(n):
+            row = {node_of[t] - 1 for t in self.targets[self.offsets[node]:self.offsets[node + 1]] if node_of[t]}
+            row.discard(node)
+            targets.extend(sorted(row))
+            offsets.append(len(targets))
+
+        in_degree = array("I", bytes(4 * n))
+        for target in targets:
+            in_degree[target] += 1
+
+        # Click depth: breadth-first from the start page, -1 if unreachable
+        depth = array("i", [-1]) * n
+        roots = [node_of[r] - 1 for r in self.roots if node_of[r]]
+        queue = deque(roots)
+        for root in roots:
+            depth[root] = 0
+        while queue:
+            node = queue.popleft()
+            for target in targets[offsets[node]:offsets[node + 1]]:
+                if depth[target] < 0:
+                    depth[target] = depth[node] + 1
+                    queue.append(target)
+
+        pagerank = self.pagerank(n, offsets, targets)
+        return {
+            "node_of": node_of,
+            "offsets": offsets,
+            "targets": targets,
+            "depth": depth,
+            "in_degree": in_degree,
+            "pagerank": pagerank,
+            "range": (min(pagerank), max(pagerank)) if n else (0.0, 0.0),
+            "roots": set(roots),
+        }
+
+    def pagerank(self, n, offsets, targets):
+        if not n:
+            return array("d")
+        damping = self.damping
+        out_degree = [offsets[i + 1] - offsets[i] for i in range(n)]
+        dangling = [i for i in range(n) if not out_degree[i]]
+        rank = [1.0 / n] * n
+        for _ in range(self.iterations):
+            # Pages without links share their rank with every page
+            base = (1.0 - damping) / n + damping * sum(rank[i] for i in dangling) / n
+            ranks = [base] * n
+            for node in range(n):
+                if out_degree[node]:
+                    share = damping * rank[node] / out_degree[node]
+                    for target in targets[offsets[node]:offsets[node + 1]]:
+                        ranks[target] += share
+            change = sum(abs(a - b) for a, b in zip(ranks, rank))
+            rank = ranks
+            if change < self.tolerance:
+                break
+        return array("d", rank)
+
+    def priority(self, url):
+        # PageRank on a log scale between min_priority and 1.0, or None for
+        # a URL that was not parsed
+        url_id = self.urls.get(url)
+        result = self.analysis()
+        if url_id is None or url_id >= len(result["node_of"]) or not result["node_of"][url_id]:
+            return None
+        low, high = result["range"]
+        rank = result["pagerank"][result["node_of"][url_id] - 1]
+        scale = math.log(rank / low) / math.log(high / low) if high > low else 1.0
+        return self.min_priority + (1.0 - self.min_priority) * scale
+
+    def write(self, path):
+        # link-graph.bin: magic and a JSON header line, the GRAPH_COLUMNS
+        # arrays one after the other, then the page URLs one per line
+        result = self.analysis()
+        columns = [(name, result[name]) for name, _ in GRAPH_COLUMNS]
+        header = {
+            "version": GRAPH_VERSION,
+            "byteorder": sys.byteorder,
+            "pages": len(self.rows),
+            "links": len(result["targets"]),
+            "columns": [[name, values.typecode, values.itemsize, len(values)] for name, values in columns],
+        }
+        with open(path, "wb") as f:
+            f.write(GRAPH_MAGIC + json.dumps(header).encode("utf-8") + b"\n")
+            for _, values in columns:
+                values.tofile(f)
+            for url_id in self.rows:
+                f.write(self.urls.url(url_id).encode("utf-8", "surrogatepass") + b"\n")
+
+    def write_report(self, path, top=LINK_GRAPH_TOP):
+        result = self.analysis()
+        depth, in_degree, pagerank = result["depth"], result["in_degree"], result["pagerank"]
+        urls = [self.urls.url(url_id) for url_id in self.rows]
+        by_depth = Counter(depth)
+        orphans = sorted(urls[i] for i in range(len(urls)) if not in_degree[i] and i not in result["roots"])
+        best = sorted(range(len(self.rows)), key=lambda i: -pagerank[i])[:top]
+        report = {
+            "pages": len(self.rows),
+            "links": len(result["targets"]),
+            "max_depth": max(depth, default=-1),
+            "pages_by_depth": {str(d): count for d, count in sorted(by_depth.items()) if d >= 0},
+            "unreachable_from_start": by_depth[-1],
+            "orphans": orphans,
+            "top_pagerank": [
+                {"url": urls[i], "pagerank": round(pagerank[i], 8), "in_degree": in_degree[i], "depth": depth[i]}
+                for i in best
+            ],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return len(orphans)
+
+
+def read_graph(path):
+    # Columns of a link-graph.bin as arrays, plus the page URLs
+    with open(path, "rb") as f:
+        if f.read(len(GRAPH_MAGIC)) != GRAPH_MAGIC:
+            raise ValueError(f"Not a link graph file: {path}")
+        header = json.loads(f.readline())
+        graph = {}
+        for name, typecode, itemsize, length in header["columns"]:
+            values = array(typecode)
+            values.frombytes(f.read(itemsize * length))
+            if header["byteorder"] != sys.byteorder:
+                values.byteswap()
+            graph[name] = values
+        graph["urls"] = f.read().decode("utf-8", "surrogatepass").splitlines()
+    return graph
@@ -0,0 +1,301 @@
+# spidercore/metrics.py
+
+import os
+import json
+import time
+import bisect
+import logging
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.asyncio import create_looping_call
+from scrapy.utils.httpobj import urlparse_cached
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a fast local parse to a slow remote host
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self, extra):
+        for key, value in self.values.items():
+            yield f"{self.name}{label_text(extra + key)} {value}"
+
+    def snapshot(self):
+        return [{"labels": dict(key), "value": value} for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram:
+    # Cumulative-bucket histogram in the Prometheus sense: per label set a
+    # count per upper bound, plus the total count and sum
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+        series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self, extra):
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series["counts"]):
+                cumulative += count
+                yield f"{self.name}_bucket{label_text(extra + key + (('le', bound),))} {cumulative}"
+            yield f"{self.name}_sum{label_text(extra + key)} {series['sum']}"
+            yield f"{self.name}_count{label_text(extra + key)} {series['count']}"
+
+    def quantile(self, series, q):
+        # Upper bound of the bucket holding the q-th observation
+        rank = q * series["count"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + (None,), series["counts"]):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        return [
+            {
+                "labels": dict(key),
+                "count": series["count"],
+                "sum": round(series["sum"], 6),
+                "p50": self.quantile(series, 0.5),
+                "p90": self.quantile(series, 0.9),
+                "p99": self.quantile(series, 0.99),
+            }
+            for key, series in self.series.items() if series["count"]
+        ]
+
+
+class CrawlMetrics:
+    # Scrapy extension recording per-stage latencies and crawl counters.
+    # Fetch latency and bytes are labelled by host so slow hosts stand out;
+    # the spider and SpidercoreSpiderMiddleware report parse, extraction and
+    # export times through observe(). Metrics are served in Prometheus text
+    # format on METRICS_PORT (when set) and written to metrics.json in the
+    # spider's output directory every METRICS_SNAPSHOT_INTERVAL seconds;
+    # distributed workers use METRICS_PORT + their index and
+    # metrics.worker-N.json.
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool("METRICS_ENABLED", True):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.port = settings.getint("METRICS_PORT", 0)
+        self.host = settings.get("METRICS_HOST", "127.0.0.1")
+        self.interval = settings.getfloat("METRICS_SNAPSHOT_INTERVAL", 10.0)
+        self.site = None
+        self.snapshot_path = None
+        self.task = None
+        self.started = time.monotonic()
+
+        self.histograms = {
+            "fetch_seconds": Histogram("spidercore_fetch_seconds", "Download latency per response"),
+            "parse_seconds": Histogram("spidercore_parse_seconds", "CPU time per spider callback"),
+            "extract_seconds": Histogram("spidercore_extract_seconds", "Link extraction time per page"),
+            "export_seconds": Histogram("spidercore_export_seconds", "Time to hand one record to the exporter"),
+        }
+        self.counters = {
+            "responses": Counter("spidercore_responses_total", "Responses received"),
+            "bytes": Counter("spidercore_response_bytes_total", "Response body bytes received"),
+            "pages": Counter("spidercore_pages_total", "Pages parsed"),
+        }
+        self.gauges = {
+            "queue": Gauge("spidercore_queue_depth", "Requests waiting in the scheduler"),
+            "in_flight": Gauge("spidercore_requests_in_flight", "Requests being downloaded"),
+            "scheduled": Gauge("spidercore_requests_scheduled", "Requests accepted by the scheduler"),
+            "dedup": Gauge("spidercore_dedup_filtered", "Requests dropped as duplicates"),
+            "dedup_ratio": Gauge("spidercore_dedup_hit_ratio", "Share of requests dropped as duplicates"),
+            "pages_per_second": Gauge("spidercore_pages_per_second", "Pages parsed per second since the start"),
+        }
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        metrics = cls(crawler)
+        crawler.signals.connect(metrics.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(metrics.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(metrics.response_received, signal=signals.response_received)
+        return metrics
+
+    def spider_opened(self, spider):
+        self.site = getattr(spider, "domain", spider.name)
+        output_dir = getattr(spider, "output_dir", None)
+        if getattr(spider, "frontier", None):
+            # Distributed workers share the output directory and the
+            # command line: one snapshot and one port (METRICS_PORT + index)
+            # each
+            suffix = f".worker-{spider.worker}"
+            if self.port:
+                self.port += spider.worker
+        else:
+            suffix = ""
+        if output_dir is not None:
+            self.snapshot_path = output_dir / f"metrics{suffix}.json"
+        spider.metrics = self
+        if self.port:
+            MetricsServer.register(self.host, self.port, self)
+        if self.snapshot_path and self.interval:
+            self.task = create_looping_call(self.write_snapshot)
+            self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        if self.snapshot_path:
+            self.write_snapshot()
+        if self.port:
+            MetricsServer.unregister(self.host, self.port, self)
+
+    def response_received(self, response, request, spider):
+        host = urlparse_cached(request).netloc
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self.histograms["fetch_seconds"].observe(latency, host=host)
+        self.counters["responses"].inc(host=host, status=response.status)
+        self.counters["bytes"].inc(len(response.body), host=host)
+
+    def observe(self, name, value, **labels):
+        self.histograms[name].observe(value, **labels)
+
+    def inc(self, name, amount=1, **labels):
+        self.counters[name].inc(amount, **labels)
+
+    def collect(self):
+        # Gauges derived from the engine and the stats at read time
+        scheduled = self.stats.get_value("scheduler/enqueued", 0)
+        dequeued = self.stats.get_value("scheduler/dequeued", 0)
+        filtered = self.stats.get_value("dupefilter/filtered", 0)
+        engine = self.crawler.engine
+        self.gauges["queue"].set(max(0, scheduled - dequeued))
+        self.gauges["in_flight"].set(len(engine.downloader.active) if engine and engine.downloader else 0)
+        self.gauges["scheduled"].set(scheduled)
+        self.gauges["dedup"].set(filtered)
+        self.gauges["dedup_ratio"].set(round(filtered / (scheduled + filtered), 4) if scheduled + filtered else 0.0)
+        pages = sum(self.counters["pages"].values.values())
+        elapsed = time.monotonic() - self.started
+        self.gauges["pages_per_second"].set(round(pages / elapsed, 2) if elapsed else 0.0)
+
+    def metric_families(self):
+        return [*self.histograms.values(), *self.counters.values(), *self.gauges.values()]
+
+    def render(self):
+        self.collect()
+        extra = (("site", self.site),)
+        for metric in self.metric_families():
+            yield metric, list(metric.render(extra))
+
+    def write_snapshot(self):
+        self.collect()
+        snapshot = {
+            "site": self.site,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "elapsed_seconds": round(time.monotonic() - self.started, 3),
+            "metrics": {metric.name: metric.snapshot() for metric in self.metric_families()},
+        }
+        # Written next to the target and renamed so readers never see half a file
+        partial = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        try:
+            partial.write_text(json.dumps(snapshot, indent=2), encoding="utf-8")
+            os.replace(partial, self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"[!] Unable to write metrics snapshot: {e}")
+
+
+class MetricsServer:
+    # One HTTP listener per host:port shared by every crawler of the
+    # process, so a --seeds batch exposes all of its sites on one endpoint
+    servers = {}
+
+    def __init__(self, host, port):
+        from twisted.internet import reactor
+        from twisted.web import resource, server
+
+        owner = self
+
+        class MetricsResource(resource.Resource):
+            isLeaf = True
+
+            def render_GET(self, request):
+                request.setHeader(b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+                return owner.render().encode("utf-8")
+
+        self.metrics = []
+        self.listener = reactor.listenTCP(port, server.Site(MetricsResource()), interface=host)
+        logger.info(f"[*] Metrics available at http://{host}:{port}/metrics")
+
+    @classmethod
+    def register(cls, host, port, metrics):
+        server = cls.servers.get((host, port))
+        if server is None:
+            try:
+                server = cls.servers[(host, port)] = cls(host, port)
+            except Exception as e:
+                logger.warning(f"[!] Unable to serve metrics on {host}:{port}: {e}")
+                return
+        server.metrics.append(metrics)
+
+    @classmethod
+    def unregister(cls, host, port, metrics):
+        server = cls.servers.get((host, port))
+        if server is None or metrics not in server.metrics:
+            return
+        server.metrics.remove(metrics)
+        if not server.metrics:
+            server.listener.stopListening()
+            del cls.servers[(host, port)]
+
+    def render(self):
+        # Families with the same name from several crawlers are grouped
+        # under a single HELP/TYPE header, as the text format requires
+        families = {}
+        for metrics in self.metrics:
+            for metric, lines in metrics.render():
+                family = families.setdefault(metric.name, (metric, []))
+                family[1].extend(lines)
+        out = []
+        for name, (metric, lines) in families.items():
+            out.append(f"# HELP {name} {metric.help}")
+            out.append(f"# TYPE {name} {metric.kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
@@ -1,48 +1,378 @@
-# spidercore/middlewares.py
-
-from scrapy import signals
-
-class SpidercoreSpiderMiddleware:
-    @classmethod
-    def from_crawler(cls, crawler):
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
-
-    # This method MUST match this exact async signature in Scrapy 2.13+
-    async def process_start(self, start_requests, spider):
-        for request in start_requests:
-            yield request
-
-    def process_spider_input(self, response, spider):
-        return None
-
-    def process_spider_output(self, response, result, spider):
-        for i in result:
-            yield i
-
-    def process_spider_exception(self, response, exception, spider):
-        pass
-
-    def spider_opened(self, spider):
-        spider.logger.info(f"Spider opened: {spider.name}")
-
-
-class SpidercoreDownloaderMiddleware:
-    @classmethod
-    def from_crawler(cls, crawler):
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
-
-    def process_request(self, request, spider):
-        return None
-
-    def process_response(self, request, response, spider):
-        return response
-
-    def process_exception(self, request, exception, spider):
-        pass
-
-    def spider_opened(self, spider):
-        spider.logger.info(f"Spider opened: {spider.name}")
+# spidercore/middlewares.py
+
+import time
+from functools import wraps
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest
+from scrapy.downloadermiddlewares.robotstxt import RobotsTxtMiddleware
+from scrapy.utils.misc import load_object
+from spidercore.assets import ASSET_SLOT, ASSET_CONCURRENCY, ASSET_DELAY, ASSET_BANDWIDTH
+
+class SpidercoreSpiderMiddleware:
+    # Adds the CPU time spent inside each spider callback to the stats as
+    # callback_cpu/<name>, next to callback_count/<name>, and to the
+    # parse_seconds histogram when CrawlMetrics is enabled. Sits closest to
+    # the spider so only the callback's own work is measured, not that of
+    # the middlewares consuming its output. Generator callbacks are timed
+    # while their output is consumed; callbacks that do their work when
+    # called, like download_file, are wrapped with timed_callback and timed
+    # by run() instead. Under --profile, the calls the CrawlProfiler
+    # samples also run under its cProfile profile.
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        return s
+
+    def spider_opened(self, spider):
+        spider.callback_timing = self
+
+    def record(self, name, seconds):
+        self.stats.inc_value(f"callback_cpu/{name}", seconds, start=0.0)
+        metrics = getattr(self.crawler.spider, "metrics", None)
+        if metrics:
+            metrics.observe("parse_seconds", seconds, callback=name)
+
+    def sample(self, name):
+        self.stats.inc_value(f"callback_count/{name}")
+        profiler = getattr(self.crawler.spider, "profiler", None)
+        return (profiler, profiler.sample(name)) if profiler else (None, None)
+
+    def run(self, name, call):
+        profiler, profile = self.sample(name)
+        started = time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            return call()
+        finally:
+            if profile:
+                profile.disable()
+                profiler.release(profile)
+            self.record(name, time.process_time() - started)
+
+    def process_spider_output(self, response, result):
+        if timed_when_called(response):
+            yield from result
+            return
+        name = callback_name(response)
+        profiler, profile = self.sample(name)
+        iterator = iter(result)
+        spent = 0.0
+        try:
+            while True:
+                started = time.process_time()
+                if profile:
+                    profile.enable()
+                try:
+                    output = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    if profile:
+                        profile.disable()
+                    spent += time.process_time() - started
+                yield output
+        finally:
+            self.record(name, spent)
+            if profile:
+                profiler.release(profile)
+
+    async def process_spider_output_async(self, response, result):
+        if timed_when_called(response):
+            async for output in result:
+                yield output
+            return
+        name = callback_name(response)
+        profiler, profile = self.sample(name)
+        iterator = result.__aiter__()
+        spent = 0.0
+        try:
+            while True:
+                started = time.process_time()
+                if profile:
+                    profile.enable()
+                try:
+                    output = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    if profile:
+                        profile.disable()
+                    spent += time.process_time() - started
+                yield output
+        finally:
+            self.record(name, spent)
+            if profile:
+                profiler.release(profile)
+
+
+def timed_callback(method):
+    # For spider methods that do their work when called rather than in the
+    # output they return, which process_spider_output never gets to time
+    @wraps(method)
+    def wrapper(spider, *args, **kwargs):
+        timing = getattr(spider, "callback_timing", None)
+        if timing is None:
+            return method(spider, *args, **kwargs)
+        return timing.run(method.__name__, lambda: method(spider, *args, **kwargs))
+
+    wrapper.timed_when_called = True
+    return wrapper
+
+
+def timed_when_called(response):
+    callback = response.request.callback if response.request else None
+    return getattr(callback, "timed_when_called", False)
+
+
+def callback_name(response):
+    callback = response.request.callback if response.request else None
+    return getattr(callback, "__name__", "parse")
+
+
+class SpidercoreDownloaderMiddleware:
+    # Adapts every download slot (one per host) to how that host behaves
+    # instead of relying on a fixed DOWNLOAD_DELAY. Fast responses first
+    # shorten the delay, then widen the slot by one concurrent request per
+    # window of responses; slow ones narrow it multiplicatively. 429/503 replies and
+    # timeouts drop the slot to its floor and wait out Retry-After. All
+    # changes stay within the ADAPTIVE_* floors and ceilings.
+    #
+    # Asset downloads share the ASSET_SLOT slot, set up here with its own
+    # concurrency and delay. After a back-off its delay halves with every
+    # chunk until it is back at the lane's own, as page slots recover in
+    # adapt(). Under an ASSET_BANDWIDTH cap the delay follows the size of
+    # the last chunk, so chunks start no faster than the cap.
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.enabled = settings.getbool("ADAPTIVE_CONCURRENCY_ENABLED", True)
+        self.min_delay = settings.getfloat("ADAPTIVE_MIN_DELAY", 0.0)
+        self.max_delay = settings.getfloat("ADAPTIVE_MAX_DELAY", 60.0)
+        self.min_concurrency = settings.getint("ADAPTIVE_MIN_CONCURRENCY", 1)
+        self.max_concurrency = settings.getint("ADAPTIVE_MAX_CONCURRENCY", 16)
+        self.target_latency = settings.getfloat("ADAPTIVE_TARGET_LATENCY", 1.0)
+        # Network failures worth backing off for are the ones worth retrying
+        self.exceptions = tuple(
+            load_object(e) if isinstance(e, str) else e for e in settings.getlist("RETRY_EXCEPTIONS")
+        )
+        self.latency = {}
+        self.window = {}
+        self.assets_backed_off = False
+        self.asset_concurrency = max(1, settings.getint("ASSET_CONCURRENCY", ASSET_CONCURRENCY))
+        self.asset_delay = settings.getfloat("ASSET_DELAY", ASSET_DELAY)
+        self.asset_bandwidth = settings.getint("ASSET_BANDWIDTH", ASSET_BANDWIDTH)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        return s
+
+    def process_request(self, request):
+        return None
+
+    def process_response(self, request, response):
+        slot_key, slot = self.get_slot(request)
+        if response.status in (429, 503):
+            if slot is not None:
+                self.back_off(slot_key, slot, f"HTTP {response.status}", retry_after(response))
+        elif "asset_url" in request.meta:
+            # Asset chunk latency measures bandwidth, not responsiveness
+            self.pace_assets(len(response.body))
+        elif slot is not None:
+            latency = request.meta.get("download_latency")
+            if latency is not None:
+                self.adapt(slot_key, slot, latency)
+        return response
+
+    def pace_assets(self, size):
+        # The lane's own delay, stretched to keep under the bandwidth cap;
+        # a backed-off slot gets there one halving per chunk
+        slot = self.crawler.engine.downloader.slots.get(ASSET_SLOT) if self.crawler.engine else None
+        if slot is None:
+            return
+        delay = self.asset_delay
+        if self.asset_bandwidth:
+            delay = max(delay, size / self.asset_bandwidth)
+        if self.assets_backed_off:
+            halved = slot.delay / 2
+            if halved > max(delay, 0.05):
+                slot.delay = halved
+                return
+            self.assets_backed_off = False
+        slot.concurrency = self.asset_concurrency
+        slot.delay = delay
+
+    def process_exception(self, request, exception):
+        slot_key, slot = self.get_slot(request)
+        if slot is not None and isinstance(exception, self.exceptions):
+            self.back_off(slot_key, slot, type(exception).__name__)
+
+    def get_slot(self, request):
+        if not self.enabled or self.crawler.engine is None:
+            return None, None
+        slot_key = request.meta.get("download_slot")
+        return slot_key, self.crawler.engine.downloader.slots.get(slot_key)
+
+    def adapt(self, slot_key, slot, latency):
+        average = self.latency.get(slot_key, latency) * 0.8 + latency * 0.2
+        self.latency[slot_key] = average
+
+        if self.cooling(slot_key):
+            return
+
+        if average > 2 * self.target_latency:
+            slot.concurrency = max(self.min_concurrency, slot.concurrency // 2)
+            slot.delay = min(self.max_delay, max(slot.delay * 1.5, self.target_latency / 4))
+            self.window[slot_key] = -len(slot.active)
+            return
+        if average > self.target_latency:
+            return
+
+        # A slot with a delay sends one request at a time, so shorten the
+        # delay on every fast response before widening the slot
+        if slot.delay > self.min_delay:
+            delay = slot.delay / 2
+            slot.delay = max(self.min_delay, delay if delay >= 0.05 else 0.0)
+            return
+
+        # One more concurrent request per window of `concurrency` fast responses
+        self.window[slot_key] = self.window.get(slot_key, 0) + 1
+        if self.window[slot_key] < slot.concurrency:
+            return
+        self.window[slot_key] = 0
+        slot.concurrency = min(self.max_concurrency, slot.concurrency + 1)
+
+    def cooling(self, slot_key):
+        # Answers to requests already in the slot when it last slowed down
+        # were paced the old way; judging each of them again would stretch
+        # the delay to its ceiling on one burst of slow replies or errors
+        window = self.window.get(slot_key, 0)
+        if window < 0:
+            self.window[slot_key] = window + 1
+            return True
+        return False
+
+    def back_off(self, slot_key, slot, reason, wait=None):
+        if wait is None and self.cooling(slot_key):
+            return
+        delay = wait if wait is not None else max(slot.delay * 2, 1.0)
+        slot.delay = min(self.max_delay, max(self.min_delay, delay))
+        slot.concurrency = self.min_concurrency
+        self.window[slot_key] = -len(slot.active)
+        if slot_key == ASSET_SLOT:
+            self.assets_backed_off = True
+        self.crawler.spider.logger.info(
+            f"[!] Backing off {slot_key} ({reason}): delay {slot.delay:.2f}s, concurrency {slot.concurrency}"
+        )
+
+    def spider_opened(self, spider):
+        # DOWNLOAD_SLOTS may still configure the asset slot itself
+        self.crawler.engine.downloader.per_slot_settings.setdefault(
+            ASSET_SLOT, {"concurrency": self.asset_concurrency, "delay": self.asset_delay, "jitter": 0},
+        )
+        spider.logger.info(f"Spider opened: {spider.name}")
+
+
+def retry_after(response):
+    # Seconds to wait from a Retry-After header (delta-seconds or HTTP date)
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    value = value.decode("latin-1").strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class ConditionalGetMiddleware:
+    # Adds If-None-Match / If-Modified-Since from the spider's crawl history
+    # so unchanged URLs come back as an empty 304. Does nothing unless the
+    # spider runs with --incremental.
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_request(self, request):
+        history = getattr(self.crawler.spider, "history", None)
+        if history is None:
+            return None
+        # Validators copied over from a redirected request belong to another URL
+        request.headers.pop("If-None-Match", None)
+        request.headers.pop("If-Modified-Since", None)
+        etag, last_modified = history.validators(request.url)
+        if not etag and not last_modified:
+            return None
+        if etag:
+            request.headers["If-None-Match"] = etag
+        if last_modified:
+            request.headers["If-Modified-Since"] = last_modified
+        # Let the 304 through HttpErrorMiddleware to the callback
+        handled = request.meta.get("handle_httpstatus_list", [])
+        request.meta["handle_httpstatus_list"] = [*handled, 304]
+        return None
+
+
+class ArchiveMiddleware:
+    # Sits next to the downloader: with --archive it records every
+    # response as it came off the wire (still compressed, before
+    # redirects are followed); with --replay it answers every request from
+    # the archive instead, and drops requests that were never archived.
+    # The rest of the middlewares, the spider and the pipelines run as in
+    # a live crawl. Assets are stored by AssetStore, and an --incremental
+    # 304 has no page to archive.
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_request(self, request):
+        replay = getattr(self.crawler.spider, "replay", None)
+        if replay is None:
+            return None
+        response = replay.response_for(request)
+        if response is None:
+            self.crawler.stats.inc_value("archive/missing")
+            raise IgnoreRequest(f"Not in the archive: {request.method} {request.url}")
+        self.crawler.stats.inc_value("archive/replayed")
+        return response
+
+    def process_response(self, request, response):
+        archive = getattr(self.crawler.spider, "archive", None)
+        if archive is None or "asset_url" in request.meta or "archived" in response.flags:
+            return response
+        if response.status != 304:
+            archive.write(request, response)
+            self.crawler.stats.inc_value("archive/records")
+        return response
+
+
+class SharedRobotsTxtMiddleware(RobotsTxtMiddleware):
+    # RobotsTxtMiddleware with one parser cache for the whole process. A
+    # --seeds batch has one crawler per domain, so this pays off for the
+    # hosts several sites reach, like shared asset hosts and the external
+    # links of --check-links: their robots.txt is fetched once
+    parsers = {}
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self._parsers = self.parsers
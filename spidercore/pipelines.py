@@ -1,6 +1,183 @@
-# spidercore/pipelines.py
-
-class SpidercorePipeline:
-    def process_item(self, item, spider):
-        # For future: clean item, add metadata, save somewhere
-        return item
+# spidercore/pipelines.py
+
+import time
+import logging
+from abc import ABC, abstractmethod
+from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+from spidercore.items import SitemapItem
+from spidercore.state import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+PAGE_STORE_BATCH = 1000
+PARQUET_ROW_GROUP = 50000
+PARQUET_COMPRESSION = "zstd"
+
+# Columns of the page stores, in SitemapItem order
+PAGE_COLUMNS = list(SitemapItem.fields)
+INTEGER_COLUMNS = {"depth", "word_count", "link_count"}
+
+
+class SpidercorePipeline:
+    # Hands every page record to the spider's --export file and, for
+    # resumable or distributed crawls, to the crawl state or the frontier
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_item(self, item):
+        spider = self.crawler.spider
+        started = time.perf_counter()
+        entry = ItemAdapter(item).asdict()
+        if spider.exporter:
+            spider.exporter.write(entry)
+        if spider.frontier:
+            spider.frontier.add_page(entry)
+        if spider.state:
+            spider.state.add_page(entry)
+        spider.observe("export_seconds", started)
+        return item
+
+
+class PageStorePipeline(ABC):
+    # Base for the page stores enabled through PAGE_STORES. Rows are
+    # buffered and handed to write_rows() batch_size at a time, between
+    # open() and close(). A resumed crawl starts by replaying the pages
+    # stored in its crawl state.
+    store = ""
+    batch_setting = ""
+    default_batch = PAGE_STORE_BATCH
+
+    def __init__(self, crawler):
+        if self.store not in crawler.settings.getlist("PAGE_STORES"):
+            raise NotConfigured
+        self.crawler = crawler
+        self.batch_size = crawler.settings.getint(self.batch_setting, self.default_batch)
+        self.rows = []
+        self.count = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def output_path(self, name, suffix):
+        # Distributed workers write one file each, like unusual-links.txt
+        spider = self.crawler.spider
+        worker = f".worker-{spider.worker}" if spider.frontier else ""
+        return spider.output_dir / f"{name}{worker}.{suffix}"
+
+    def open_spider(self):
+        self.open()
+        spider = self.crawler.spider
+        if spider.state:
+            for entry in spider.state.iter_pages():
+                self.add(entry)
+
+    def process_item(self, item):
+        self.add(ItemAdapter(item).asdict())
+        return item
+
+    def add(self, entry):
+        self.rows.append(tuple(entry.get(column) for column in PAGE_COLUMNS))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.write_rows(self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+
+    def close_spider(self):
+        self.flush()
+        self.close()
+        logger.info(f"[✓] {self.count} pages stored in: {self.path}")
+
+    @abstractmethod
+    def open(self):
+        ...
+
+    @abstractmethod
+    def write_rows(self, rows):
+        ...
+
+    @abstractmethod
+    def close(self):
+        ...
+
+
+class PageDatabase(SqliteStore):
+    schema = "CREATE TABLE IF NOT EXISTS pages ({});".format(", ".join(
+        f"{column} INTEGER" if column in INTEGER_COLUMNS
+        else f"{column} TEXT PRIMARY KEY" if column == "url"
+        else f"{column} TEXT"
+        for column in PAGE_COLUMNS
+    ))
+
+    def clear(self):
+        with self.db:
+            self.db.execute("DELETE FROM pages")
+
+    def replace_all(self, rows):
+        # One transaction and one prepared statement per batch
+        placeholders = ", ".join("?" for _ in PAGE_COLUMNS)
+        with self.db:
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO pages ({', '.join(PAGE_COLUMNS)}) VALUES ({placeholders})",
+                rows,
+            )
+
+
+class SqlitePagesPipeline(PageStorePipeline):
+    # pages.sqlite3 with one row per page, queryable while the crawl runs
+    store = "sqlite"
+    batch_setting = "PAGE_STORE_BATCH"
+
+    def open(self):
+        self.path = self.output_path("pages", "sqlite3")
+        self.db = PageDatabase(self.path)
+        self.db.clear()
+
+    def write_rows(self, rows):
+        self.db.replace_all(rows)
+
+    def close(self):
+        self.db.close()
+
+
+class ParquetPagesPipeline(PageStorePipeline):
+    # pages.parquet, one compressed row group per batch. Needs pyarrow.
+    store = "parquet"
+    batch_setting = "PARQUET_ROW_GROUP"
+    default_batch = PARQUET_ROW_GROUP
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            logger.warning("[!] Parquet output needs pyarrow (pip install pyarrow), skipping it")
+            raise NotConfigured
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.compression = crawler.settings.get("PARQUET_COMPRESSION", PARQUET_COMPRESSION)
+        self.schema = pyarrow.schema([
+            (column, pyarrow.int32() if column in INTEGER_COLUMNS else pyarrow.string())
+            for column in PAGE_COLUMNS
+        ])
+
+    def open(self):
+        self.path = self.output_path("pages", "parquet")
+        self.writer = self.pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+
+    def write_rows(self, rows):
+        columns = [list(column) for column in zip(*rows)]
+        self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,149 @@
+# spidercore/priority.py
+
+import re
+from collections import Counter
+from urllib.parse import urlsplit
+from scrapy.core.scheduler import Scheduler
+from spidercore.assets import AssetLane, ASSET_CONCURRENCY
+
+# Request priorities of page links: PRIORITY_MATCH for a link matching
+# --filter-url/--pattern, PRIORITY_HUB for a --follow or hub link, plus
+# PRIORITY_ANCHOR per anchor word and PRIORITY_PATH per leading directory
+# shared with pages that matched earlier, minus PRIORITY_DEPTH per level
+PRIORITY_MATCH = 100
+PRIORITY_HUB = 30
+PRIORITY_ANCHOR = 5
+PRIORITY_PATH = 5
+PRIORITY_DEPTH = 10
+# Caps on the anchor words and shared directories that count
+PRIORITY_MAX_ANCHOR_WORDS = 4
+PRIORITY_MAX_PATH_SEGMENTS = 4
+
+TOKEN_RE = re.compile(r"[^\W\d_]{3,}", re.UNICODE)
+
+
+def tokens(text):
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+def directories(url):
+    # "/a/b/c.html" -> ["/a/", "/a/b/"]
+    path = urlsplit(url).path
+    parts = path.split("/")[1:-1]
+    return ["/" + "/".join(parts[:i + 1]) + "/" for i in range(min(len(parts), PRIORITY_MAX_PATH_SEGMENTS))]
+
+
+class LinkScorer:
+    # Ranks links so a limited page budget goes to the pages the rules ask
+    # for first. Without record rules every page counts, and links are
+    # simply taken breadth-first.
+    def __init__(
+        self,
+        rules,
+        filter=None,
+        pattern=None,
+        match=PRIORITY_MATCH,
+        hub=PRIORITY_HUB,
+        anchor=PRIORITY_ANCHOR,
+        path=PRIORITY_PATH,
+        depth=PRIORITY_DEPTH,
+        floor=None,
+    ):
+        self.rules = rules
+        self.weights = (match, hub, anchor, path, depth)
+        # Scores never drop below `floor`: deep pages tie there instead of
+        # sinking under the asset requests
+        self.floor = floor
+        self.targeted = bool(rules.record)
+        # Words of the rules themselves, then of the pages that matched them
+        self.words = tokens(" ".join(p for p in (filter, pattern) if p))
+        self.paths = set()
+
+    def score(self, url, depth=0, anchor=""):
+        score = self.raw_score(url, depth, anchor)
+        return score if self.floor is None else max(score, self.floor)
+
+    def raw_score(self, url, depth, anchor):
+        match, hub, anchor_weight, path, depth_weight = self.weights
+        score = -depth_weight * depth
+        if not self.targeted:
+            return score
+        if self.rules.should_record(url):
+            score += match
+        elif self.rules.is_hub(url):
+            score += hub
+        if anchor and self.words:
+            score += anchor_weight * min(len(tokens(anchor) & self.words), PRIORITY_MAX_ANCHOR_WORDS)
+        if self.paths:
+            score += path * sum(1 for d in directories(url) if d in self.paths)
+        return score
+
+    def learn(self, url, title=""):
+        # A page matched the record rules: links near it and worded like it
+        # are promising too
+        if not self.targeted:
+            return
+        self.paths.update(directories(url))
+        if title:
+            self.words |= tokens(title)
+
+
+class PageBudget:
+    # Counts page requests as they leave the scheduler for the downloader,
+    # so a budget of N never lets more than N pages start downloading.
+    # Redirects and retries of a page already counted are free; asset and
+    # link-check requests are not pages. Under --replay, pages missing from
+    # the archive are free too, ArchiveMiddleware drops them.
+    def __init__(self, limit, used=0):
+        self.limit = limit
+        self.used = used
+
+    def is_page(self, request, spider):
+        return request.callback is None or request.callback == spider.parse
+
+    def counts(self, request, spider):
+        # Whether the request takes a page from the budget
+        if not self.is_page(request, spider):
+            return False
+        if "redirect_times" in request.meta or "retry_times" in request.meta:
+            return False
+        replay = getattr(spider, "replay", None)
+        return replay is None or request in replay
+
+    def admit(self, request, spider):
+        if not self.counts(request, spider):
+            return True
+        if self.used >= self.limit:
+            return False
+        self.used += 1
+        return True
+
+
+class PriorityScheduler(Scheduler):
+    # Scrapy's scheduler, best priority first, with the spider's max_pages
+    # enforced as a PageBudget: once spent, queued page requests are
+    # dropped instead of downloaded. Asset requests go through an
+    # AssetLane; one that has to wait for the lane is set aside and the
+    # next request taken instead.
+    def open(self, spider):
+        self.budget = PageBudget(spider.max_pages, len(spider.visited_urls))
+        self.lane = AssetLane(self.crawler, self.crawler.settings.getint("ASSET_CONCURRENCY", ASSET_CONCURRENCY))
+        return super().open(spider)
+
+    def next_request(self):
+        request = self.lane.release()
+        if request is not None:
+            return request
+        while True:
+            request = super().next_request()
+            if request is None:
+                return None
+            if self.lane.hold(request):
+                # Set aside; a page may still be queued behind it
+                continue
+            if self.budget.admit(request, self.spider):
+                return request
+            self.stats.inc_value("spidercore/over_budget")
+
+    def __len__(self):
+        return super().__len__() + len(self.lane)
@@ -0,0 +1,255 @@
+# spidercore/profiling.py
+
+import os
+import json
+import time
+import signal
+import pstats
+import cProfile
+import logging
+import tracemalloc
+from collections import Counter
+from functools import wraps
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+# cProfile one call in PROFILE_SAMPLE_EVERY per spider callback
+PROFILE_SAMPLE_EVERY = 10
+# tracemalloc snapshots after these many pages, and one at the end
+PROFILE_MEMORY_AT = [100, 1000, 10000]
+PROFILE_MEMORY_TOP = 25
+PROFILE_MEMORY_FRAMES = 1
+
+# Component hooks timed per component, by manager
+DOWNLOADER_HOOKS = ("process_request", "process_response", "process_exception")
+SPIDER_HOOKS = ("process_spider_input", "process_spider_exception")
+PIPELINE_HOOKS = ("process_item", "close_spider")
+EXPORTER_METHODS = ("write", "close")
+
+# Stack samples are taken every PROFILE_STACK_INTERVAL seconds of wall
+# time, at most MAX_STACK_DEPTH frames deep
+PROFILE_STACK_INTERVAL = 0.005
+MAX_STACK_DEPTH = 100
+
+# Profilers of the crawls running in this process; the stack sampler and
+# tracemalloc run while there is one
+ACTIVE = []
+
+
+def sample_stack(signum, frame):
+    # SIGALRM handler: counts the main thread's current stack, outermost
+    # frame first, in every active profiler
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack = ";".join(reversed(names))
+    for profiler in ACTIVE:
+        profiler.stacks[stack] += 1
+
+
+def start_sampling(profiler, interval, frames):
+    if not ACTIVE:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        if interval and hasattr(signal, "setitimer"):
+            try:
+                signal.signal(signal.SIGALRM, sample_stack)
+                signal.setitimer(signal.ITIMER_REAL, interval, interval)
+            except ValueError:
+                # Signals can only be handled in the main thread
+                logger.warning("[!] Stack sampling needs the crawl to run in the main thread")
+    ACTIVE.append(profiler)
+
+
+def stop_sampling(profiler):
+    if profiler not in ACTIVE:
+        return
+    ACTIVE.remove(profiler)
+    if not ACTIVE:
+        if hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        tracemalloc.stop()
+
+
+class CrawlProfiler:
+    # Scrapy extension behind run.py --profile. SpidercoreSpiderMiddleware
+    # runs one callback call in every PROFILE_SAMPLE_EVERY under cProfile;
+    # every downloader middleware, spider middleware input hook, item
+    # pipeline and the --export exporter is timed; the whole process is
+    # stack-sampled on a wall-clock timer, so time spent waiting for the
+    # network shows up as the reactor's poll; tracemalloc snapshots are
+    # taken at the PROFILE_MEMORY_AT page counts. When the engine stops a
+    # profile/ directory is written next to the sitemap:
+    #   callbacks.pstats    merged callback profile (python -m pstats)
+    #   stacks.collapsed    stack samples for flamegraph.pl or speedscope
+    #   memory-top.txt      top allocation sites per snapshot
+    #   timings.json        time per callback, hook, exporter and close()
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool("PROFILE_ENABLED", False):
+            raise NotConfigured
+        self.crawler = crawler
+        self.sample_every = max(1, settings.getint("PROFILE_SAMPLE_EVERY", PROFILE_SAMPLE_EVERY))
+        self.memory_at = sorted(int(n) for n in settings.getlist("PROFILE_MEMORY_AT", PROFILE_MEMORY_AT))
+        self.memory_top = settings.getint("PROFILE_MEMORY_TOP", PROFILE_MEMORY_TOP)
+        self.memory_frames = settings.getint("PROFILE_MEMORY_FRAMES", PROFILE_MEMORY_FRAMES)
+        self.stack_interval = settings.getfloat("PROFILE_STACK_INTERVAL", PROFILE_STACK_INTERVAL)
+        self.stacks = Counter()
+        self.calls = Counter()
+        self.sampled = Counter()
+        self.profiles = {}
+        # cProfile can only trace one profile at a time
+        self.active = None
+        self.timings = {}
+        self.snapshots = []
+        self.pages = 0
+        self.output_dir = None
+        self.started = time.monotonic()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        profiler = cls(crawler)
+        crawler.signals.connect(profiler.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(profiler.engine_stopped, signal=signals.engine_stopped)
+        return profiler
+
+    def spider_opened(self, spider):
+        spider.profiler = self
+        output_dir = getattr(spider, "output_dir", None)
+        if output_dir is not None:
+            # One directory per distributed worker, like metrics.json
+            suffix = f".worker-{spider.worker}" if getattr(spider, "frontier", None) else ""
+            self.output_dir = output_dir / f"profile{suffix}"
+        engine = self.crawler.engine
+        self.instrument(engine.downloader.middleware, "downloader", DOWNLOADER_HOOKS)
+        self.instrument(engine.scraper.spidermw, "spider", SPIDER_HOOKS)
+        self.instrument(engine.scraper.itemproc, "pipeline", PIPELINE_HOOKS)
+        exporter = getattr(spider, "exporter", None)
+        if exporter is not None:
+            for name in EXPORTER_METHODS:
+                setattr(exporter, name, self.timed("exporter", getattr(exporter, name)))
+        start_sampling(self, self.stack_interval, self.memory_frames)
+        logger.info(f"[*] Profiling {getattr(spider, 'domain', spider.name)}: one callback in {self.sample_every}")
+
+    def instrument(self, manager, kind, hooks):
+        # The managers call the bound methods they collected at start-up,
+        # so those are swapped for timed wrappers in place
+        requiring_spider = getattr(manager, "_mw_methods_requiring_spider", set())
+        for hook in hooks:
+            methods = manager.methods.get(hook)
+            for i, method in enumerate(methods or ()):
+                if method is None or not hasattr(method, "__self__"):
+                    continue
+                wrapper = self.timed(kind, method)
+                if method in requiring_spider:
+                    requiring_spider.add(wrapper)
+                methods[i] = wrapper
+
+    def timed(self, kind, method):
+        times = self.timings.setdefault(f"{kind}/{type(method.__self__).__name__}.{method.__name__}", [0, 0.0, 0.0])
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                spent = time.perf_counter() - started
+                times[0] += 1
+                times[1] += spent
+                if spent > times[2]:
+                    times[2] = spent
+
+        return wrapper
+
+    def sample(self, name):
+        # A profile for this call of callback `name`, or None when it is
+        # not sampled; hand it back with release() when the call is done
+        self.calls[name] += 1
+        if self.active is not None or (self.calls[name] - 1) % self.sample_every:
+            return None
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = self.profiles[name] = cProfile.Profile()
+        self.sampled[name] += 1
+        self.active = profile
+        return profile
+
+    def release(self, profile):
+        if self.active is profile:
+            self.active = None
+
+    def page(self):
+        self.pages += 1
+        if self.memory_at and self.pages == self.memory_at[0]:
+            self.memory_at.pop(0)
+            self.snapshot(f"after {self.pages} pages")
+
+    def snapshot(self, label):
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        # The profiler's own allocations are left out; filtering the
+        # grouped statistics is much cheaper than Snapshot.filter_traces
+        own = (tracemalloc.__file__, __file__)
+        top = [
+            str(stat) for stat in tracemalloc.take_snapshot().statistics("lineno")
+            if stat.traceback[0].filename not in own
+        ][:self.memory_top]
+        self.snapshots.append((label, current, peak, top))
+        logger.info(f"[*] Memory {label}: {current / 1024 / 1024:.1f} MiB traced, peak {peak / 1024 / 1024:.1f} MiB")
+
+    def summary(self):
+        stats = self.crawler.stats.get_stats() if self.crawler.stats else {}
+        callbacks = {
+            name: {
+                "calls": calls,
+                "cpu_seconds": round(stats.get(f"callback_cpu/{name}", 0.0), 6),
+                "profiled_calls": self.sampled[name],
+            }
+            for name, calls in self.calls.items()
+        }
+        timings = {
+            name: {"calls": calls, "seconds": round(total, 6), "max_seconds": round(longest, 6)}
+            for name, (calls, total, longest) in sorted(self.timings.items(), key=lambda item: -item[1][1])
+            if calls
+        }
+        fetch = None
+        metrics = getattr(self.crawler.spider, "metrics", None)
+        if metrics:
+            fetch = round(sum(s["sum"] for s in metrics.histograms["fetch_seconds"].series.values()), 6)
+        return {
+            "elapsed_seconds": round(time.monotonic() - self.started, 3),
+            "pages": self.pages,
+            "download_latency_seconds": fetch,
+            "callbacks": callbacks,
+            "hooks": timings,
+            "close_seconds": stats.get("spidercore/close_seconds"),
+        }
+
+    def engine_stopped(self):
+        if self in ACTIVE:
+            self.snapshot(f"at the end ({self.pages} pages)")
+        stop_sampling(self)
+        if self.output_dir is None:
+            return
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        profiles = [p for p in self.profiles.values() if p.getstats()]
+        if profiles:
+            pstats.Stats(*profiles).dump_stats(self.output_dir / "callbacks.pstats")
+        with open(self.output_dir / "stacks.collapsed", "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(self.output_dir / "memory-top.txt", "w", encoding="utf-8") as f:
+            for label, current, peak, top in self.snapshots:
+                f.write(f"== {label}: {current / 1024 / 1024:.1f} MiB traced, peak {peak / 1024 / 1024:.1f} MiB ==\n")
+                f.writelines(line + "\n" for line in top)
+                f.write("\n")
+        with open(self.output_dir / "timings.json", "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        logger.info(f"[✓] Profile written to: {self.output_dir}")
@@ -0,0 +1,72 @@
+# spidercore/rules.py
+
+import re
+from urllib.parse import urlparse
+
+
+def compile_any(patterns):
+    # One alternation instead of a regex search per pattern
+    patterns = [p for p in patterns if p]
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
+
+
+def as_list(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+class UrlRules:
+    # Compiled include/exclude rules deciding, at link-extraction time,
+    # which URLs are recorded in the sitemap and which are fetched at all.
+    #
+    # A URL is recorded when it matches every record rule (--filter-url,
+    # --pattern) and no --exclude rule. A link is fetched when it matches no
+    # --no-follow rule, so matches nested below other pages are still
+    # reached; the LinkScorer fetches matches and hubs first. With strict
+    # set (--strict-follow) a link is only fetched when it would be recorded
+    # or is a hub page that can lead to one: it matches a --follow rule, or
+    # sits in a directory on the way to a path-like --filter-url.
+    def __init__(self, filter=None, pattern=None, follow=None, exclude=None, no_follow=None, strict=False):
+        self.strict = strict
+        self.record = []
+        if filter:
+            self.record.append(re.compile(re.escape(filter)))
+        if pattern:
+            self.record.append(re.compile(pattern, re.IGNORECASE))
+        self.follow = compile_any(as_list(follow))
+        self.exclude = compile_any(as_list(exclude))
+        self.no_follow = compile_any(as_list(no_follow))
+        self.hub_paths = None
+        if filter and filter.startswith("/"):
+            # "/assets/uploads/" -> pages directly under "/", "/assets/" or "/assets/uploads/"
+            parts = filter.split("/")[:-1]
+            ancestors = ["/".join(parts[:i + 1]) + "/" for i in range(len(parts))]
+            self.hub_paths = compile_any(f"{re.escape(a)}[^/]*" for a in ancestors)
+
+    @property
+    def active(self):
+        return bool(self.record or self.exclude or self.no_follow)
+
+    def should_record(self, url):
+        if self.exclude and self.exclude.search(url):
+            return False
+        return all(rule.search(url) for rule in self.record)
+
+    def is_hub(self, url):
+        if self.follow and self.follow.search(url):
+            return True
+        return bool(self.hub_paths and self.hub_paths.fullmatch(urlparse(url).path or "/"))
+
+    def should_follow(self, url):
+        if not self.active:
+            return True
+        if self.no_follow and self.no_follow.search(url):
+            return False
+        if not self.strict:
+            return True
+        return self.should_record(url) or self.is_hub(url)
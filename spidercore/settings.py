@@ -1,110 +1,249 @@
-# spidercore/settings.py
-
-BOT_NAME = "spidercore"
-
-SPIDER_MODULES = ["spidercore.spiders"]
-NEWSPIDER_MODULE = "spidercore.spiders"
-
-ROBOTSTXT_OBEY = True
-DOWNLOAD_DELAY = 0.5
-DEPTH_LIMIT = 5
-CLOSESPIDER_PAGECOUNT = 250
-FEED_EXPORT_ENCODING = "utf-8"
-
-LOG_LEVEL = 'INFO'
-LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'formatters': {
-        'default': {
-            'format': '[%(levelname)s] [%(name)s] %(message)s',
-        },
-    },
-    'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'default',
-        },
-    },
-    'root': {
-        'handlers': ['console'],
-        'level': 'WARNING',
-    },
-    'loggers': {
-        'basic': {
-            'handlers': ['console'],
-            'level': 'INFO',
-            'propagate': False,
-        },
-        'spidercore': {
-            'handlers': ['console'],
-            'level': 'INFO',
-            'propagate': False,
-        },
-        'scrapy.crawler': {
-            'handlers': ['console'],
-            'level': 'INFO',
-            'propagate': False,
-        },
-        'scrapy.statscollectors': {
-            'handlers': ['console'],
-            'level': 'INFO',
-            'propagate': False,
-        },
-
-        # Silence everything else by disabling propagation
-        'scrapy.utils.log': {
-            'level': 'WARNING',
-            'propagate': False,
-        },
-        'scrapy.middleware': {
-            'level': 'WARNING',
-            'propagate': False,
-        },
-        'scrapy.core.engine': {
-            'level': 'WARNING',
-            'propagate': False,
-        },
-        'scrapy.extensions.telnet': {
-            'level': 'WARNING',
-            'propagate': False,
-        },
-        'scrapy.extensions.logstats': {
-            'level': 'WARNING',
-            'propagate': False,
-        },
-        'scrapy.downloadermiddlewares': {
-            'level': 'WARNING',
-            'propagate': False,
-        },
-        'scrapy.spidermiddlewares': {
-            'level': 'WARNING',
-            'propagate': False,
-        },
-        'scrapy.extensions': {
-            'level': 'WARNING',
-            'propagate': False,
-        },
-        'scrapy.addons': {
-            'level': 'WARNING',
-            'propagate': False,
-        },
-    }
-}
-
-
-# Enable custom middlewares (optional)
-'''
-SPIDER_MIDDLEWARES = {
-    "spidercore.middlewares.SpidercoreSpiderMiddleware": 543,
-}
-
-DOWNLOADER_MIDDLEWARES = {
-    "spidercore.middlewares.SpidercoreDownloaderMiddleware": 543,
-}
-
-# Enable custom pipeline (optional)
-ITEM_PIPELINES = {
-    "spidercore.pipelines.SpidercorePipeline": 300,
-}
-'''
\ No newline at end of file
+# spidercore/settings.py
+
+BOT_NAME = "spidercore"
+
+SPIDER_MODULES = ["spidercore.spiders"]
+NEWSPIDER_MODULE = "spidercore.spiders"
+
+ROBOTSTXT_OBEY = True
+# SpidercoreDownloaderMiddleware adapts delay and concurrency per host
+# within the ADAPTIVE_* bounds below. Every host starts one request at a
+# time, DOWNLOAD_DELAY apart; politeness beyond that comes from the slot's
+# concurrency, since a slot with a delay sends one request per delay.
+DOWNLOAD_DELAY = 0.5
+CONCURRENT_REQUESTS = 64
+CONCURRENT_REQUESTS_PER_DOMAIN = 1
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_MIN_DELAY = 0.0
+ADAPTIVE_MAX_DELAY = 60.0
+ADAPTIVE_MIN_CONCURRENCY = 1
+ADAPTIVE_MAX_CONCURRENCY = 16
+ADAPTIVE_TARGET_LATENCY = 1.0
+DEPTH_LIMIT = 5
+# --max-pages is enforced by the scheduler (see SCHEDULER below); this
+# response count also includes assets and link checks
+CLOSESPIDER_PAGECOUNT = 0
+FEED_EXPORT_ENCODING = "utf-8"
+
+# Pending requests are taken best priority first and page requests stop at
+# --max-pages as they are scheduled, not when the pages come back. run.py
+# swaps in the state or shared schedulers as needed. With --filter-url or
+# --pattern, page links score PRIORITY_MATCH when they match, PRIORITY_HUB
+# when they lead to matches, PRIORITY_ANCHOR per anchor word and
+# PRIORITY_PATH per directory shared with matched pages, and lose
+# PRIORITY_DEPTH per level.
+SCHEDULER = "spidercore.priority.PriorityScheduler"
+PRIORITY_MATCH = 100
+PRIORITY_HUB = 30
+PRIORITY_ANCHOR = 5
+PRIORITY_PATH = 5
+PRIORITY_DEPTH = 10
+
+# Assets are downloaded in Range chunks of ASSET_CHUNK_SIZE bytes and
+# skipped once they grow past ASSET_MAX_SIZE, or before their body is
+# transferred when the headers say so. Links ending in ASSET_EXTENSIONS
+# are assets; a Content-Type matching ASSET_SKIP_MIME_TYPES, or not
+# matching a non-empty ASSET_MIME_TYPES, is skipped. ASSET_HEAD_CHECK
+# checks the headers on a HEAD request before the first chunk.
+ASSET_CHUNK_SIZE = 8 * 1024 * 1024
+ASSET_MAX_SIZE = 512 * 1024 * 1024
+ASSET_EXTENSIONS = ["pdf", "zip", "docx", "xlsx", "pptx"]
+ASSET_MIME_TYPES = []
+ASSET_SKIP_MIME_TYPES = ["text/html", "application/xhtml+xml"]
+ASSET_HEAD_CHECK = False
+# Asset lane: at most ASSET_CONCURRENCY asset requests in the downloader
+# at once, in their own download slot with ASSET_DELAY seconds between
+# requests and at most ASSET_BANDWIDTH bytes/s (0 = no cap), scheduled at
+# ASSET_PRIORITY. Page links never score below ASSET_PRIORITY +
+# PRIORITY_DEPTH, so pages always go first
+ASSET_CONCURRENCY = 2
+ASSET_DELAY = 0.0
+ASSET_BANDWIDTH = 0
+ASSET_PRIORITY = -100
+
+# --rich-content parses pages in a pool of CONTENT_WORKERS processes (or
+# threads with CONTENT_POOL = "thread"; 0 workers = one per CPU but one),
+# CONTENT_BATCH_SIZE pages at a time
+CONTENT_POOL = "process"
+CONTENT_WORKERS = 0
+CONTENT_BATCH_SIZE = 16
+
+# Links are rewritten to one canonical form before they are deduplicated:
+# no fragment, lowercase host, no default port, none of the query (and
+# ";name=" path) parameters in CANONICAL_DROP_PARAMS, or only those in
+# CANONICAL_KEEP_PARAMS when set, parameters sorted. CANONICAL_TRAILING_SLASH
+# is keep, add or strip.
+CANONICALIZE_URLS = True
+CANONICAL_DROP_PARAMS = [
+    "utm_*", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga",
+    "sessionid", "session_id", "sid", "phpsessid", "jsessionid", "aspsessionid*",
+]
+CANONICAL_KEEP_PARAMS = []
+CANONICAL_SORT_QUERY = True
+CANONICAL_LOWERCASE_PATH = False
+CANONICAL_TRAILING_SLASH = "keep"
+
+# Crawl traps: links are dropped (and logged to unusual-links.txt) once
+# TRAP_MAX_PER_TEMPLATE URLs share a template, the path with numbers
+# generalised plus the query parameter names, or when a path segment
+# repeats more than TRAP_MAX_SEGMENT_REPEATS times. 0 disables either check.
+TRAP_MAX_PER_TEMPLATE = 5000
+TRAP_MAX_SEGMENT_REPEATS = 2
+
+# --link-graph: PageRank with PAGERANK_DAMPING, iterated until the ranks
+# change by less than PAGERANK_TOLERANCE or PAGERANK_ITERATIONS times; XML
+# sitemap priorities follow it on a log scale from SITEMAP_MIN_PRIORITY
+# to 1.0
+PAGERANK_DAMPING = 0.85
+PAGERANK_ITERATIONS = 50
+PAGERANK_TOLERANCE = 1e-6
+SITEMAP_MIN_PRIORITY = 0.1
+
+# --near-duplicates: pages whose SimHash is within NEAR_DUPLICATE_DISTANCE
+# bits of an earlier page's are marked and their links not followed; pages
+# with fewer than NEAR_DUPLICATE_MIN_WORDS words are not compared
+NEAR_DUPLICATE_DISTANCE = 3
+NEAR_DUPLICATE_MIN_WORDS = 50
+
+# --archive: responses are appended to gzipped WARC files in the site's
+# archive/ directory, a new file once one grows past ARCHIVE_MAX_SIZE bytes
+ARCHIVE_MAX_SIZE = 1024 * 1024 * 1024
+ARCHIVE_COMPRESS_LEVEL = 6
+
+# Every page record is a SitemapItem passed through these pipelines.
+# SpidercorePipeline feeds the --export file; the page stores named in
+# PAGE_STORES (run.py --store) add pages.sqlite3, written in transactions
+# of PAGE_STORE_BATCH rows, and pages.parquet, written in row groups of
+# PARQUET_ROW_GROUP rows with PARQUET_COMPRESSION
+ITEM_PIPELINES = {
+    "spidercore.pipelines.SpidercorePipeline": 300,
+    "spidercore.pipelines.SqlitePagesPipeline": 400,
+    "spidercore.pipelines.ParquetPagesPipeline": 410,
+}
+PAGE_STORES = []
+PAGE_STORE_BATCH = 1000
+PARQUET_ROW_GROUP = 50000
+PARQUET_COMPRESSION = "zstd"
+
+LOG_LEVEL = 'INFO'
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {
+            'format': '[%(levelname)s] [%(name)s] %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'default',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'basic': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'spidercore': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'scrapy.crawler': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'scrapy.statscollectors': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+
+        # Silence everything else by disabling propagation
+        'scrapy.utils.log': {
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'scrapy.middleware': {
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'scrapy.core.engine': {
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'scrapy.extensions.telnet': {
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'scrapy.extensions.logstats': {
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'scrapy.downloadermiddlewares': {
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'scrapy.spidermiddlewares': {
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'scrapy.extensions': {
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'scrapy.addons': {
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    }
+}
+
+# Scrapy's DNS cache is process-wide, so every crawler of a --seeds batch shares it
+DNSCACHE_ENABLED = True
+DNSCACHE_SIZE = 10000
+
+# Live metrics: Prometheus text on METRICS_PORT (0 = no HTTP endpoint,
+# set by run.py --metrics-port) and a metrics.json snapshot in the output
+# directory every METRICS_SNAPSHOT_INTERVAL seconds
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 0
+METRICS_SNAPSHOT_INTERVAL = 10
+
+# --profile: cProfile one callback call in PROFILE_SAMPLE_EVERY, time
+# every middleware hook, pipeline and exporter, sample the stack every
+# PROFILE_STACK_INTERVAL seconds and take tracemalloc snapshots after
+# PROFILE_MEMORY_AT pages; written to the site's profile/ directory
+PROFILE_ENABLED = False
+PROFILE_SAMPLE_EVERY = 10
+PROFILE_STACK_INTERVAL = 0.005
+PROFILE_MEMORY_AT = [100, 1000, 10000]
+PROFILE_MEMORY_TOP = 25
+PROFILE_MEMORY_FRAMES = 1
+
+EXTENSIONS = {
+    "spidercore.metrics.CrawlMetrics": 500,
+    "spidercore.profiling.CrawlProfiler": 510,
+}
+
+SPIDER_MIDDLEWARES = {
+    "spidercore.middlewares.SpidercoreSpiderMiddleware": 950,
+}
+
+DOWNLOADER_MIDDLEWARES = {
+    "scrapy.downloadermiddlewares.robotstxt.RobotsTxtMiddleware": None,
+    "spidercore.middlewares.SharedRobotsTxtMiddleware": 100,
+    "spidercore.middlewares.ConditionalGetMiddleware": 560,
+    "spidercore.middlewares.SpidercoreDownloaderMiddleware": 580,
+    # Next to the downloader, so the archive sees responses as they came
+    # off the wire: before decompression and before redirects are followed
+    "spidercore.middlewares.ArchiveMiddleware": 950,
+}
@@ -0,0 +1,118 @@
+# spidercore/similarity.py
+
+import re
+import hashlib
+from collections import Counter, defaultdict
+from spidercore.canonical import url_template
+
+NEAR_DUPLICATE_DISTANCE = 3
+NEAR_DUPLICATE_MIN_WORDS = 50
+NEAR_DUPLICATE_SHINGLE = 3
+# A URL pattern is skipped once this many of its pages were near-duplicates
+# and they make up at least DUPLICATE_PATTERN_RATIO of the pages seen
+DUPLICATE_PATTERN_MIN = 5
+DUPLICATE_PATTERN_RATIO = 0.9
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+TEXT_XPATH = "//body//text()[not(ancestor::script or ancestor::style or ancestor::noscript)]"
+
+
+def page_words(response):
+    # Visible words of the page body, lowercased
+    text = " ".join(response.xpath(TEXT_XPATH).getall())
+    return WORD_RE.findall(text.lower())
+
+
+def simhash(words, shingle=NEAR_DUPLICATE_SHINGLE):
+    # 64-bit SimHash over word shingles. Instead of adding 64 weights per
+    # shingle, the byte values at each of the 8 positions are counted and
+    # turned into bit counts at the end.
+    shingles = {" ".join(words[i:i + shingle]) for i in range(max(1, len(words) - shingle + 1))}
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles)
+
+    half = len(shingles) / 2
+    value = 0
+    for index in range(8):
+        position = Counter(digests[index::8])
+        for bit in range(8):
+            ones = sum(count for byte, count in position.items() if byte >> bit & 1)
+            if ones > half:
+                value |= 1 << (index * 8 + bit)
+    return value
+
+
+class SimHashIndex:
+    # Fingerprints split into distance + 1 bands: two fingerprints within
+    # `distance` bits of each other agree on at least one whole band, so a
+    # lookup only compares against the pages sharing a band value.
+    def __init__(self, distance=NEAR_DUPLICATE_DISTANCE):
+        self.distance = distance
+        self.bands = distance + 1
+        self.width = 64 // self.bands
+        self.mask = (1 << self.width) - 1
+        self.buckets = [defaultdict(list) for _ in range(self.bands)]
+        self.count = 0
+
+    def keys(self, value):
+        return [(value >> (band * self.width)) & self.mask for band in range(self.bands)]
+
+    def find(self, value):
+        for bucket, key in zip(self.buckets, self.keys(value)):
+            for other, url in bucket.get(key, ()):
+                if bin(value ^ other).count("1") <= self.distance:
+                    return url
+        return None
+
+    def add(self, value, url):
+        for bucket, key in zip(self.buckets, self.keys(value)):
+            bucket[key].append((value, url))
+        self.count += 1
+
+
+class NearDuplicates:
+    # Flags pages whose content is a near-duplicate of a page already seen
+    # and learns the URL patterns that keep producing them, so links
+    # matching those patterns are not fetched at all
+    def __init__(
+        self,
+        distance=NEAR_DUPLICATE_DISTANCE,
+        min_words=NEAR_DUPLICATE_MIN_WORDS,
+        pattern_min=DUPLICATE_PATTERN_MIN,
+        pattern_ratio=DUPLICATE_PATTERN_RATIO,
+    ):
+        self.index = SimHashIndex(distance)
+        self.min_words = min_words
+        self.pattern_min = pattern_min
+        self.pattern_ratio = pattern_ratio
+        self.pattern_pages = Counter()
+        self.pattern_duplicates = Counter()
+        self.skipped_patterns = set()
+
+    def check(self, url, words):
+        # URL of the page this one duplicates, or None. Pages with too
+        # little text are neither flagged nor indexed.
+        if len(words) < self.min_words:
+            return None
+        value = simhash(words)
+        original = self.index.find(value)
+        pattern = url_template(url)
+        self.pattern_pages[pattern] += 1
+        if original is None:
+            self.index.add(value, url)
+            return None
+        self.pattern_duplicates[pattern] += 1
+        return original
+
+    def learned(self, url):
+        # The pattern of `url` if it just crossed the skip threshold
+        pattern = url_template(url)
+        if pattern in self.skipped_patterns:
+            return None
+        duplicates = self.pattern_duplicates[pattern]
+        if duplicates >= self.pattern_min and duplicates / self.pattern_pages[pattern] >= self.pattern_ratio:
+            self.skipped_patterns.add(pattern)
+            return pattern
+        return None
+
+    def should_skip(self, url):
+        return bool(self.skipped_patterns) and url_template(url) in self.skipped_patterns
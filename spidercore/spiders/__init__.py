@@ -1,4 +1,4 @@
-# spidercore/spiders/__init__.py
-
-# This file marks the 'spiders' directory as a Python package.
-# It can be left empty.
+# spidercore/spiders/__init__.py
+
+# This file marks the 'spiders' directory as a Python package.
+# It can be left empty.
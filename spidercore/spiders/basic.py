@@ -1,375 +1,791 @@
-# spidercore/spiders/basic.py
-
-import re
-import os
-import csv
-import json
-import html
-import hashlib
-import scrapy
-from pathlib import Path
-from scrapy import signals
-from datetime import datetime
-from urllib.parse import urlparse
-from collections import defaultdict
-from urllib.parse import urlparse
-
-class BasicSpider(scrapy.Spider):
-    name = "basic"
-
-    def __init__(
-        self,
-        url=None,
-        filter=None,
-        pattern=None,
-        download=False,
-        max_pages=250,
-        export="html",
-        content=False,
-        *args,
-        **kwargs
-    ):
-        if not url:
-            raise ValueError("Missing required argument: url")
-        if url and not urlparse(url).scheme:
-            url = "https://" + url  # default to HTTPS if missing
-
-        parsed = urlparse(url)
-        self._html_sitemap_written = False
-        self._crawl_logged = False
-        self.domain = parsed.netloc
-        self.allowed_domains = [self.domain]
-        self.start_urls = [url]
-        self.filter = filter
-        self.pattern = pattern
-        self.download = download in ["1", "true", "True"]
-        self.max_pages = int(max_pages)
-        self.export = export.lower()
-        self.include_content = content in ["1", "true", "True"]
-        self.visited_urls = set()
-        self.assets = set()
-        self.page_data = []
-        self.asset_hashes = set()
-        self.start_url = url
-        self.output_dir = Path(f"downloads_{self.domain.replace('.', '_')}")
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.unusual_log_path = self.output_dir / "unusual-links.txt"
-        self.unusual_log_file = open(self.unusual_log_path, "w", encoding="utf-8")
-        self.output_file = self.output_dir / f"sitemap_{self.domain.replace('.', '_')}.{self.export}"
-        self.asset_dir = f"downloads_{self.domain.replace('.', '_')}"
-        Path(self.asset_dir).mkdir(exist_ok=True)
-
-        super().__init__(*args, **kwargs)
-
-    def log_unusual_link(self, url, reason):
-        self.unusual_log_file.write(f"{url}  # Skipped due to: {reason}\n")
-
-    def parse(self, response):
-        url = response.url
-
-        if url in self.visited_urls:
-            return
-        self.visited_urls.add(url)
-        self.logger.info(f"[+] Parsed page: {url}")
-
-        # Skip non-HTML responses
-        content_type = response.headers.get("Content-Type", b"").decode("utf-8", "ignore")
-        if "text/html" not in content_type:
-            self.log_unusual_link(response.url, f"skipped non-HTML content ({content_type})")
-            return
-
-        if self.filter and self.filter not in url:
-            return
-
-        if self.pattern and not re.search(self.pattern, url, re.IGNORECASE):
-            return
-
-        title = response.xpath("//title/text()").get() if self.include_content else ""
-        self.page_data.append({"url": url, "title": title.strip() if title else ""})
-
-        if self.download:
-            for asset in response.css("a::attr(href), link::attr(href), script::attr(src), img::attr(src)"):
-                asset_url = response.urljoin(asset.get())
-                if re.search(r"\.(pdf|zip|docx|xlsx|pptx)$", asset_url, re.IGNORECASE):
-                    if asset_url not in self.assets:
-                        self.assets.add(asset_url)
-                        yield scrapy.Request(asset_url, callback=self.download_file)
-
-        if len(self.visited_urls) < self.max_pages:
-            for href in response.css("a::attr(href)").getall():
-                if not href:
-                    continue
-
-                if href.startswith("tel:"):
-                    self.log_unusual_link(href, "tel link")
-                    continue
-                if href.startswith("mailto:"):
-                    self.log_unusual_link(href, "mailto link")
-                    continue
-                if href.startswith("javascript:"):
-                    self.log_unusual_link(href, "javascript link")
-                    continue
-
-                full_url = response.urljoin(href)
-                parsed = urlparse(full_url)
-
-                if parsed.scheme not in ["http", "https"]:
-                    self.log_unusual_link(full_url, f"non-http scheme: {parsed.scheme}")
-                    continue
-
-                yield response.follow(full_url, callback=self.parse)
-
-    def download_file(self, response):
-        file_hash = hashlib.sha256(response.body).hexdigest()
-
-        if file_hash in self.asset_hashes:
-            self.logger.info(f"[-] Skipped duplicate file (hash matched): {response.url}")
-            return
-
-        self.asset_hashes.add(file_hash)
-        filename = os.path.basename(urlparse(response.url).path)
-        path = os.path.join(self.asset_dir, filename)
-
-        with open(path, "wb") as f:
-            f.write(response.body)
-
-        self.logger.info(f"[✓] Downloaded asset: {filename}")
-
-    @classmethod
-    def from_crawler(cls, crawler, *args, **kwargs):
-        spider = super().from_crawler(crawler, *args, **kwargs)
-        crawler.signals.connect(spider.closed, signal=signals.spider_closed)
-        return spider
-
-    def closed(self, reason):
-        if hasattr(self, "unusual_log_file"):
-            self.unusual_log_file.close()
-
-        if self.export == "html":
-            self.write_html_sitemap()
-        elif self.export == "xml":
-            self.write_xml_sitemap()
-        elif self.export == "json":
-            self.write_json_sitemap()
-        elif self.export == "csv":
-            self.write_csv_sitemap()
-        else:
-            self.logger.warning(f"[!] Unsupported export format: {self.export}")
-
-        if not self._crawl_logged:
-            self._crawl_logged = True
-            self.logger.info(f"[✓] Crawl complete: {len(self.visited_urls)} pages")
-
-    def write_html_sitemap(self):
-        from collections import defaultdict
-        import datetime
-        from urllib.parse import urlparse
-
-        def build_tree(entries):
-            tree = {}
-            for entry in entries:
-                parsed = urlparse(entry["url"])
-                path = parsed.path
-
-                # Group root-level URLs like "/" and "/foo.html" under "/"
-                if not path or path == "/" or path.count("/") == 1:
-                    node = tree.setdefault("/", {})
-                    node.setdefault("__pages__", []).append(entry)
-                    continue
-
-                # Split deeper paths and build nested structure
-                parts = [p for p in path.strip("/").split("/") if p]
-                node = tree
-                for i, part in enumerate(parts):
-                    is_leaf = i == len(parts) - 1
-                    if is_leaf and '.' in part: # Don't create children for files like .html
-                        node.setdefault("__pages__", []).append(entry)
-                        break
-                    node = node.setdefault(part, {})
-                else:
-                    node.setdefault("__pages__", []).append(entry)
-            return tree
-
-
-        def render_list(tree, level=0):
-            html = ""
-            for key, subtree in tree.items():
-                if key == "__pages__":
-                    pages = subtree
-                    for i, entry in enumerate(pages):
-                        last = " last-page" if i == len(pages) - 1 else ""
-                        title = entry["title"].replace('"', "&quot;") if entry["title"] else entry["url"]
-                        html += f'<li class="lpage{last}"><a href="{entry["url"]}" title="{title}">{title}</a></li>\n'
-                    continue
-
-                count = count_leaf_pages(subtree)
-                html += f'<li class="lhead">{key}/  <span class="lcount">{count} pages</span></li>\n'
-                html += f'<li><ul class="level-{level+1}">\n'
-                html += render_list(subtree, level + 1)
-                html += "</ul></li>\n"
-            return html
-
-        def count_leaf_pages(subtree):
-            count = 0
-            for k, v in subtree.items():
-                if k == "__pages__":
-                    count += len(v)
-                else:
-                    count += count_leaf_pages(v)
-            return count
-
-        if self._html_sitemap_written:
-            return
-        self._html_sitemap_written = True
-
-        tree = build_tree(self.page_data)
-        now = datetime.datetime.utcnow().strftime("%Y, %B %d")
-
-        try:
-            with open(self.output_file, "w", encoding="utf-8") as f:
-                f.write(f"""<!DOCTYPE html>
-                <html lang="en"><head><meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
-                <title>{self.domain} Site Map</title>
-                <meta content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=0" name="viewport">
-                <style type="text/css">
-                body {{
-                    background-color: #fff;
-                    font-family: "Roboto", "Helvetica", "Arial", sans-serif;
-                    margin: 0;
-                }}
-
-                #top {{
-                    background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
-                    color: #fff;
-                    text-align: center;
-                    padding: 40px 20px 60px;
-                    box-shadow: 0 10px 30px rgba(0,0,0,0.2);
-                    border-bottom-left-radius: 8px;
-                    border-bottom-right-radius: 8px;
-                }}
-
-                .header-wrapper {{
-                    max-width: 700px;
-                    margin: auto;
-                }}
-
-                .site-title {{
-                    font-size: 32px;
-                    font-weight: bold;
-                    margin: 0 0 10px;
-                    letter-spacing: 0.5px;
-                }}
-
-                .meta {{
-                    font-size: 16px;
-                    margin-bottom: 20px;
-                }}
-
-                .meta span {{
-                    display: block;
-                    margin: 4px 0;
-                }}
-
-                .homepage-button {{
-                    display: inline-block;
-                    margin-top: 10px;
-                    background-color: #ffffff;
-                    color: #4facfe;
-                    padding: 10px 20px;
-                    border-radius: 25px;
-                    text-decoration: none;
-                    font-weight: bold;
-                    box-shadow: 0 4px 8px rgba(0,0,0,0.15);
-                    transition: all 0.3s ease;
-                }}
-
-                .homepage-button:hover {{
-                    background-color: #e8f6ff;
-                    color: #007acc;
-                    box-shadow: 0 6px 14px rgba(0,0,0,0.2);
-                }}
-
-                #cont {{
-                    position: relative;
-                    border-radius: 6px;
-                    box-shadow: 0 16px 24px 2px rgba(0, 0, 0, 0.14), 0 6px 30px 5px rgba(0, 0, 0, 0.12), 0 8px 10px -5px rgba(0, 0, 0, 0.2);
-                    background: #f3f3f3;
-                    margin: -20px 30px 0px 30px;
-                    padding: 20px;
-                }}
-
-                a:link, a:visited {{ color: #0180AF; text-decoration: underline; }}
-                a:hover {{ color: #666; }}
-                #footer {{ padding: 10px; text-align: center; }}
-                ul {{ margin: 0px; padding: 0px; list-style: none; }}
-                li {{ margin: 0px; }}
-                li ul {{ margin-left: 20px; }}
-                .lhead {{ background: #ddd; padding: 10px; margin: 10px 0px; }}
-                .lcount {{ padding: 0px 10px; }}
-                .lpage {{ border-bottom: #ddd 1px solid; padding: 5px; }}
-                .last-page {{ border: none; }}
-                </style>
-                </head>
-                <body>
-                <div id="top">
-                    <div class="header-wrapper">
-                        <h1 class="site-title">{self.domain} Site Map</h1>
-                        <div class="meta">
-                            <span>Last updated: {now}</span>
-                            <span>Total pages: {len(self.page_data)}</span>
-                        </div>
-                        <a class="homepage-button" href="{self.start_url}" target="_blank">Go to Target Site</a>
-                    </div>
-                </div>
-                <div id="cont">
-                <ul class="level-0">
-                """)
-
-                f.write(render_list(tree))
-                f.write("</ul></div></body></html>\n")
-            self.logger.info(f"[✓] HTML sitemap written to: {self.output_file}")
-        except Exception as e:
-            self.logger.error(f"[!] Failed to write HTML sitemap: {e}")
-    
-    def write_xml_sitemap(self):
-        try:
-            now = datetime.utcnow().replace(microsecond=0).isoformat() + "+00:00"
-            with open(self.output_file, "w", encoding="utf-8") as f:
-                f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-                f.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
-
-                for entry in self.page_data:
-                    url = html.escape(entry["url"])
-                    f.write("  <url>\n")
-                    f.write(f"    <loc>{url}</loc>\n")
-                    f.write(f"    <lastmod>{now}</lastmod>\n")
-                    f.write("    <priority>0.80</priority>\n")
-                    f.write("  </url>\n")
-
-                f.write("</urlset>\n")
-            self.logger.info(f"[✓] XML sitemap written to: {self.output_file}")
-        except Exception as e:
-            self.logger.error(f"[!] Failed to write XML sitemap: {e}")
-
-    def write_json_sitemap(self):
-        try:
-            with open(self.output_file, "w", encoding="utf-8") as f:
-                json.dump(self.page_data, f, indent=2, ensure_ascii=False)
-            self.logger.info(f"[✓] JSON sitemap written to: {self.output_file}")
-        except Exception as e:
-            self.logger.error(f"[!] Failed to write JSON sitemap: {e}")
-
-    def write_csv_sitemap(self):
-        try:
-            with open(self.output_file, "w", encoding="utf-8", newline="") as f:
-                writer = csv.writer(f)
-                header = ["url", "title"] if self.include_content else ["url"]
-                writer.writerow(header)
-                for entry in self.page_data:
-                    if self.include_content:
-                        writer.writerow([entry["url"], entry.get("title", "")])
-                    else:
-                        writer.writerow([entry["url"]])
-            self.logger.info(f"[✓] CSV sitemap written to: {self.output_file}")
-        except Exception as e:
-            self.logger.error(f"[!] Failed to write CSV sitemap: {e}")
+# spidercore/spiders/basic.py
+
+import json
+import time
+import hashlib
+import scrapy
+from pathlib import Path
+from scrapy import signals
+from itemadapter import ItemAdapter
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, StopDownload
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.defer import maybe_deferred_to_future
+from urllib.parse import urlparse
+from spidercore.archive import ARCHIVE_COMPRESS_LEVEL, ARCHIVE_MAX_SIZE, ArchiveReader, WarcWriter
+from spidercore.assets import (
+    ASSET_CHUNK_SIZE, ASSET_HEAD_CHECK, ASSET_MAX_SIZE, ASSET_MIME_TYPES, ASSET_PRIORITY, ASSET_SKIP_MIME_TYPES,
+    ASSET_SLOT, AssetStore,
+)
+from spidercore.canonical import (
+    CANONICAL_DROP_PARAMS, CANONICAL_KEEP_PARAMS, CANONICAL_LOWERCASE_PATH, CANONICAL_SORT_QUERY,
+    CANONICAL_TRAILING_SLASH, TRAP_MAX_PER_TEMPLATE, TRAP_MAX_SEGMENT_REPEATS, TrapGuard, UrlCanonicalizer,
+)
+from spidercore.content import CONTENT_BATCH_SIZE, CONTENT_FIELDS, CONTENT_POOL, CONTENT_WORKERS, ContentPool
+from spidercore.discovery import SitemapCoverage, iter_sitemap, sitemaps_from_robots
+from spidercore.distributed import open_frontier, parse_worker
+from spidercore.exporters import get_exporter
+from spidercore.extract import ASSET_EXTENSIONS, LinkExtractor
+from spidercore.items import SitemapItem
+from spidercore.priority import PRIORITY_ANCHOR, PRIORITY_DEPTH, PRIORITY_HUB, PRIORITY_MATCH, PRIORITY_PATH, LinkScorer
+from spidercore.linkgraph import (
+    PAGERANK_DAMPING, PAGERANK_ITERATIONS, PAGERANK_TOLERANCE, SITEMAP_MIN_PRIORITY, LinkGraph,
+)
+from spidercore.linkcheck import ERROR_STATUSES, HEAD_FALLBACK_STATUSES, LinkChecker, redirect_chain
+from spidercore.middlewares import timed_callback
+from spidercore.rules import UrlRules
+from spidercore.similarity import NEAR_DUPLICATE_DISTANCE, NEAR_DUPLICATE_MIN_WORDS, NearDuplicates, page_words
+from spidercore.state import CrawlState, CrawlHistory, header_text, http_date_to_iso
+from spidercore.urlstore import UrlSet, UrlStore
+
+
+def site_slug(domain):
+    # "example.com:8080" -> "example_com_8080", safe as a file name everywhere
+    return domain.replace(".", "_").replace(":", "_")
+
+
+def output_dir_for(domain):
+    return Path(f"downloads_{site_slug(domain)}")
+
+
+def create_exporter(
+    start_url, export, logger=None, compress=False, include_content=False, html_split=None, rich_content=False,
+    near_duplicates=False, urls=None, graph=None,
+):
+    parsed = urlparse(start_url)
+    output_file = output_dir_for(parsed.netloc) / f"sitemap_{site_slug(parsed.netloc)}.{export}"
+    # Links per HTML sitemap file; unset keeps the exporter's default
+    options = {"max_links": int(html_split)} if html_split is not None else {}
+    if rich_content:
+        options["fields"] = CONTENT_FIELDS
+    elif near_duplicates:
+        options["fields"] = (["url", "title"] if include_content else ["url"]) + ["duplicate_of"]
+    return get_exporter(
+        export,
+        output_file,
+        logger=logger,
+        compress=compress,
+        include_content=include_content,
+        domain=parsed.netloc,
+        start_url=start_url,
+        base_url=f"{parsed.scheme}://{parsed.netloc}/",
+        urls=urls,
+        graph=graph,
+        **options,
+    )
+
+
+def as_bool(value):
+    # Spider arguments arrive as strings from `scrapy crawl -a` but as
+    # real booleans from run.py
+    return value in [True, "1", "true", "True"]
+
+
+class BasicSpider(scrapy.Spider):
+    name = "basic"
+
+    def __init__(
+        self,
+        url=None,
+        filter=None,
+        pattern=None,
+        download=False,
+        max_pages=250,
+        export="html",
+        content=False,
+        gzip=False,
+        state_dir=None,
+        incremental=False,
+        follow=None,
+        exclude=None,
+        no_follow=None,
+        strict_follow=False,
+        parser="lxml",
+        worker=None,
+        frontier=None,
+        html_split=None,
+        discover=False,
+        rich_content=False,
+        check_links=False,
+        near_duplicates=False,
+        archive=False,
+        replay=None,
+        link_graph=False,
+        *args,
+        **kwargs
+    ):
+        if not url:
+            raise ValueError("Missing required argument: url")
+        if url and not urlparse(url).scheme:
+            url = "https://" + url  # default to HTTPS if missing
+
+        parsed = urlparse(url)
+        self._crawl_logged = False
+        self.domain = parsed.netloc
+        # OffsiteMiddleware compares host names, so a port must not be part of it
+        self.allowed_domains = [parsed.hostname]
+        self.start_urls = [url]
+        self.filter = filter
+        self.pattern = pattern
+        self.rules = UrlRules(
+            filter, pattern, follow=follow, exclude=exclude, no_follow=no_follow, strict=as_bool(strict_follow),
+        )
+        # Anchor texts only matter to the LinkScorer when there are record
+        # rules to match them against
+        self.extractor = LinkExtractor(parser, anchors=bool(self.rules.record))
+        self.scorer = None
+        self.download = as_bool(download)
+        self.max_pages = int(max_pages)
+        self.export = export.lower()
+        self.rich_content = as_bool(rich_content)
+        self.include_content = as_bool(content) or self.rich_content
+        self.content_pool = None
+        self.near_duplicates = as_bool(near_duplicates)
+        self.duplicates = None
+        self.canonicalizer = None
+        self.traps = None
+        self.gzip = as_bool(gzip)
+        self.state = CrawlState(state_dir) if state_dir else None
+        self.frontier = open_frontier(frontier) if frontier else None
+        self.urls = UrlStore()
+        self.worker, self.workers = parse_worker(worker) if worker else (None, None)
+        if self.frontier:
+            # Distributed worker: visited pages are shared, assets are
+            # partitioned by URL so local sets are enough
+            self.visited_urls = self.frontier.visited_set()
+            self.assets = set()
+            self.asset_hashes = set()
+        elif self.state:
+            self.visited_urls = self.state.stored_set("visited")
+            self.assets = self.state.stored_set("assets")
+            self.asset_hashes = self.state.stored_set("asset_hashes")
+        else:
+            # Page and asset URLs interned once, shared with the trap guard
+            # and the HTML sitemap
+            self.visited_urls = UrlSet(self.urls)
+            self.assets = UrlSet(self.urls)
+            self.asset_hashes = set()
+        self.start_url = url
+        self.output_dir = output_dir_for(self.domain)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        suffix = f".worker-{self.worker}" if self.frontier else ""
+        self.unusual_log_path = self.output_dir / f"unusual-links{suffix}.txt"
+        self.unusual_log_file = open(self.unusual_log_path, "w", encoding="utf-8")
+        self.output_file = self.output_dir / f"sitemap_{site_slug(self.domain)}.{self.export}"
+        self.asset_store = None
+        self.asset_priority = ASSET_PRIORITY
+        self.asset_head_check = False
+        self.metrics = None
+        self.profiler = None
+        self.callback_timing = None
+        self.incremental = as_bool(incremental)
+        self.history = CrawlHistory(self.output_dir / "crawl-history.sqlite3") if self.incremental else None
+        self.diff_file = self.output_dir / "crawl-diff.json"
+        self.discover = as_bool(discover)
+        # Workers only see part of the links, so coverage is reported by
+        # single-process crawls only
+        self.coverage = SitemapCoverage() if self.discover and not self.frontier else None
+        self.coverage_file = self.output_dir / "sitemap-coverage.json"
+        self.link_checker = LinkChecker() if as_bool(check_links) else None
+        self.link_report_file = self.output_dir / "link-report.json"
+        # Like coverage, the link graph needs every page's links
+        self.graph = LinkGraph(self.urls) if as_bool(link_graph) and not self.frontier else None
+        self.graph_file = self.output_dir / "link-graph.bin"
+        self.graph_report_file = self.output_dir / "link-analysis.json"
+        # --replay serves the responses archived by an earlier --archive
+        # crawl; True means this site's own archive directory
+        archive_dir = self.output_dir / "archive"
+        self.replay = None
+        if replay and replay not in ("0", "false", "False"):
+            self.replay = ArchiveReader(archive_dir if as_bool(replay) else replay)
+            self.logger.info(f"[*] Replaying {len(self.replay)} archived responses from {self.replay.directory}")
+        self.archive = None
+        if as_bool(archive) and not self.replay:
+            self.archive = WarcWriter(archive_dir, site_slug(self.domain) + suffix)
+        # Workers store their records in the frontier; the launcher or the
+        # coordinator merges them into the sitemap when the crawl is over
+        if self.frontier:
+            self.exporter = None
+        else:
+            self.exporter = create_exporter(
+                self.start_url, self.export, self.logger, self.gzip, self.include_content, html_split,
+                self.rich_content, self.near_duplicates, self.urls, self.graph,
+            )
+        if self.state and self.exporter:
+            # Pages exported before the crawl was interrupted
+            for entry in self.state.iter_pages():
+                self.exporter.write(entry)
+
+        super().__init__(*args, **kwargs)
+
+    async def start(self):
+        async for request in super().start():
+            yield request
+        if self.discover:
+            # Fetched ahead of the pages so the sitemap URLs reach the
+            # frontier early; a missing robots.txt falls back to /sitemap.xml
+            parsed = urlparse(self.start_url)
+            yield scrapy.Request(
+                f"{parsed.scheme}://{parsed.netloc}/robots.txt",
+                callback=self.parse_robots,
+                errback=self.robots_failed,
+                priority=10,
+                meta={"handle_httpstatus_all": True},
+            )
+
+    def sitemap_request(self, url):
+        return scrapy.Request(url, callback=self.parse_sitemap, priority=10, meta={"handle_httpstatus_all": True})
+
+    def parse_robots(self, response):
+        urls = sitemaps_from_robots(response.text) if response.status == 200 else []
+        if not urls:
+            yield from self.robots_failed(None)
+            return
+        self.logger.info(f"[*] robots.txt lists {len(urls)} sitemaps")
+        for url in urls:
+            yield self.sitemap_request(url)
+
+    def robots_failed(self, failure):
+        parsed = urlparse(self.start_url)
+        yield self.sitemap_request(f"{parsed.scheme}://{parsed.netloc}/sitemap.xml")
+
+    def parse_sitemap(self, response):
+        if response.status != 200:
+            self.logger.info(f"[-] No sitemap at {response.url} (HTTP {response.status})")
+            return
+        if self.coverage:
+            self.coverage.sitemaps += 1
+        follow = len(self.visited_urls) < self.max_pages
+        urls = 0
+        for kind, loc in iter_sitemap(response.body):
+            if kind == "sitemap":
+                yield self.sitemap_request(loc)
+                continue
+            urls += 1
+            if self.canonicalizer:
+                loc = self.canonicalizer.canonicalize(loc)
+            if self.coverage:
+                self.coverage.add_listed(loc)
+            if follow and loc not in self.visited_urls and self.rules.should_follow(loc):
+                yield scrapy.Request(loc, callback=self.parse, priority=self.scorer.score(loc, 1))
+        self.logger.info(f"[+] Parsed sitemap: {response.url} ({urls} URLs)")
+
+    def log_unusual_link(self, url, reason):
+        self.unusual_log_file.write(f"{url}  # Skipped due to: {reason}\n")
+
+    def observe(self, name, started):
+        # Time since `started` into a CrawlMetrics histogram, when enabled
+        if self.metrics:
+            self.metrics.observe(name, time.perf_counter() - started)
+
+    def remember(self, response, content_hash, entry=None, links=(), assets=()):
+        if self.history:
+            lastmod = entry["lastmod"] if entry else None
+            self.history.save(response.url, response, content_hash, lastmod, entry, links, assets)
+
+    async def parse(self, response):
+        # A coroutine so --rich-content can await the content pool; every
+        # page record leaves as a SitemapItem for the item pipelines
+        url = response.url
+        if self.link_checker:
+            target = response.meta.get("redirect_urls", [url])[0]
+            self.link_checker.record(target, response.status, redirect_chain(response))
+
+        if url in self.visited_urls:
+            return
+        self.visited_urls.add(url)
+
+        if response.status == 304:
+            for output in self.parse_unchanged(response):
+                yield output
+            return
+        self.logger.info(f"[+] Parsed page: {url}")
+        if self.metrics:
+            self.metrics.inc("pages")
+        if self.profiler:
+            self.profiler.page()
+        content_hash = hashlib.sha256(response.body).hexdigest() if self.history else None
+
+        # Skip non-HTML responses
+        content_type = response.headers.get("Content-Type", b"").decode("utf-8", "ignore")
+        if "text/html" not in content_type:
+            self.log_unusual_link(response.url, f"skipped non-HTML content ({content_type})")
+            self.remember(response, content_hash)
+            return
+
+        # Links are filtered before they are fetched, so a page that is not
+        # recorded here is fetched only for its links; under --strict-follow
+        # that is a start page or a hub page
+        record = self.rules.should_record(url)
+        is_start = response.meta.get("depth", 0) == 0
+        if not record and not is_start and not self.rules.should_follow(url):
+            self.remember(response, content_hash)
+            return
+
+        started = time.perf_counter()
+        page = self.extractor.extract(response)
+        if self.canonicalizer:
+            canonicalize = self.canonicalizer.canonicalize
+            page.links = list(dict.fromkeys(map(canonicalize, page.links)))
+            page.anchors = {canonicalize(link): text for link, text in page.anchors.items()}
+        self.observe("extract_seconds", started)
+        if record:
+            self.scorer.learn(url, page.title)
+
+        if self.download:
+            for asset_url in page.assets:
+                if asset_url not in self.assets:
+                    self.assets.add(asset_url)
+                    yield self.asset_request(asset_url)
+
+        if self.coverage:
+            self.coverage.add_page(url, page.links, response.meta.get("redirect_urls", ()), is_start)
+        if self.graph:
+            self.graph.add_page(url, page.links, response.meta.get("redirect_urls", ()), is_start)
+
+        duplicate_of = self.duplicates.check(url, page_words(response)) if self.duplicates else None
+        if duplicate_of:
+            # Its links are those of the original, which were followed already
+            self.logger.info(f"[=] Near-duplicate of {duplicate_of}: {url}")
+            self.crawler.stats.inc_value("spidercore/near_duplicates")
+            pattern = self.duplicates.learned(url)
+            if pattern:
+                self.logger.info(f"[-] Skipping links matching {pattern}, its pages are near-duplicates")
+
+        following = len(self.visited_urls) < self.max_pages and not duplicate_of
+        if following:
+            for link, reason in page.unusual:
+                self.log_unusual_link(link, reason)
+        if following or self.link_checker:
+            errback = self.page_failed if self.link_checker else None
+            depth = response.meta.get("depth", 0) + 1
+            for full_url in page.links:
+                follow = following and self.rules.should_follow(full_url)
+                if follow and self.duplicates and self.duplicates.should_skip(full_url):
+                    self.log_unusual_link(full_url, "URL pattern of near-duplicate pages")
+                    self.crawler.stats.inc_value("spidercore/near_duplicate_skips")
+                    follow = False
+                if follow and self.download and full_url in self.assets:
+                    # Already on its way through the asset lane
+                    follow = False
+                if follow and full_url not in self.visited_urls:
+                    trap = self.traps.admit(full_url)
+                    if trap:
+                        self.log_unusual_link(full_url, trap)
+                        self.crawler.stats.inc_value("spidercore/trap_skips")
+                        follow = False
+                if follow:
+                    priority = self.scorer.score(full_url, depth, page.anchors.get(full_url, ""))
+                    yield scrapy.Request(full_url, callback=self.parse, errback=errback, priority=priority)
+                # Links the crawl fetches anyway are checked by that request
+                if self.link_checker and self.link_checker.add(full_url, url):
+                    if not (follow and self.is_internal(full_url)):
+                        yield self.check_request(full_url)
+        if self.link_checker:
+            for asset_url in page.assets:
+                if self.link_checker.add(asset_url, url):
+                    yield self.check_request(asset_url)
+
+        item = None
+        if record:
+            title = page.title if self.include_content else ""
+            if self.history:
+                lastmod = self.history.lastmod(url, response, content_hash)
+            else:
+                lastmod = http_date_to_iso(header_text(response, "Last-Modified")) or ""
+            item = SitemapItem(url=url, title=title.strip() if title else "", lastmod=lastmod)
+            if duplicate_of:
+                item["duplicate_of"] = duplicate_of
+            if self.content_pool:
+                # Links are already scheduled, so the crawl goes on while
+                # the pool parses this page
+                result = await maybe_deferred_to_future(
+                    self.content_pool.submit(url, response.body, response.encoding)
+                )
+                item = self.rich_item(item, response, page, result)
+            yield item
+
+        entry = ItemAdapter(item).asdict() if item else None
+        self.remember(response, content_hash, entry, page.links, page.assets)
+
+    def rich_item(self, item, response, page, result):
+        error = result.get("error")
+        if error:
+            self.logger.warning(f"[!] Content extraction failed for {item['url']}: {error}")
+        values = dict(item, depth=response.meta.get("depth", 0), link_count=len(page.links), **result)
+        return SitemapItem({field: values[field] for field in CONTENT_FIELDS if field in values})
+
+    def is_internal(self, url):
+        host = urlparse(url).hostname or ""
+        domain = self.allowed_domains[0]
+        return host == domain or host.endswith("." + domain)
+
+    def check_request(self, url, method="HEAD", dont_filter=False):
+        # HEAD first; link_checked() retries with a GET that is cut off once
+        # the headers arrive when a server rejects HEAD
+        return scrapy.Request(
+            url,
+            method=method,
+            callback=self.link_checked,
+            errback=self.link_failed,
+            dont_filter=dont_filter,
+            meta={
+                "link_target": url,
+                "link_check": method,
+                "allow_offsite": True,
+                "handle_httpstatus_list": ERROR_STATUSES,
+            },
+        )
+
+    def link_checked(self, response):
+        url = response.meta["link_target"]
+        method = response.meta["link_check"]
+        if method == "HEAD" and response.status in HEAD_FALLBACK_STATUSES:
+            yield self.check_request(url, "GET", dont_filter=True)
+            return
+        self.link_checker.record(url, response.status, redirect_chain(response), method)
+
+    def link_failed(self, failure):
+        request = failure.request
+        if failure.check(IgnoreRequest):
+            error = f"not checked: {failure.getErrorMessage() or 'request ignored'}"
+        else:
+            error = f"{failure.type.__name__}: {failure.getErrorMessage()}"
+        self.link_checker.record(request.meta["link_target"], error=error, method=request.meta["link_check"])
+
+    def page_failed(self, failure):
+        # A followed link that failed; requests dropped on purpose (robots,
+        # offsite) are left to the HEAD check at idle time
+        target = failure.request.meta.get("redirect_urls", [failure.request.url])[0]
+        if failure.check(HttpError):
+            response = failure.value.response
+            self.link_checker.record(target, response.status, redirect_chain(response))
+        elif not failure.check(IgnoreRequest):
+            self.link_checker.record(target, error=f"{failure.type.__name__}: {failure.getErrorMessage()}")
+
+    def link_check_headers_received(self, headers, body_length, request, spider):
+        if request.meta.get("link_check") == "GET":
+            raise StopDownload(fail=False)
+
+    def link_check_idle(self):
+        # Targets whose crawl request was dropped (depth, robots, offsite,
+        # duplicates) are checked directly, skipping the spider middlewares
+        pending = self.link_checker.unresolved()
+        if not pending:
+            return
+        for url in pending:
+            self.link_checker.swept.add(url)
+            self.crawler.engine.crawl(self.check_request(url, dont_filter=True))
+        raise DontCloseSpider
+
+    def parse_unchanged(self, response):
+        # 304 from an --incremental recrawl: replay the entry and the links
+        # remembered from the last run instead of parsing a body
+        url = response.url
+        previous = self.history.get(url)
+        if previous is None:
+            return
+        self.history.touch(url)
+        self.logger.info(f"[=] Unchanged page: {url}")
+
+        if previous["entry"] and self.rules.should_record(url):
+            yield SitemapItem(json.loads(previous["entry"]))
+
+        if self.download:
+            for asset_url in json.loads(previous["assets"]):
+                if asset_url not in self.assets:
+                    self.assets.add(asset_url)
+                    yield self.asset_request(asset_url)
+
+        links = json.loads(previous["links"])
+        is_start = response.meta.get("depth", 0) == 0
+        if self.coverage:
+            self.coverage.add_page(url, links, response.meta.get("redirect_urls", ()), is_start)
+        if self.graph:
+            self.graph.add_page(url, links, response.meta.get("redirect_urls", ()), is_start)
+
+        if len(self.visited_urls) < self.max_pages:
+            depth = response.meta.get("depth", 0) + 1
+            for full_url in links:
+                if self.rules.should_follow(full_url) and not (self.download and full_url in self.assets):
+                    yield scrapy.Request(full_url, callback=self.parse, priority=self.scorer.score(full_url, depth))
+
+    def asset_request(self, asset_url, offset=None):
+        # Assets are fetched in Range chunks; a download interrupted in an
+        # earlier run continues from the bytes already on disk. All of them
+        # go through the asset lane, chunks of a started file first.
+        continuation = offset is not None
+        if offset is None:
+            offset = self.asset_store.resume_offset(asset_url)
+            if not offset and self.asset_head_check:
+                return self.asset_head_request(asset_url)
+        headers = {"Range": f"bytes={offset}-{offset + self.asset_store.chunk_size - 1}"}
+        validator = self.asset_store.validator(asset_url) if offset else None
+        if validator:
+            headers["If-Range"] = validator
+        return scrapy.Request(
+            asset_url,
+            callback=self.download_file,
+            errback=self.asset_failed,
+            headers=headers,
+            dont_filter=continuation,
+            priority=self.asset_priority + 1 if continuation else self.asset_priority,
+            meta={
+                "asset_url": asset_url,
+                "asset_offset": offset,
+                "download_maxsize": self.asset_store.max_size,
+                "download_slot": ASSET_SLOT,
+                "handle_httpstatus_list": [416],
+            },
+        )
+
+    def asset_head_request(self, asset_url):
+        # ASSET_HEAD_CHECK: the headers are checked on a HEAD request before
+        # the first chunk is asked for; servers refusing HEAD get the GET
+        return scrapy.Request(
+            asset_url,
+            method="HEAD",
+            callback=self.download_file,
+            priority=self.asset_priority,
+            meta={
+                "asset_url": asset_url,
+                "asset_head": True,
+                "download_slot": ASSET_SLOT,
+                "handle_httpstatus_list": sorted(HEAD_FALLBACK_STATUSES),
+            },
+        )
+
+    def asset_headers_received(self, headers, body_length, request, spider):
+        if "asset_url" not in request.meta or request.meta.get("asset_head"):
+            return
+        # Redirects and the later chunks of a file say nothing of its type
+        check_type = not request.meta.get("asset_offset") and "Location" not in headers
+        reason = self.asset_store.check_headers(request.meta["asset_url"], headers, self.asset_hashes, check_type)
+        if reason:
+            request.meta["asset_skip"] = reason
+            raise StopDownload(fail=False)
+        if body_length and "Content-Range" not in headers and "Location" not in headers:
+            # Range was ignored: the file is written to disk as it arrives
+            # rather than from the buffered response body
+            request.meta["asset_stream"] = True
+            self.asset_store.start_stream(request.meta["asset_url"], headers)
+
+    def asset_bytes_received(self, data, request, spider):
+        if not request.meta.get("asset_stream"):
+            return
+        reason = self.asset_store.write_stream(request.meta["asset_url"], data)
+        if reason:
+            request.meta["asset_skip"] = reason
+            raise StopDownload(fail=False)
+
+    def asset_failed(self, failure):
+        # A streamed file cut off halfway cannot be resumed; ranged part
+        # files are kept for the next run
+        request = failure.request
+        asset_url = request.meta["asset_url"]
+        if request.meta.get("asset_stream"):
+            self.asset_store.discard(asset_url)
+        if failure.check(HttpError):
+            error = f"HTTP {failure.value.response.status}"
+        else:
+            error = f"{failure.type.__name__}: {failure.getErrorMessage()}"
+        self.logger.warning(f"[!] Asset download failed ({error}): {asset_url}")
+
+    def crawl_next_chunk(self, response, asset_url, offset):
+        # Scheduled on the engine directly so chunks of one file keep the
+        # depth of the page that linked it and never hit DEPTH_LIMIT
+        request = self.asset_request(asset_url, offset=offset)
+        request.meta["depth"] = response.meta.get("depth", 0)
+        self.crawler.engine.crawl(request)
+
+    @timed_callback
+    def download_file(self, response):
+        asset_url = response.meta.get("asset_url", response.url)
+        if response.status == 304:
+            previous = self.history.get(asset_url)
+            if previous is not None:
+                self.history.touch(asset_url)
+                self.asset_hashes.add(previous["content_hash"])
+            self.logger.info(f"[=] Unchanged asset: {asset_url}")
+            return
+
+        if response.meta.get("asset_skip"):
+            self.asset_store.discard(asset_url)
+            self.logger.info(f"[-] Skipped asset ({response.meta['asset_skip']}): {asset_url}")
+            return
+
+        if response.meta.get("asset_head"):
+            reason = None
+            if response.status not in HEAD_FALLBACK_STATUSES:
+                reason = self.asset_store.check_headers(asset_url, response.headers, self.asset_hashes)
+            if reason:
+                self.logger.info(f"[-] Skipped asset ({reason}): {asset_url}")
+                return
+            self.crawl_next_chunk(response, asset_url, 0)
+            return
+
+        if response.status == 416 and response.meta.get("asset_offset"):
+            # The part file no longer matches the remote file
+            self.asset_store.discard(asset_url)
+            self.crawl_next_chunk(response, asset_url, 0)
+            return
+
+        if response.meta.get("asset_stream"):
+            # Already on disk, see asset_bytes_received
+            self.asset_store.end_stream(asset_url)
+            next_offset = None
+        else:
+            try:
+                next_offset = self.asset_store.write_chunk(response, response.meta.get("asset_offset", 0))
+            except ValueError as e:
+                self.logger.warning(f"[!] Skipped asset ({e}): {asset_url}")
+                return
+        if next_offset is not None:
+            self.crawl_next_chunk(response, asset_url, next_offset)
+            return
+
+        file_hash, path, duplicate = self.asset_store.finish(response, self.asset_hashes)
+        self.remember(response, file_hash)
+        if duplicate:
+            self.logger.info(f"[-] Skipped duplicate file (hash matched): {asset_url}")
+            return
+
+        self.asset_hashes.add(file_hash)
+        self.logger.info(f"[✓] Downloaded asset: {asset_url} -> {path}")
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.closed, signal=signals.spider_closed)
+        if spider.download:
+            spider.asset_store = AssetStore(
+                spider.output_dir / "assets",
+                spider.output_dir / "asset-manifest.jsonl",
+                max_size=crawler.settings.getint("ASSET_MAX_SIZE", ASSET_MAX_SIZE),
+                chunk_size=crawler.settings.getint("ASSET_CHUNK_SIZE", ASSET_CHUNK_SIZE),
+                mime_types=crawler.settings.getlist("ASSET_MIME_TYPES", ASSET_MIME_TYPES),
+                skip_mime_types=crawler.settings.getlist("ASSET_SKIP_MIME_TYPES", ASSET_SKIP_MIME_TYPES),
+                logger=spider.logger,
+            )
+            spider.asset_priority = crawler.settings.getint("ASSET_PRIORITY", ASSET_PRIORITY)
+            spider.asset_head_check = crawler.settings.getbool("ASSET_HEAD_CHECK", ASSET_HEAD_CHECK)
+            crawler.signals.connect(spider.asset_headers_received, signal=signals.headers_received)
+            crawler.signals.connect(spider.asset_bytes_received, signal=signals.bytes_received)
+        if spider.archive:
+            spider.archive.max_size = crawler.settings.getint("ARCHIVE_MAX_SIZE", ARCHIVE_MAX_SIZE)
+            spider.archive.level = crawler.settings.getint("ARCHIVE_COMPRESS_LEVEL", ARCHIVE_COMPRESS_LEVEL)
+        if spider.rich_content:
+            settings = crawler.settings
+            spider.content_pool = ContentPool(
+                kind=settings.get("CONTENT_POOL", CONTENT_POOL),
+                workers=settings.getint("CONTENT_WORKERS", CONTENT_WORKERS),
+                batch_size=settings.getint("CONTENT_BATCH_SIZE", CONTENT_BATCH_SIZE),
+            )
+        settings = crawler.settings
+        spider.extractor = LinkExtractor(
+            spider.extractor.backend,
+            asset_extensions=settings.getlist("ASSET_EXTENSIONS", ASSET_EXTENSIONS),
+            anchors=spider.extractor.anchors,
+        )
+        spider.scorer = LinkScorer(
+            spider.rules,
+            spider.filter,
+            spider.pattern,
+            match=settings.getint("PRIORITY_MATCH", PRIORITY_MATCH),
+            hub=settings.getint("PRIORITY_HUB", PRIORITY_HUB),
+            anchor=settings.getint("PRIORITY_ANCHOR", PRIORITY_ANCHOR),
+            path=settings.getint("PRIORITY_PATH", PRIORITY_PATH),
+            depth=settings.getint("PRIORITY_DEPTH", PRIORITY_DEPTH),
+            # A level above the assets, out of reach of their chunk, redirect
+            # and retry adjustments
+            floor=spider.asset_priority + PRIORITY_DEPTH,
+        )
+        if settings.getbool("CANONICALIZE_URLS", True):
+            spider.canonicalizer = UrlCanonicalizer(
+                drop_params=settings.getlist("CANONICAL_DROP_PARAMS", CANONICAL_DROP_PARAMS),
+                keep_params=settings.getlist("CANONICAL_KEEP_PARAMS", CANONICAL_KEEP_PARAMS),
+                sort_query=settings.getbool("CANONICAL_SORT_QUERY", CANONICAL_SORT_QUERY),
+                lowercase_path=settings.getbool("CANONICAL_LOWERCASE_PATH", CANONICAL_LOWERCASE_PATH),
+                trailing_slash=settings.get("CANONICAL_TRAILING_SLASH", CANONICAL_TRAILING_SLASH),
+            )
+        spider.traps = TrapGuard(
+            max_per_template=settings.getint("TRAP_MAX_PER_TEMPLATE", TRAP_MAX_PER_TEMPLATE),
+            max_segment_repeats=settings.getint("TRAP_MAX_SEGMENT_REPEATS", TRAP_MAX_SEGMENT_REPEATS),
+            urls=spider.urls,
+        )
+        if spider.near_duplicates:
+            spider.duplicates = NearDuplicates(
+                distance=crawler.settings.getint("NEAR_DUPLICATE_DISTANCE", NEAR_DUPLICATE_DISTANCE),
+                min_words=crawler.settings.getint("NEAR_DUPLICATE_MIN_WORDS", NEAR_DUPLICATE_MIN_WORDS),
+            )
+        if spider.graph:
+            spider.graph.damping = settings.getfloat("PAGERANK_DAMPING", PAGERANK_DAMPING)
+            spider.graph.iterations = settings.getint("PAGERANK_ITERATIONS", PAGERANK_ITERATIONS)
+            spider.graph.tolerance = settings.getfloat("PAGERANK_TOLERANCE", PAGERANK_TOLERANCE)
+            spider.graph.min_priority = settings.getfloat("SITEMAP_MIN_PRIORITY", SITEMAP_MIN_PRIORITY)
+        if spider.link_checker:
+            crawler.signals.connect(spider.link_check_headers_received, signal=signals.headers_received)
+            crawler.signals.connect(spider.link_check_idle, signal=signals.spider_idle)
+        return spider
+
+    def closed(self, reason):
+        started = time.perf_counter()
+        first_close = not self._crawl_logged
+        if self.content_pool:
+            self.content_pool.close()
+            self.content_pool = None
+        if hasattr(self, "unusual_log_file"):
+            self.unusual_log_file.close()
+        if self.asset_store:
+            self.asset_store.close()
+        if self.archive:
+            self.archive.close()
+            self.logger.info(f"[✓] Archived {self.archive.records} responses -> {self.archive.directory}")
+            self.archive = None
+        if self.replay:
+            self.replay.close()
+
+        if self.exporter:
+            self.exporter.close()
+        elif not self.frontier:
+            self.logger.warning(f"[!] Unsupported export format: {self.export}")
+
+        if not self._crawl_logged:
+            self._crawl_logged = True
+            pages = len(self.visited_urls)
+            self.logger.info(f"[✓] Crawl complete: {pages} pages")
+            if getattr(self, "crawler", None):
+                self.crawler.stats.set_value("spidercore/pages", pages)
+            if self.link_checker:
+                checked, broken = self.link_checker.write_report(self.link_report_file)
+                self.logger.info(f"[✓] Link check: {checked} links, {broken} broken -> {self.link_report_file}")
+            if self.coverage:
+                orphans, unlisted = self.coverage.write(self.coverage_file)
+                self.logger.info(
+                    f"[✓] Sitemap coverage: {orphans} sitemap URLs not reached by links, "
+                    f"{unlisted} linked pages not in the sitemap -> {self.coverage_file}"
+                )
+            if self.graph:
+                self.graph.write(self.graph_file)
+                orphans = self.graph.write_report(self.graph_report_file)
+                self.logger.info(
+                    f"[✓] Link graph: {len(self.graph.rows)} pages, {len(self.graph.analysis()['targets'])} links, "
+                    f"{orphans} orphans -> {self.graph_file}, {self.graph_report_file}"
+                )
+
+        if self.history and not self.history.closed:
+            counts = self.history.write_diff(self.diff_file)
+            self.logger.info(
+                f"[✓] Crawl diff: {counts['added']} added, {counts['removed']} removed, "
+                f"{counts['changed']} changed -> {self.diff_file}"
+            )
+            self.history.close()
+
+        if self.state:
+            self.state.close()
+
+        if self.frontier and not self.frontier.closed:
+            self.frontier.finish(self.worker)
+            self.frontier.close()
+
+        if first_close and getattr(self, "crawler", None):
+            self.crawler.stats.set_value("spidercore/close_seconds", round(time.perf_counter() - started, 4))
@@ -0,0 +1,350 @@
+# spidercore/state.py
+
+import json
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from scrapy import signals
+from scrapy.utils.request import request_from_dict
+from spidercore.assets import AssetLane, ASSET_CONCURRENCY
+from spidercore.priority import PageBudget
+
+# Writes are batched into transactions of this many statements, or of
+# whatever accumulated in COMMIT_INTERVAL seconds, whichever comes first
+COMMIT_EVERY = 500
+COMMIT_INTERVAL = 1.0
+
+
+class SqliteStore:
+    # SQLite database in WAL mode with batched commits
+    schema = ""
+
+    def __init__(self, path, commit_every=COMMIT_EVERY, check_same_thread=True):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=check_same_thread)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.schema)
+        self.commit_every = commit_every
+        self.commit()
+        self.closed = False
+
+    def write(self, sql, params=()):
+        cursor = self.db.execute(sql, params)
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every or time.monotonic() - self.last_commit >= COMMIT_INTERVAL:
+            self.commit()
+        return cursor
+
+    def commit(self):
+        self.db.commit()
+        self.pending_writes = 0
+        self.last_commit = time.monotonic()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.commit()
+        self.db.close()
+
+
+class CrawlState(SqliteStore):
+    # Store holding everything a crawl needs to resume: the pending
+    # frontier, request fingerprints already scheduled, visited pages,
+    # exported page records, seen assets and asset hashes.
+    schema = """
+        CREATE TABLE IF NOT EXISTS frontier (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            priority INTEGER NOT NULL,
+            taken INTEGER NOT NULL DEFAULT 0,
+            request BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS frontier_order ON frontier (taken, priority DESC, id);
+        CREATE TABLE IF NOT EXISTS seen (fingerprint TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS assets (url TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS asset_hashes (hash TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, record TEXT NOT NULL);
+    """
+
+    def __init__(self, state_dir, **kwargs):
+        self.state_dir = Path(state_dir)
+        super().__init__(self.state_dir / "crawl.sqlite3", **kwargs)
+        # Requests that were in flight when the last run stopped go back in the queue
+        self.write("UPDATE frontier SET taken = 0 WHERE taken = 1")
+        self.commit()
+
+    def add_page(self, entry):
+        self.write(
+            "INSERT OR REPLACE INTO pages (url, record) VALUES (?, ?)",
+            (entry["url"], json.dumps(entry, ensure_ascii=False)),
+        )
+
+    def iter_pages(self):
+        for (record,) in self.db.execute("SELECT record FROM pages ORDER BY rowid"):
+            yield json.loads(record)
+
+    def stored_set(self, table):
+        return StoredSet(self, table)
+
+
+class StoredSet:
+    # The subset of the set API the spider uses, backed by a state table
+    columns = {"visited": "url", "assets": "url", "asset_hashes": "hash", "seen": "fingerprint"}
+
+    def __init__(self, state, table):
+        self.state = state
+        self.table = table
+        self.column = self.columns[table]
+
+    def __contains__(self, value):
+        sql = f"SELECT 1 FROM {self.table} WHERE {self.column} = ?"
+        return self.state.db.execute(sql, (value,)).fetchone() is not None
+
+    def add(self, value):
+        self.state.write(f"INSERT OR IGNORE INTO {self.table} ({self.column}) VALUES (?)", (value,))
+
+    def __len__(self):
+        return self.state.db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def __iter__(self):
+        for (value,) in self.state.db.execute(f"SELECT {self.column} FROM {self.table}"):
+            yield value
+
+
+class SqliteScheduler:
+    # Scrapy scheduler that keeps the frontier and the dupefilter in the
+    # spider's CrawlState instead of memory, so pending requests survive a
+    # restart and memory stays flat however large the frontier grows.
+    # Page requests are held to the spider's max_pages and asset requests
+    # go through an AssetLane like in PriorityScheduler. Enabled by run.py when --state-dir is given.
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.spider = None
+        self.state = None
+        self.pending = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = cls(crawler)
+        crawler.signals.connect(scheduler.request_done, signal=signals.request_left_downloader)
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        self.state = spider.state
+        if self.state is None:
+            raise ValueError("SqliteScheduler requires the spider to be started with state_dir")
+        self.seen = self.state.stored_set("seen")
+        self.budget = PageBudget(spider.max_pages, len(spider.visited_urls))
+        self.lane = AssetLane(self.crawler, self.crawler.settings.getint("ASSET_CONCURRENCY", ASSET_CONCURRENCY))
+        self.pending = self.state.db.execute("SELECT COUNT(*) FROM frontier WHERE taken = 0").fetchone()[0]
+        if self.pending:
+            spider.logger.info(f"[*] Resuming crawl with {self.pending} queued requests")
+
+    def close(self, reason):
+        self.state.commit()
+
+    def fingerprint(self, request):
+        return self.crawler.request_fingerprinter.fingerprint(request).hex()
+
+    def enqueue_request(self, request):
+        if not request.dont_filter:
+            fingerprint = self.fingerprint(request)
+            if fingerprint in self.seen:
+                self.stats.inc_value("dupefilter/filtered")
+                return False
+            self.seen.add(fingerprint)
+        try:
+            data = pickle.dumps(request.to_dict(spider=self.spider), protocol=4)
+        except ValueError as e:
+            self.spider.logger.warning(f"[!] Unable to persist request {request.url}: {e}")
+            return False
+        self.state.write(
+            "INSERT INTO frontier (priority, request) VALUES (?, ?)",
+            (request.priority, data),
+        )
+        self.pending += 1
+        self.stats.inc_value("scheduler/enqueued")
+        self.stats.inc_value("scheduler/enqueued/sqlite")
+        return True
+
+    def next_request(self):
+        request = self.lane.release()
+        if request is not None:
+            return request
+        while True:
+            row = self.state.db.execute(
+                "SELECT id, request FROM frontier WHERE taken = 0 ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            frontier_id, data = row
+            self.pending -= 1
+            request = request_from_dict(pickle.loads(data), spider=self.spider)
+            if not self.budget.admit(request, self.spider):
+                self.state.write("DELETE FROM frontier WHERE id = ?", (frontier_id,))
+                self.stats.inc_value("spidercore/over_budget")
+                continue
+            # Held assets stay taken, a restart puts them back in the queue
+            self.state.write("UPDATE frontier SET taken = 1 WHERE id = ?", (frontier_id,))
+            request.meta["frontier_id"] = frontier_id
+            self.stats.inc_value("scheduler/dequeued")
+            self.stats.inc_value("scheduler/dequeued/sqlite")
+            if self.lane.hold(request):
+                # Set aside; a page may still be queued behind it
+                continue
+            return request
+
+    def request_done(self, request, spider):
+        frontier_id = request.meta.get("frontier_id")
+        if frontier_id is not None:
+            self.state.write("DELETE FROM frontier WHERE id = ?", (frontier_id,))
+
+    def has_pending_requests(self):
+        return self.pending > 0 or len(self.lane) > 0
+
+    def __len__(self):
+        return self.pending + len(self.lane)
+
+
+class CrawlHistory(SqliteStore):
+    # Per-URL validators, content hashes and outgoing links remembered
+    # between runs for --incremental recrawls. Every run gets an id so the
+    # URLs of this run can be diffed against the previous one.
+    schema = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS urls (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            lastmod TEXT,
+            entry TEXT,
+            links TEXT NOT NULL DEFAULT '[]',
+            assets TEXT NOT NULL DEFAULT '[]',
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            changed INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS urls_last_seen ON urls (last_seen);
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(path, **kwargs)
+        self.db.row_factory = sqlite3.Row
+        previous = self.db.execute("SELECT MAX(id) FROM runs").fetchone()[0]
+        self.previous_run = previous or 0
+        started = datetime.utcnow().replace(microsecond=0).isoformat() + "+00:00"
+        self.run_id = self.write("INSERT INTO runs (started) VALUES (?)", (started,)).lastrowid
+        self.commit()
+
+    def get(self, url):
+        return self.db.execute("SELECT * FROM urls WHERE url = ?", (url,)).fetchone()
+
+    def validators(self, url):
+        row = self.db.execute("SELECT etag, last_modified FROM urls WHERE url = ?", (url,)).fetchone()
+        return (row["etag"], row["last_modified"]) if row else (None, None)
+
+    def save(self, url, response, content_hash, lastmod=None, entry=None, links=(), assets=()):
+        previous = self.get(url)
+        changed = previous is not None and previous["content_hash"] != content_hash
+        self.write(
+            """
+            INSERT INTO urls (url, etag, last_modified, content_hash, lastmod, entry, links, assets,
+                              first_seen, last_seen, changed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                content_hash = excluded.content_hash,
+                lastmod = excluded.lastmod,
+                entry = excluded.entry,
+                links = excluded.links,
+                assets = excluded.assets,
+                last_seen = excluded.last_seen,
+                changed = COALESCE(excluded.changed, urls.changed)
+            """,
+            (
+                url,
+                header_text(response, "ETag"),
+                header_text(response, "Last-Modified"),
+                content_hash,
+                lastmod,
+                json.dumps(entry, ensure_ascii=False) if entry else None,
+                json.dumps(list(links)),
+                json.dumps(list(assets)),
+                self.run_id,
+                self.run_id,
+                self.run_id if changed else None,
+            ),
+        )
+
+    def touch(self, url):
+        self.write("UPDATE urls SET last_seen = ? WHERE url = ?", (self.run_id, url))
+
+    def lastmod(self, url, response, content_hash):
+        # Prefer the server's Last-Modified; otherwise keep the previous
+        # lastmod while the content hash is unchanged
+        last_modified = http_date_to_iso(header_text(response, "Last-Modified"))
+        if last_modified:
+            return last_modified
+        previous = self.get(url)
+        if previous is not None and previous["content_hash"] == content_hash and previous["lastmod"]:
+            return previous["lastmod"]
+        return datetime.utcnow().replace(microsecond=0).isoformat() + "+00:00"
+
+    def diff(self):
+        # Sitemap URLs (rows with an exported entry) added, removed and
+        # changed in this run relative to the previous one
+        queries = {
+            "added": ("SELECT url FROM urls WHERE entry IS NOT NULL AND first_seen = ? AND last_seen = ?",
+                      (self.run_id, self.run_id)),
+            "removed": ("SELECT url FROM urls WHERE entry IS NOT NULL AND last_seen = ?",
+                        (self.previous_run,)),
+            "changed": ("SELECT url FROM urls WHERE entry IS NOT NULL AND changed = ? AND first_seen < ?",
+                        (self.run_id, self.run_id)),
+        }
+        return {name: (row[0] for row in self.db.execute(sql, params)) for name, (sql, params) in queries.items()}
+
+    def write_diff(self, path):
+        self.commit()
+        counts = {}
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f'{{\n  "run": {self.run_id},\n  "previous_run": {self.previous_run}')
+            for name, urls in self.diff().items():
+                f.write(f',\n  "{name}": [')
+                counts[name] = 0
+                for url in urls:
+                    sep = "," if counts[name] else ""
+                    f.write(f"{sep}\n    {json.dumps(url, ensure_ascii=False)}")
+                    counts[name] += 1
+                f.write("\n  ]")
+            f.write("\n}\n")
+        return counts
+
+
+def header_text(response, name):
+    value = response.headers.get(name)
+    return value.decode("latin-1") if value else None
+
+
+def http_date_to_iso(value):
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
@@ -0,0 +1,124 @@
+# spidercore/urlstore.py
+
+from array import array
+
+# Width of the directory ID at the start of every interned key
+PREFIX_BYTES = 4
+
+
+class UrlStore:
+    # Interns every URL of a crawl once and gives it an integer ID, so the
+    # visited pages, the assets, the trap guard and the HTML sitemap tree
+    # can refer to a URL by ID instead of each keeping its own copy. URLs
+    # are split after their last "/": the directory ("https://host/a/b/"),
+    # shared by all its pages, is stored once, and each URL is kept as a
+    # short bytes key of directory ID plus the rest ("page.html?x=1").
+    def __init__(self):
+        # Directory -> its ID as the key header, and the directories by ID
+        self.prefix_ids = {}
+        self.prefixes = []
+        self.ids = {}
+        self.keys = []
+
+    def split(self, url):
+        cut = url.rfind("/") + 1
+        return url[:cut], url[cut:].encode("utf-8", "surrogatepass")
+
+    def add(self, url):
+        prefix, rest = self.split(url)
+        header = self.prefix_ids.get(prefix)
+        if header is None:
+            header = self.prefix_ids[prefix] = len(self.prefixes).to_bytes(PREFIX_BYTES, "little")
+            self.prefixes.append(prefix)
+        key = header + rest
+        url_id = self.ids.get(key)
+        if url_id is None:
+            url_id = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return url_id
+
+    def get(self, url):
+        # ID of a URL seen before, or None; unlike add() nothing is stored
+        prefix, rest = self.split(url)
+        header = self.prefix_ids.get(prefix)
+        if header is None:
+            return None
+        return self.ids.get(header + rest)
+
+    def url(self, url_id):
+        key = self.keys[url_id]
+        prefix = self.prefixes[int.from_bytes(key[:PREFIX_BYTES], "little")]
+        return prefix + key[PREFIX_BYTES:].decode("utf-8", "surrogatepass")
+
+    def __contains__(self, url):
+        return self.get(url) is not None
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class UrlSet:
+    # A set of URLs from a UrlStore, one bit per URL ID. Offers the subset
+    # of the set API the spider uses on visited_urls and assets.
+    def __init__(self, store):
+        self.store = store
+        self.bits = bytearray()
+        self.count = 0
+
+    def add(self, url):
+        self.add_id(self.store.add(url))
+
+    def add_id(self, url_id):
+        byte, bit = url_id >> 3, 1 << (url_id & 7)
+        if byte >= len(self.bits):
+            # Grow geometrically, IDs only ever increase
+            self.bits.extend(bytes(max(byte + 1, 2 * len(self.bits)) - len(self.bits)))
+        if not self.bits[byte] & bit:
+            self.bits[byte] |= bit
+            self.count += 1
+
+    def has_id(self, url_id):
+        byte = url_id >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (url_id & 7)))
+
+    def __contains__(self, url):
+        url_id = self.store.get(url)
+        return url_id is not None and self.has_id(url_id)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for byte, value in enumerate(self.bits):
+            if value:
+                for bit in range(8):
+                    if value & (1 << bit):
+                        yield self.store.url(byte * 8 + bit)
+
+
+class PageList:
+    # (url, title) records held as an array of URL IDs plus titles, for
+    # exporters that keep every page until the crawl is over
+    __slots__ = ("store", "ids", "titles")
+
+    def __init__(self, store):
+        self.store = store
+        self.ids = array("L")
+        self.titles = []
+
+    def append(self, url, title=""):
+        self.ids.append(self.store.add(url))
+        self.titles.append(title or "")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [(self.store.url(i), t) for i, t in zip(self.ids[index], self.titles[index])]
+        return self.store.url(self.ids[index]), self.titles[index]
+
+    def __iter__(self):
+        url = self.store.url
+        for url_id, title in zip(self.ids, self.titles):
+            yield url(url_id), title
@@ -0,0 +1,73 @@
+# tests/test_archive.py
+
+import gzip
+
+from scrapy import Request
+from scrapy.http import HtmlResponse, Response, TextResponse
+
+from spidercore.archive import ArchiveReader, WarcWriter
+
+URL = "https://example.com/docs/?page=2"
+BODY = b"<html><head><title>Docs</title></head><body>Caf\xc3\xa9</body></html>"
+
+
+def html_response(url=URL, body=BODY, status=200):
+    return HtmlResponse(
+        url,
+        status=status,
+        headers={"Content-Type": "text/html; charset=utf-8", "Content-Length": "999", "X-Cache": ["a", "b"]},
+        body=body,
+        request=Request(url),
+    )
+
+
+def test_archived_responses_replay(tmp_path):
+    writer = WarcWriter(tmp_path)
+    writer.write(Request(URL), html_response())
+    writer.write(Request("https://example.com/gone"), Response("https://example.com/gone", status=404))
+    writer.close()
+    assert writer.records == 2
+
+    reader = ArchiveReader(tmp_path)
+    assert len(reader) == 2 and Request(URL) in reader
+    replayed = reader.response_for(Request(URL))
+    assert isinstance(replayed, HtmlResponse)
+    assert replayed.status == 200 and replayed.body == BODY and replayed.flags == ["archived"]
+    assert replayed.css("title::text").get() == "Docs"
+    assert replayed.headers.getlist("X-Cache") == [b"a", b"b"]
+    # Content-Length describes the archived body, not what was on the wire
+    assert replayed.headers["Content-Length"] == str(len(BODY)).encode()
+    assert reader.response_for(Request("https://example.com/gone")).status == 404
+    assert reader.response_for(Request(URL, method="POST")) is None
+    assert reader.response_for(Request("https://example.com/other")) is None
+    reader.close()
+
+
+def test_warc_files_are_plain_gzip_and_rotate(tmp_path):
+    writer = WarcWriter(tmp_path, max_size=1)
+    for i in range(3):
+        url = f"https://example.com/{i}"
+        writer.write(Request(url), TextResponse(url, body=b"text", encoding="utf-8"))
+    writer.close()
+
+    files = sorted(tmp_path.glob("*.warc.gz"))
+    assert len(files) == 3
+    with gzip.open(files[0], "rb") as f:
+        content = f.read()
+    assert content.startswith(b"WARC/1.1\r\nWARC-Type: warcinfo")
+    assert content.count(b"WARC-Type: response") == content.count(b"WARC-Type: request") == 1
+    assert b"GET /0 HTTP/1.1\r\nHost: example.com" in content
+
+
+def test_latest_copy_wins_and_partial_index_lines_are_skipped(tmp_path):
+    for name, body in (("a", b"old"), ("b", b"new")):
+        writer = WarcWriter(tmp_path, name=name)
+        writer.write(Request(URL), html_response(body=body))
+        writer.close()
+    with open(next(tmp_path.glob("b-*.index.jsonl")), "a", encoding="utf-8") as f:
+        f.write('{"method": "GET", "url": "https://exa')
+
+    reader = ArchiveReader(tmp_path)
+    assert len(reader) == 1
+    assert reader.response_for(Request(URL)).body == b"new"
+    reader.close()
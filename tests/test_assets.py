@@ -0,0 +1,115 @@
+# tests/test_assets.py
+
+import base64
+import hashlib
+import json
+
+import pytest
+from scrapy import Request
+from scrapy.http import Headers, Response
+
+from spidercore.assets import AssetStore, advertised_sha256, parse_content_range
+
+URL = "https://example.com/files/data.bin"
+BODY = b"0123456789"
+
+
+def store(tmp_path, **kwargs):
+    return AssetStore(tmp_path / "assets", tmp_path / "assets.jsonl", **kwargs)
+
+
+def chunk(start, end, total=len(BODY), status=206, body=None):
+    headers = {"Content-Range": f"bytes {start}-{end}/{total}", "ETag": '"v1"'} if status == 206 else {}
+    return Response(
+        URL,
+        status=status,
+        headers=headers,
+        body=BODY[start:end + 1] if body is None else body,
+        request=Request(URL, meta={"asset_url": URL}),
+    )
+
+
+def test_chunks_resume_after_a_restart(tmp_path):
+    assets = store(tmp_path, chunk_size=4)
+    assert assets.write_chunk(chunk(0, 3), 0) == 4
+    assets.close()
+
+    # A new store picks the part file up and rebuilds the running hash
+    assets = store(tmp_path, chunk_size=4)
+    assert assets.resume_offset(URL) == 4
+    assert assets.validator(URL) == '"v1"'
+    assert assets.write_chunk(chunk(4, 7), 4) == 8
+    assert assets.write_chunk(chunk(8, 9), 8) is None
+    digest, path, duplicate = assets.finish(chunk(8, 9), set())
+    assets.close()
+
+    assert digest == hashlib.sha256(BODY).hexdigest()
+    assert path.read_bytes() == BODY and path.suffix == ".bin"
+    assert not duplicate and assets.resume_offset(URL) == 0
+    record = json.loads((tmp_path / "assets.jsonl").read_text(encoding="utf-8"))
+    assert record == {"url": URL, "sha256": digest, "size": 10, "path": str(path), "etag": '"v1"'}
+
+
+def test_full_body_instead_of_a_range_starts_over(tmp_path):
+    assets = store(tmp_path, chunk_size=4)
+    assets.write_chunk(chunk(0, 3), 0)
+    assert assets.write_chunk(chunk(0, 9, status=200, body=BODY), 4) is None
+    digest, path, _ = assets.finish(chunk(0, 9, status=200, body=BODY), set())
+    assert path.read_bytes() == BODY
+    assets.close()
+
+
+def test_unasked_range_restarts_from_zero(tmp_path):
+    assets = store(tmp_path, chunk_size=4)
+    assets.write_chunk(chunk(0, 3), 0)
+    assert assets.write_chunk(chunk(8, 9), 4) == 0
+    assert assets.resume_offset(URL) == 0
+    assets.close()
+
+
+def test_chunks_stop_at_the_size_limit(tmp_path):
+    assets = store(tmp_path, chunk_size=4, max_size=6)
+    assets.write_chunk(chunk(0, 3, total="*"), 0)
+    with pytest.raises(ValueError, match="exceeds limit 6"):
+        assets.write_chunk(chunk(4, 7, total="*"), 4)
+    assert assets.resume_offset(URL) == 0
+    assets.close()
+
+
+def test_stream_writes_whole_responses_and_stops_at_the_size_limit(tmp_path):
+    assets = store(tmp_path, max_size=8)
+    assets.start_stream(URL, Headers({"ETag": '"v2"'}))
+    assert assets.write_stream(URL, BODY[:4]) is None
+    assert assets.write_stream(URL, BODY[4:8]) is None
+    assert assets.write_stream(URL, BODY[8:]) == "size 10 exceeds limit 8"
+    assets.discard(URL)
+    assert assets.resume_offset(URL) == 0 and not assets.streams
+
+    # A restarted stream truncates what an earlier attempt left behind
+    assets.max_size = 0
+    assets.start_stream(URL, Headers({"ETag": '"v2"'}))
+    assets.write_stream(URL, BODY)
+    assets.end_stream(URL)
+    digest, path, _ = assets.finish(chunk(0, 9, status=200, body=BODY), set())
+    assert digest == hashlib.sha256(BODY).hexdigest() and path.read_bytes() == BODY
+    assets.close()
+
+
+def test_check_headers(tmp_path):
+    assets = store(tmp_path, max_size=100)
+    known = {"ab" * 32}
+    assert assets.check_headers(URL, Headers({"Content-Length": "101"}), known) == "size 101 exceeds limit 100"
+    assert assets.check_headers(URL, Headers({"Content-Range": "bytes 0-9/500"}), known) == "size 500 exceeds limit 100"
+    assert assets.check_headers(URL, Headers({"Content-Type": "text/html; charset=utf-8"}), known) == "content type text/html"
+    assert assets.check_headers(URL, Headers({"Content-Type": "text/html"}), known, check_type=False) is None
+    digest = bytes.fromhex("ab" * 32)
+    header = f"sha-256=:{base64.b64encode(digest).decode()}:"
+    assert assets.check_headers(URL, Headers({"Repr-Digest": header}), known) == f"known hash {'ab' * 32}"
+    assets.close()
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 0-1023/4096") == (0, 1023, 4096)
+    assert parse_content_range("bytes 0-1023/*") == (0, 1023, None)
+    assert parse_content_range("") is None
+    assert advertised_sha256(Headers({})) is None
@@ -0,0 +1,41 @@
+# tests/test_batch.py
+
+from types import SimpleNamespace
+
+from scrapy.settings import Settings
+
+from spidercore.batch import BatchRun, read_seeds
+
+
+def test_read_seeds(tmp_path):
+    path = tmp_path / "seeds.txt"
+    path.write_text(
+        "# nightly sites\n"
+        "https://example.com/\n"
+        "\n"
+        "example.org  # no scheme\n"
+        "https://example.com/blog/\n",
+        encoding="utf-8",
+    )
+    assert read_seeds(path) == ["https://example.com/", "https://example.org"]
+
+
+def crawler():
+    return SimpleNamespace(engine=SimpleNamespace(downloader=SimpleNamespace(total_concurrency=0)))
+
+
+def test_concurrency_is_shared_between_running_sites():
+    process = SimpleNamespace(settings=Settings({"CONCURRENT_REQUESTS": 64}))
+    batch = BatchRun(process, [], {}, max_sites=3, concurrency=30)
+    batch.running = [crawler(), crawler(), crawler()]
+    batch.share_concurrency()
+    assert [c.engine.downloader.total_concurrency for c in batch.running] == [10, 10, 10]
+    # A finished site's share goes to the ones still running
+    batch.running.pop()
+    batch.share_concurrency()
+    assert [c.engine.downloader.total_concurrency for c in batch.running] == [15, 15]
+
+
+def test_concurrency_defaults_to_concurrent_requests():
+    process = SimpleNamespace(settings=Settings({"CONCURRENT_REQUESTS": 64}))
+    assert BatchRun(process, [], {}).concurrency == 64
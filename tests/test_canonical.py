@@ -0,0 +1,66 @@
+# tests/test_canonical.py
+
+import pytest
+
+from spidercore.canonical import TrapGuard, UrlCanonicalizer, url_template
+from spidercore.urlstore import UrlStore
+
+
+def test_one_spelling_per_page():
+    canonical = UrlCanonicalizer().canonicalize
+    assert canonical("HTTPS://Example.COM:443/a?b=2&utm_source=x&a=1#top") == "https://example.com/a?a=1&b=2"
+    assert canonical("http://example.com:8080") == "http://example.com:8080/"
+    assert canonical("https://example.com/cart;jsessionid=ABC;v=2?SID=9") == "https://example.com/cart;v=2"
+    assert canonical("https://user:pw@[::1]/x") == "https://user:pw@[::1]/x"
+    # Only parameter names are decoded, values keep their encoding
+    assert canonical("https://example.com/s?q=a%20b&utm%5Fmedium=mail") == "https://example.com/s?q=a%20b"
+
+
+def test_keep_params_and_path_options():
+    canonical = UrlCanonicalizer(
+        keep_params=["page", "q"], sort_query=False, lowercase_path=True, trailing_slash="add",
+    ).canonicalize
+    assert canonical("https://example.com/Docs?z=1&q=x&page=2") == "https://example.com/docs/?q=x&page=2"
+    assert canonical("https://example.com/Docs/Guide.HTML") == "https://example.com/docs/guide.html"
+    strip = UrlCanonicalizer(trailing_slash="strip").canonicalize
+    assert strip("https://example.com/docs//") == "https://example.com/docs"
+    assert strip("https://example.com/") == "https://example.com/"
+
+
+def test_unknown_trailing_slash_mode():
+    with pytest.raises(ValueError, match="Unknown trailing slash mode"):
+        UrlCanonicalizer(trailing_slash="sometimes")
+
+
+def test_url_template():
+    assert url_template("https://example.com/shop/12?color=red&sid=1") == "example.com/shop/{n}?color&sid"
+    assert url_template("https://example.com") == "example.com/"
+
+
+def test_trap_guard_caps_templates():
+    traps = TrapGuard(max_per_template=3)
+    for day in range(1, 4):
+        assert traps.admit(f"https://example.com/calendar/2024/{day}") is None
+    assert traps.admit("https://example.com/calendar/2024/4") == (
+        "crawl trap: over 3 URLs like example.com/calendar/{n}/{n}"
+    )
+    # URLs already admitted stay admitted and don't count again
+    assert traps.admit("https://example.com/calendar/2024/1") is None
+    assert traps.admit("https://example.com/about") is None
+
+
+def test_trap_guard_stops_repeating_segments():
+    traps = TrapGuard(max_segment_repeats=2)
+    assert traps.admit("https://example.com/docs/docs/page") is None
+    assert traps.admit("https://example.com/docs/a/docs/b/docs/page") == (
+        "crawl trap: path segment 'docs' repeated 3 times"
+    )
+
+
+def test_trap_guard_keeps_admitted_urls_as_ids():
+    urls = UrlStore()
+    traps = TrapGuard(max_per_template=1, urls=urls)
+    assert traps.admit("https://example.com/p/1") is None
+    assert traps.admit("https://example.com/p/1") is None
+    assert traps.admit("https://example.com/p/2") is not None
+    assert len(traps.admitted) == 1 and "https://example.com/p/1" in urls
@@ -0,0 +1,44 @@
+# tests/test_content.py
+
+from concurrent.futures import Future
+
+from twisted.internet import defer
+
+from spidercore.content import ContentPool, analyze, analyze_batch
+
+PAGE = b"""<html lang="en"><head><title> Getting
+  started </title><meta name="description" content="How to start">
+<link rel="canonical" href="/start"></head>
+<body><h1>Start <b>here</b></h1>
+<p>one two three</p><script>var x = 1;</script></body></html>"""
+
+
+def test_analyze():
+    result = analyze("https://example.com/docs/start?ref=nav", PAGE, "utf-8")
+    assert result == {
+        "title": "Getting started",
+        "description": "How to start",
+        "canonical": "https://example.com/start",
+        "h1": "Start here",
+        "language": "en",
+        "word_count": 5,
+    }
+
+
+def test_batch_reports_errors_per_page():
+    results = analyze_batch([("https://example.com/a", PAGE, "utf-8"), ("https://example.com/b", b"", "utf-8")])
+    assert results[0]["title"] == "Getting started"
+    assert set(results[1]) == {"error"}
+
+
+def test_failed_batch_gives_every_page_its_own_error():
+    pool = ContentPool(kind="thread", workers=1)
+    future = Future()
+    deferreds = [defer.Deferred() for _ in range(3)]
+    pool.outstanding[future] = deferreds
+    future.set_exception(RuntimeError("worker died"))
+    pool.deliver(future)
+    results = [d.result for d in deferreds]
+    assert all(result == {"error": "worker died"} for result in results)
+    assert len({id(result) for result in results}) == 3
+    pool.close()
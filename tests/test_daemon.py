@@ -0,0 +1,105 @@
+# tests/test_daemon.py
+
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from scrapy.settings import Settings
+from twisted.internet import defer
+from twisted.web.test.requesthelper import DummyRequest
+
+from spidercore.daemon import CrawlService, JobError, job_api
+
+
+class Process:
+    # Stands in for the CrawlerProcess; every crawl runs until finish()
+    def __init__(self):
+        self.crawls = []
+
+    def create_crawler(self, spider_cls):
+        return SimpleNamespace(settings=Settings({"DOWNLOAD_DELAY": 1}), stats=None, spider=None, engine=None)
+
+    def crawl(self, crawler, url, **kwargs):
+        d = defer.Deferred()
+        self.crawls.append((url, crawler, kwargs, d))
+        return d
+
+    def finish(self, index, failure=None):
+        d = self.crawls[index][3]
+        d.errback(failure) if failure else d.callback(None)
+
+
+def prepare(options):
+    if "url" not in options:
+        raise ValueError("A job needs a url")
+    return options["url"], {"DOWNLOAD_DELAY": options.get("delay", 1)}, {"max_pages": 10}, None
+
+
+def test_jobs_queue_behind_max_jobs():
+    process = Process()
+    service = CrawlService(process, prepare, max_jobs=1)
+    first = service.submit({"url": "example.com", "delay": 0})
+    second = service.submit({"url": "https://example.org/"})
+    assert (first.state, second.state) == ("running", "queued")
+    assert first.url == "https://example.com" and process.crawls[0][2] == {"max_pages": 10}
+    assert process.crawls[0][1].settings.getint("DOWNLOAD_DELAY") == 0
+
+    with pytest.raises(JobError) as busy:
+        service.submit({"url": "https://example.com/other"})
+    assert busy.value.status == 409
+    with pytest.raises(JobError) as invalid:
+        service.submit({})
+    assert invalid.value.status == 400
+
+    process.finish(0)
+    assert first.state == "finished" and first.crawler is None
+    assert second.state == "running"
+    process.finish(1, RuntimeError("no route to host"))
+    assert second.state == "failed" and second.error == "no route to host"
+
+
+def test_cancelled_jobs_never_start():
+    process = Process()
+    service = CrawlService(process, prepare, max_jobs=1)
+    service.submit({"url": "https://example.com/"})
+    queued = service.submit({"url": "https://example.org/"})
+    assert service.cancel(queued.id).state == "cancelled"
+    with pytest.raises(JobError):
+        service.cancel(queued.id)
+    process.finish(0)
+    assert len(process.crawls) == 1 and queued.finished is not None
+
+
+def test_finished_jobs_are_forgotten():
+    process = Process()
+    service = CrawlService(process, prepare, max_jobs=4, keep_jobs=1)
+    for i in range(3):
+        service.submit({"url": f"https://site{i}.example/"})
+        process.finish(i)
+    service.submit({"url": "https://last.example/"})
+    assert list(service.jobs) == ["3", "4"]
+
+
+def request(method, path, body=None):
+    req = DummyRequest([p.encode() for p in path.strip("/").split("/")[1:]])
+    req.method = method.encode()
+    req.content = io.BytesIO(json.dumps(body).encode() if body is not None else b"")
+    return req
+
+
+def call(api, method, path, body=None):
+    req = request(method, path, body)
+    data = api.getChildWithDefault(b"jobs", req).render(req)
+    return req.responseCode, json.loads(data)
+
+
+def test_job_api():
+    api = job_api(CrawlService(Process(), prepare))
+    status, job = call(api, "POST", "/jobs", {"url": "https://example.com/"})
+    assert status == 201 and job["state"] == "running" and job["id"] == "1"
+    assert call(api, "GET", "/jobs/1")[1]["url"] == "https://example.com/"
+    assert [j["id"] for j in call(api, "GET", "/jobs")[1]] == ["1"]
+    assert call(api, "GET", "/jobs/9") == (404, {"error": "No job 9"})
+    assert call(api, "POST", "/jobs", ["https://example.com/"])[0] == 400
+    assert call(api, "DELETE", "/jobs")[0] == 404
@@ -0,0 +1,55 @@
+# tests/test_discovery.py
+
+import gzip
+import json
+
+from spidercore.discovery import SitemapCoverage, iter_sitemap, sitemaps_from_robots
+
+URLSET = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc> https://example.com/ </loc><lastmod>2024-01-01</lastmod></url>
+  <url><loc>https://example.com/a</loc></url>
+  <url><loc></loc></url>
+</urlset>"""
+
+
+def test_sitemaps_from_robots():
+    robots = "User-agent: *\nDisallow: /tmp\nSITEMAP: https://example.com/a.xml # main\nsitemap:https://example.com/b.xml\nSitemap: https://example.com/a.xml\n"
+    assert sitemaps_from_robots(robots) == ["https://example.com/a.xml", "https://example.com/b.xml"]
+
+
+def test_iter_sitemap_reads_plain_gzipped_and_index_files():
+    expected = [("url", "https://example.com/"), ("url", "https://example.com/a")]
+    assert list(iter_sitemap(URLSET)) == expected
+    assert list(iter_sitemap(gzip.compress(URLSET))) == expected
+    index = b"""<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+      <sitemap><loc>https://example.com/sitemap-1.xml.gz</loc></sitemap></sitemapindex>"""
+    assert list(iter_sitemap(index)) == [("sitemap", "https://example.com/sitemap-1.xml.gz")]
+
+
+def test_iter_sitemap_keeps_what_a_truncated_file_held():
+    urls = "".join(f"<url><loc>https://example.com/{i}</loc></url>" for i in range(5000))
+    body = gzip.compress(f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'.encode())
+    entries = list(iter_sitemap(body[:len(body) // 2]))
+    assert 0 < len(entries) < 5000
+    assert entries[0] == ("url", "https://example.com/0")
+    assert list(iter_sitemap(b"not xml")) == []
+
+
+def test_coverage(tmp_path):
+    coverage = SitemapCoverage()
+    coverage.sitemaps = 1
+    for url in ("https://example.com/", "https://example.com/a", "https://example.com/orphan"):
+        coverage.add_listed(url)
+    coverage.add_page("https://example.com/", ["https://example.com/old-a"], redirects=["http://example.com/"], root=True)
+    coverage.add_page("https://example.com/a", ["https://example.com/b"], redirects=["https://example.com/old-a"])
+    coverage.add_page("https://example.com/b", [])
+    # Fetched only because the sitemap listed it: its links don't count
+    coverage.add_page("https://example.com/orphan", ["https://example.com/c"])
+    coverage.add_page("https://example.com/c", [])
+
+    assert coverage.write(tmp_path / "coverage.json") == (1, 1)
+    report = json.loads((tmp_path / "coverage.json").read_text(encoding="utf-8"))
+    assert report["in_sitemap_not_linked"] == ["https://example.com/orphan"]
+    assert report["linked_not_in_sitemap"] == ["https://example.com/b"]
+    assert report["pages_reached_by_links"] == 3
@@ -0,0 +1,91 @@
+# tests/test_distributed.py
+
+import threading
+
+from spidercore.distributed import SqliteFrontier, partition, parse_address, parse_worker
+
+
+def page_rows(count, parts):
+    return [(i % parts, 0, f"fp{i}", True, f'{{"url": "{i}"}}') for i in range(count)]
+
+
+def test_push_skips_seen_fingerprints(tmp_path):
+    frontier = SqliteFrontier(tmp_path / "frontier.sqlite3")
+    assert frontier.push(page_rows(10, 1)) == 10
+    assert frontier.push(page_rows(12, 1)) == 2
+    # Rows without a fingerprint are always queued
+    assert frontier.push([(0, 0, None, False, "{}"), (0, 0, None, False, "{}")]) == 2
+    assert frontier.pending(0) == 14
+    frontier.close()
+
+
+def test_pop_takes_rows_until_acknowledged(tmp_path):
+    frontier = SqliteFrontier(tmp_path / "frontier.sqlite3")
+    frontier.push(page_rows(6, 2))
+    rows, dropped = frontier.pop(0, 0, 10)
+    assert len(rows) == 3 and dropped == 0
+    assert frontier.pending(0) == 0 and frontier.active() == 6
+    frontier.ack(0)
+    assert frontier.active() == 3
+    frontier.close()
+
+
+def test_pop_drops_queued_pages_once_the_budget_is_spent(tmp_path):
+    frontier = SqliteFrontier(tmp_path / "frontier.sqlite3")
+    frontier.push(page_rows(40, 2))
+    frontier.push([(1, 0, None, False, "{}")])
+    rows, dropped = frontier.pop(0, 0, 5, budget=5)
+    assert len(rows) == 5
+    # Every queued page of every partition goes at once; other requests stay
+    assert dropped == 35
+    assert frontier.pop(1, 1, 10, budget=5) == (["{}"], 0)
+    frontier.close()
+
+
+def test_concurrent_workers_share_the_page_budget(tmp_path):
+    path = tmp_path / "frontier.sqlite3"
+    workers, budget = 4, 50
+    frontier = SqliteFrontier(path)
+    frontier.push(page_rows(400, workers))
+    frontier.close()
+    taken = [0] * workers
+
+    def work(worker):
+        own = SqliteFrontier(path)
+        while True:
+            rows, _ = own.pop(worker, worker, 3, budget)
+            if not rows and not own.pending(worker):
+                break
+            taken[worker] += len(rows)
+        own.close()
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(taken) == budget
+    frontier = SqliteFrontier(path)
+    assert frontier.counter("pages") == budget
+    frontier.close()
+
+
+def test_sync_acknowledges_before_popping(tmp_path):
+    frontier = SqliteFrontier(tmp_path / "frontier.sqlite3")
+    frontier.push(page_rows(2, 1))
+    frontier.pop(0, 0, 1)
+    entry = {"url": "https://example.com/", "title": "Example"}
+    result = frontier.sync(0, page_rows(3, 1), ["https://example.com/"], [entry], pop=10, ack=True)
+    assert result["added"] == 1
+    assert len(result["rows"]) == 2
+    assert result["active"] == 2 and result["visited"] == 1
+    assert list(frontier.iter_pages()) == [entry]
+    frontier.close()
+
+
+def test_partition_and_addresses():
+    assert partition("https://example.com/a", 4) == partition("https://example.com/a", 4)
+    assert 0 <= partition("https://example.com/b", 3) < 3
+    assert parse_worker("1/4") == (1, 4)
+    assert parse_address(":7070") == ("127.0.0.1", 7070)
+    assert parse_address("0.0.0.0:7070") == ("0.0.0.0", 7070)
@@ -0,0 +1,102 @@
+# tests/test_exporters.py
+
+import csv
+import gzip
+import json
+import re
+import xml.etree.ElementTree as ET
+
+from spidercore.exporters import SITEMAP_MAX_URLS, get_exporter
+
+NS = {"sm": "http://www.sitemaps.org/schemas/sitemap/0.9"}
+
+
+def locs(path, opener=open):
+    with opener(path, "rb") as f:
+        return [loc.text for loc in ET.parse(f).getroot().iterfind(".//sm:loc", NS)]
+
+
+def test_large_xml_sitemap_is_split_into_parts_and_an_index(tmp_path):
+    output = tmp_path / "sitemap.xml"
+    exporter = get_exporter("xml", output, base_url="https://example.com/")
+    total = 2 * SITEMAP_MAX_URLS + 1
+    for i in range(total):
+        exporter.write({"url": f"https://example.com/page/{i}?a=1&b=2"})
+    exporter.close()
+
+    assert exporter.count == total
+    assert locs(output) == [f"https://example.com/sitemap-{n}.xml" for n in (1, 2, 3)]
+    parts = [locs(tmp_path / f"sitemap-{n}.xml") for n in (1, 2, 3)]
+    assert [len(part) for part in parts] == [SITEMAP_MAX_URLS, SITEMAP_MAX_URLS, 1]
+    assert parts[0][0] == "https://example.com/page/0?a=1&b=2"
+    assert parts[2] == [f"https://example.com/page/{total - 1}?a=1&b=2"]
+
+
+def test_single_part_becomes_the_sitemap(tmp_path):
+    output = tmp_path / "sitemap.xml"
+    exporter = get_exporter("xml", output, compress=True, max_urls=3)
+    exporter.write({"url": "https://example.com/", "lastmod": "2024-01-02"})
+    exporter.write({"url": "https://example.com/copy", "duplicate_of": "https://example.com/"})
+    exporter.write({"url": "https://example.com/about"})
+    exporter.close()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["sitemap.xml.gz"]
+    assert locs(exporter.output_path, gzip.open) == ["https://example.com/", "https://example.com/about"]
+    with gzip.open(exporter.output_path, "rb") as f:
+        assert ET.parse(f).find(".//sm:lastmod", NS).text == "2024-01-02"
+
+
+def test_empty_crawl_still_writes_a_sitemap(tmp_path):
+    exporter = get_exporter("xml", tmp_path / "sitemap.xml")
+    exporter.close()
+    assert locs(tmp_path / "sitemap.xml") == []
+
+
+def test_json_and_csv_stream_entries(tmp_path):
+    entries = [{"url": "https://example.com/", "title": "Home"}, {"url": "https://example.com/a", "title": "A, b"}]
+    json_exporter = get_exporter("json", tmp_path / "sitemap.json")
+    csv_exporter = get_exporter("csv", tmp_path / "sitemap.csv", include_content=True, batch_size=1)
+    for entry in entries:
+        json_exporter.write(entry)
+        csv_exporter.write(entry)
+    json_exporter.close()
+    csv_exporter.close()
+
+    assert json.loads((tmp_path / "sitemap.json").read_text(encoding="utf-8")) == entries
+    with open(tmp_path / "sitemap.csv", newline="", encoding="utf-8") as f:
+        assert list(csv.DictReader(f)) == entries
+    assert get_exporter("yaml", tmp_path / "sitemap.yaml") is None
+
+
+def page_links(path):
+    return re.findall(r'<li class="lpage[^"]*"><a href="([^"]+)"', path.read_text(encoding="utf-8"))
+
+
+def test_html_sitemap_groups_pages_and_splits_large_sections(tmp_path):
+    output = tmp_path / "sitemap.html"
+    (tmp_path / "sitemap-9.html").write_text("left over", encoding="utf-8")
+    exporter = get_exporter("html", output, domain="example.com", start_url="https://example.com/", max_links=3)
+    urls = ["https://example.com/", "https://example.com/about.html"]
+    urls += [f"https://example.com/docs/p{i}.html" for i in range(5)]
+    urls += ["https://example.com/blog/2024/a.html"]
+    for url in urls:
+        exporter.write({"url": url, "title": url.rpartition("/")[2] or "Home"})
+    exporter.close()
+
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files == ["sitemap-1.html", "sitemap-2.html", "sitemap-3.html", "sitemap-4.html", "sitemap.html"]
+    index = output.read_text(encoding="utf-8")
+    assert "Total pages: 8" in index
+    # "/" fits; docs/ and then blog/ would push the index past 3 links
+    assert '<a href="sitemap-1.html">docs/</a>  <span class="lcount">5 pages</span>' in index
+    assert '<a href="sitemap-2.html">blog/</a>  <span class="lcount">1 pages</span>' in index
+    assert "blog/2024/" in (tmp_path / "sitemap-2.html").read_text(encoding="utf-8")
+    # docs/ is split into numbered files of max_links pages, chained
+    docs = (tmp_path / "sitemap-1.html").read_text(encoding="utf-8")
+    assert page_links(tmp_path / "sitemap-1.html") == ["sitemap-3.html", "sitemap-4.html"]
+    assert '<a class="homepage-button" href="sitemap.html">Back to index</a>' in docs
+    second = (tmp_path / "sitemap-4.html").read_text(encoding="utf-8")
+    assert '<a href="sitemap-1.html">Up</a><a href="sitemap-3.html">Previous</a></div>' in second
+
+    listed = [url for n in ("", "-2", "-3", "-4") for url in page_links(tmp_path / f"sitemap{n}.html")]
+    assert sorted(listed) == sorted(urls)
@@ -0,0 +1,44 @@
+# tests/test_extract.py
+
+import pytest
+from scrapy.http import HtmlResponse
+
+from spidercore.extract import BACKENDS, LinkExtractor
+
+PAGE = b"""<html><head><title>Docs</title><base href="/docs/">
+<link rel="stylesheet" href="site.css"><script src="https://cdn.example.org/app.js"></script></head>
+<body>
+<a href=" guide.html ">The <b>guide</b></a>
+<a href="guide.html">Again</a>
+<a href="https://example.com/files/report.PDF">Report</a>
+<a href="mailto:team@example.com">Mail</a>
+<a href="ftp://example.com/old">Old</a>
+<a href="">Empty</a>
+<img src="/img/chart.zip"><img src="../files/report.PDF">
+</body></html>"""
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_one_pass_sorts_links_assets_and_unusual_urls(backend):
+    response = HtmlResponse("https://example.com/docs/start.html", body=PAGE, encoding="utf-8")
+    page = LinkExtractor(backend, anchors=True).extract(response)
+    assert page.title == "Docs"
+    assert page.links == ["https://example.com/docs/guide.html", "https://example.com/files/report.PDF"]
+    assert page.assets == ["https://example.com/files/report.PDF", "https://example.com/img/chart.zip"]
+    assert page.unusual == [
+        ("mailto:team@example.com", "mailto link"),
+        ("ftp://example.com/old", "non-http scheme: ftp"),
+    ]
+    # The first anchor's text, even where its href was padded with spaces
+    assert page.anchors == {
+        "https://example.com/docs/guide.html": "The guide",
+        "https://example.com/files/report.PDF": "Report",
+    }
+
+
+def test_asset_extensions_and_backend_names():
+    extractor = LinkExtractor(asset_extensions=[".CSV"])
+    assert extractor.is_asset("https://example.com/data.csv")
+    assert not extractor.is_asset("https://example.com/report.pdf")
+    with pytest.raises(ValueError, match="Unknown extractor backend"):
+        LinkExtractor("regex")
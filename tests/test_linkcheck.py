@@ -0,0 +1,49 @@
+# tests/test_linkcheck.py
+
+import json
+
+from scrapy import Request
+from scrapy.http import Response
+
+from spidercore.linkcheck import LINK_SOURCES_LIMIT, LinkChecker, redirect_chain
+
+
+def test_redirect_chain():
+    request = Request(
+        "https://example.com/new",
+        meta={"redirect_urls": ["http://example.com/old", "https://example.com/old"], "redirect_reasons": [301, 302]},
+    )
+    response = Response("https://example.com/new", status=200, request=request)
+    assert redirect_chain(response) == [
+        ["http://example.com/old", 301], ["https://example.com/old", 302], ["https://example.com/new", 200],
+    ]
+    assert redirect_chain(Response("https://example.com/", request=Request("https://example.com/"))) == []
+
+
+def test_report(tmp_path):
+    links = LinkChecker()
+    assert links.add("https://example.com/a", "https://example.com/")
+    assert not links.add("https://example.com/a", "https://example.com/b")
+    for i in range(LINK_SOURCES_LIMIT + 5):
+        links.add("https://example.com/gone", f"https://example.com/{i}")
+    links.add("https://example.com/moved", "https://example.com/")
+    links.add("https://example.com/down", "https://example.com/")
+    links.add("https://example.com/never", "https://example.com/")
+
+    links.record("https://example.com/a", 200)
+    links.record("https://example.com/gone", 404, method="HEAD")
+    links.record("https://example.com/gone", 200)
+    links.record("https://example.com/moved", 200, [["https://example.com/moved", 301]])
+    links.record("https://example.com/down", error="TimeoutError")
+    links.swept.add("https://example.com/never")
+    assert links.unresolved() == []
+
+    assert links.write_report(tmp_path / "links.json") == (5, 3)
+    report = json.loads((tmp_path / "links.json").read_text(encoding="utf-8"))
+    assert report["statuses"] == {"200": 2, "404": 1, "error": 2}
+    broken = {entry["url"]: entry for entry in report["broken"]}
+    assert broken["https://example.com/gone"]["method"] == "HEAD"
+    assert len(broken["https://example.com/gone"]["linked_from"]) == LINK_SOURCES_LIMIT
+    assert broken["https://example.com/gone"]["linked_from_count"] == LINK_SOURCES_LIMIT + 5
+    assert broken["https://example.com/never"]["error"] == "not checked"
+    assert [entry["url"] for entry in report["redirected"]] == ["https://example.com/moved"]
@@ -0,0 +1,71 @@
+# tests/test_linkgraph.py
+
+import json
+
+import pytest
+
+from spidercore.linkgraph import LinkGraph, read_graph
+from spidercore.urlstore import UrlStore
+
+HOME = "https://example.com/"
+
+
+def page(path):
+    return f"https://example.com/{path}"
+
+
+def graph():
+    links = LinkGraph(UrlStore())
+    links.add_page(HOME, [page("a"), page("b"), page("old"), page("missing"), HOME], root=True)
+    links.add_page(page("a"), [HOME, page("b")])
+    links.add_page(page("b-final"), [HOME], redirects=[page("b")])
+    links.add_page(page("orphan"), [page("a")])
+    # A page seen again keeps its first row
+    links.add_page(page("a"), [page("orphan")])
+    return links
+
+
+def test_analysis():
+    result = graph().analysis()
+    # Links to unparsed pages and to the page itself are dropped, links to
+    # a redirecting URL reach the page it ended on
+    rows = [list(result["targets"][result["offsets"][i]:result["offsets"][i + 1]]) for i in range(4)]
+    assert rows == [[1, 2], [0, 2], [0], [1]]
+    assert list(result["depth"]) == [0, 1, 1, -1]
+    assert list(result["in_degree"]) == [2, 2, 2, 0]
+    assert sum(result["pagerank"]) == pytest.approx(1.0)
+    assert result["pagerank"][0] == max(result["pagerank"])
+
+
+def test_priority_ranks_pages_on_a_log_scale():
+    links = graph()
+    assert links.priority(HOME) == pytest.approx(1.0)
+    assert links.priority(page("orphan")) == pytest.approx(links.min_priority)
+    assert links.min_priority < links.priority(page("a")) < 1.0
+    assert links.priority(page("missing")) is None
+    assert links.priority(page("never-seen")) is None
+
+
+def test_graph_file_round_trip(tmp_path):
+    links = graph()
+    links.write(tmp_path / "link-graph.bin")
+    stored = read_graph(tmp_path / "link-graph.bin")
+    result = links.analysis()
+    for name in ("offsets", "targets", "depth", "in_degree", "pagerank"):
+        assert stored[name] == result[name]
+    assert stored["urls"] == [HOME, page("a"), page("b-final"), page("orphan")]
+
+    (tmp_path / "other.bin").write_bytes(b"nope")
+    with pytest.raises(ValueError, match="Not a link graph file"):
+        read_graph(tmp_path / "other.bin")
+
+
+def test_report(tmp_path):
+    assert graph().write_report(tmp_path / "report.json", top=2) == 1
+    report = json.loads((tmp_path / "report.json").read_text(encoding="utf-8"))
+    assert report["pages"] == 4 and report["links"] == 6
+    assert report["pages_by_depth"] == {"0": 1, "1": 2}
+    assert report["unreachable_from_start"] == 1
+    assert report["orphans"] == [page("orphan")]
+    assert [entry["url"] for entry in report["top_pagerank"]][0] == HOME
+    assert len(report["top_pagerank"]) == 2
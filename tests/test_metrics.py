@@ -0,0 +1,64 @@
+# tests/test_metrics.py
+
+import json
+from types import SimpleNamespace
+
+import scrapy
+from scrapy.utils.test import get_crawler
+
+from spidercore.metrics import CrawlMetrics, Histogram, MetricsServer
+
+
+class Spider(scrapy.Spider):
+    name = "test"
+    domain = "example.com"
+
+
+def metrics_for(tmp_path, monkeypatch, worker=None, **settings):
+    registered = []
+    monkeypatch.setattr(MetricsServer, "register", classmethod(lambda cls, host, port, m: registered.append(port)))
+    monkeypatch.setattr(MetricsServer, "unregister", classmethod(lambda cls, host, port, m: registered.remove(port)))
+    crawler = get_crawler(Spider, settings_dict={"METRICS_SNAPSHOT_INTERVAL": 0, **settings})
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(active=set()))
+    spider = Spider()
+    spider.output_dir = tmp_path
+    spider.frontier = object() if worker is not None else None
+    spider.worker = worker
+    metrics = CrawlMetrics(crawler)
+    metrics.spider_opened(spider)
+    return metrics, spider, registered
+
+
+def test_single_crawl_writes_metrics_json(tmp_path, monkeypatch):
+    metrics, spider, registered = metrics_for(tmp_path, monkeypatch, METRICS_PORT=9464)
+    assert registered == [9464]
+    metrics.observe("parse_seconds", 0.003, callback="parse")
+    metrics.spider_closed(spider, "finished")
+    snapshot = json.loads((tmp_path / "metrics.json").read_text(encoding="utf-8"))
+    assert snapshot["site"] == "example.com"
+    assert snapshot["metrics"]["spidercore_parse_seconds"][0]["p50"] == 0.005
+    assert registered == [] and sorted(p.name for p in tmp_path.iterdir()) == ["metrics.json"]
+
+
+def test_workers_get_their_own_snapshot_and_port(tmp_path, monkeypatch):
+    metrics, spider, registered = metrics_for(tmp_path, monkeypatch, worker=2, METRICS_PORT=9464)
+    assert registered == [9466]
+    metrics.spider_closed(spider, "finished")
+    assert registered == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["metrics.worker-2.json"]
+
+
+def test_histogram_render_and_quantiles():
+    histogram = Histogram("latency", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, host="a")
+    assert list(histogram.render((("site", "s"),))) == [
+        'latency_bucket{site="s",host="a",le="0.1"} 1',
+        'latency_bucket{site="s",host="a",le="1.0"} 3',
+        'latency_bucket{site="s",host="a",le="+Inf"} 4',
+        'latency_sum{site="s",host="a"} 6.05',
+        'latency_count{site="s",host="a"} 4',
+    ]
+    series = histogram.series[(("host", "a"),)]
+    assert histogram.quantile(series, 0.5) == 1.0
+    assert histogram.quantile(series, 0.99) is None
@@ -0,0 +1,109 @@
+# tests/test_middlewares.py
+
+import scrapy
+from scrapy.core.downloader import Slot
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from spidercore import settings
+from spidercore.middlewares import (
+    SpidercoreDownloaderMiddleware, SpidercoreSpiderMiddleware, retry_after, timed_callback,
+)
+
+
+def middleware(**overrides):
+    values = {name: getattr(settings, name) for name in dir(settings) if name.isupper()}
+    values.update(overrides)
+    crawler = get_crawler(settings_dict=values)
+    crawler.spider = scrapy.Spider(name="test")
+    return SpidercoreDownloaderMiddleware(crawler)
+
+
+class TimedSpider(scrapy.Spider):
+    name = "test"
+
+    def parse(self, response):
+        yield sum(range(10000))
+
+    @timed_callback
+    def download_file(self, response):
+        self.saved = sum(range(10000))
+
+
+def spider_middleware():
+    crawler = get_crawler(TimedSpider)
+    crawler.spider = spider = TimedSpider()
+    mw = SpidercoreSpiderMiddleware.from_crawler(crawler)
+    crawler.signals.send_catch_log(scrapy.signals.spider_opened, spider=spider)
+    return mw, spider, crawler.stats
+
+
+def test_generator_callbacks_are_timed_while_consumed():
+    mw, spider, stats = spider_middleware()
+    response = Response("https://example.com/", request=scrapy.Request("https://example.com/", callback=spider.parse))
+    assert list(mw.process_spider_output(response, spider.parse(response))) == [49995000]
+    assert stats.get_value("callback_count/parse") == 1
+    assert stats.get_value("callback_cpu/parse") > 0
+
+
+def test_callbacks_doing_their_work_when_called_are_timed():
+    mw, spider, stats = spider_middleware()
+    assert spider.callback_timing is mw
+    request = scrapy.Request("https://example.com/f.zip", callback=spider.download_file)
+    response = Response(request.url, request=request)
+    result = spider.download_file(response)
+    assert spider.saved == 49995000
+    # Their (empty) output passes through without being counted again
+    assert list(mw.process_spider_output(response, result or ())) == []
+    assert stats.get_value("callback_count/download_file") == 1
+    assert stats.get_value("callback_cpu/download_file") > 0
+
+
+def busy_slot(in_flight, concurrency=8, delay=0.0):
+    slot = Slot(concurrency, delay, jitter=0)
+    slot.active.update(scrapy.Request(f"https://example.com/{i}") for i in range(in_flight))
+    return slot
+
+
+def test_fast_replies_drop_the_delay_then_widen_the_slot():
+    mw = middleware()
+    slot = busy_slot(0, concurrency=1, delay=0.5)
+    for _ in range(4):
+        mw.adapt("example.com", slot, 0.01)
+    assert slot.delay == 0.0 and slot.concurrency == 1
+    for _ in range(3):
+        mw.adapt("example.com", slot, 0.01)
+    assert slot.concurrency == 3
+
+
+def test_a_burst_of_slow_replies_slows_the_slot_once():
+    mw = middleware()
+    slot = busy_slot(40, concurrency=16)
+    # The first slow reply narrows the slot, the other 40 in flight then don't
+    for _ in range(41):
+        mw.adapt("example.com", slot, 10.0)
+    assert slot.concurrency == 8
+    assert slot.delay == mw.target_latency / 4
+    # Replies to requests sent after the slow-down count again
+    mw.adapt("example.com", slot, 10.0)
+    assert slot.concurrency == 4
+
+
+def test_errors_of_requests_in_flight_back_off_once():
+    mw = middleware()
+    slot = busy_slot(20)
+    for _ in range(21):
+        mw.back_off("example.com", slot, "TimeoutError")
+    assert slot.delay == 1.0 and slot.concurrency == 1
+    # Retry-After is always honoured
+    mw.back_off("example.com", slot, "HTTP 429", 30.0)
+    assert slot.delay == 30.0
+
+
+def test_retry_after():
+    def response(value):
+        return Response("https://example.com/", headers={"Retry-After": value} if value else {})
+
+    assert retry_after(response("120")) == 120.0
+    assert retry_after(response(None)) is None
+    assert retry_after(response("Wed, 21 Oct 2015 07:28:00 GMT")) == 0.0
@@ -0,0 +1,49 @@
+# tests/test_pipelines.py
+
+import sqlite3
+
+import pytest
+import scrapy
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.test import get_crawler
+
+from spidercore.items import SitemapItem
+from spidercore.pipelines import PageStorePipeline, SqlitePagesPipeline
+
+
+def crawler_for(tmp_path, **settings):
+    crawler = get_crawler(settings_dict=settings)
+    crawler.spider = scrapy.Spider(name="test")
+    crawler.spider.output_dir = tmp_path
+    crawler.spider.frontier = None
+    crawler.spider.state = None
+    return crawler
+
+
+def test_page_store_base_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        PageStorePipeline(crawler_for(tmp_path, PAGE_STORES=["sqlite"]))
+
+
+def test_store_must_be_enabled(tmp_path):
+    with pytest.raises(NotConfigured):
+        SqlitePagesPipeline(crawler_for(tmp_path, PAGE_STORES=[]))
+
+
+def test_sqlite_store_writes_in_batches(tmp_path):
+    pipeline = SqlitePagesPipeline(crawler_for(tmp_path, PAGE_STORES=["sqlite"], PAGE_STORE_BATCH=2))
+    pipeline.open_spider()
+    for i in range(3):
+        pipeline.process_item(SitemapItem(url=f"https://example.com/{i}", title=f"Page {i}", depth=1))
+    assert pipeline.count == 2 and len(pipeline.rows) == 1
+    # The same URL again replaces its row
+    pipeline.process_item(SitemapItem(url="https://example.com/0", title="Home", depth=0))
+    pipeline.close_spider()
+    db = sqlite3.connect(tmp_path / "pages.sqlite3")
+    rows = db.execute("SELECT url, title, depth FROM pages ORDER BY url").fetchall()
+    assert rows == [
+        ("https://example.com/0", "Home", 0),
+        ("https://example.com/1", "Page 1", 1),
+        ("https://example.com/2", "Page 2", 1),
+    ]
+    db.close()
@@ -0,0 +1,58 @@
+# tests/test_priority.py
+
+from scrapy import Request
+
+from spidercore.assets import ASSET_PRIORITY
+from spidercore.priority import PRIORITY_DEPTH, LinkScorer, PageBudget, directories
+from spidercore.rules import UrlRules
+
+
+class Spider:
+    replay = None
+
+    def parse(self, response):
+        pass
+
+    def download_file(self, response):
+        pass
+
+
+def test_matches_and_hubs_score_above_other_pages():
+    rules = UrlRules(filter="/docs/guide/")
+    scorer = LinkScorer(rules, filter="/docs/guide/")
+    match = scorer.score("https://example.com/docs/guide/install.html", 2)
+    hub = scorer.score("https://example.com/docs/index.html", 2)
+    other = scorer.score("https://example.com/blog/post.html", 2)
+    assert match > hub > other
+
+
+def test_learned_paths_raise_nearby_links():
+    rules = UrlRules(pattern="install")
+    scorer = LinkScorer(rules, pattern="install")
+    before = scorer.score("https://example.com/docs/setup.html", 1)
+    scorer.learn("https://example.com/docs/install.html", "Installing the tool")
+    assert scorer.score("https://example.com/docs/setup.html", 1) > before
+
+
+def test_deep_pages_stay_above_assets():
+    floor = ASSET_PRIORITY + PRIORITY_DEPTH
+    scorer = LinkScorer(UrlRules(), floor=floor)
+    assert scorer.score("https://example.com/a.html", 3) == -3 * PRIORITY_DEPTH
+    for depth in (10, 11, 50):
+        assert scorer.score("https://example.com/a.html", depth) == floor > ASSET_PRIORITY + 1
+
+
+def test_budget_counts_pages_only_once():
+    spider = Spider()
+    budget = PageBudget(2)
+    assert budget.admit(Request("https://example.com/1"), spider)
+    assert budget.admit(Request("https://example.com/f.zip", callback=spider.download_file), spider)
+    assert budget.admit(Request("https://example.com/2", meta={"redirect_times": 1}), spider)
+    assert budget.admit(Request("https://example.com/3"), spider)
+    assert not budget.admit(Request("https://example.com/4"), spider)
+    assert budget.used == 2
+
+
+def test_directories():
+    assert directories("https://example.com/a/b/c.html") == ["/a/", "/a/b/"]
+    assert directories("https://example.com/") == []
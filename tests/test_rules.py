@@ -0,0 +1,33 @@
+# tests/test_rules.py
+
+from spidercore.rules import UrlRules
+
+
+def test_no_rules_follow_everything():
+    rules = UrlRules()
+    assert not rules.active
+    assert rules.should_follow("https://example.com/anything")
+    assert rules.should_record("https://example.com/anything")
+
+
+def test_record_rules_must_all_match():
+    rules = UrlRules(filter="/docs/", pattern="GUIDE", exclude=[r"\.pdf$", "/draft/"])
+    assert rules.should_record("https://example.com/docs/guide.html")
+    assert not rules.should_record("https://example.com/docs/intro.html")
+    assert not rules.should_record("https://example.com/docs/guide.pdf")
+    assert not rules.should_record("https://example.com/docs/draft/guide.html")
+
+
+def test_non_matching_pages_stay_traversable_unless_strict():
+    loose = UrlRules(filter="/assets/uploads/", no_follow="/logout")
+    assert loose.should_follow("https://example.com/blog/post.html")
+    assert not loose.should_follow("https://example.com/logout")
+
+    strict = UrlRules(filter="/assets/uploads/", follow="/sitemap", strict=True)
+    assert strict.should_follow("https://example.com/assets/uploads/a.png")
+    # Hubs on the way to the filtered directory, and --follow matches
+    assert strict.should_follow("https://example.com/")
+    assert strict.should_follow("https://example.com/assets/index.html")
+    assert strict.should_follow("https://example.com/sitemap-2.html")
+    assert not strict.should_follow("https://example.com/blog/post.html")
+    assert not strict.should_follow("https://example.com/assets/css/site.css")
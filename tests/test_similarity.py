@@ -0,0 +1,35 @@
+# tests/test_similarity.py
+
+from spidercore.similarity import NearDuplicates, SimHashIndex, simhash
+
+WORDS = [f"word{i}" for i in range(200)]
+
+
+def test_small_edits_keep_the_fingerprint_close():
+    edited = WORDS[:100] + ["changed"] + WORDS[101:]
+    other = [f"other{i}" for i in range(200)]
+    assert bin(simhash(WORDS) ^ simhash(edited)).count("1") <= 3
+    assert bin(simhash(WORDS) ^ simhash(other)).count("1") > 3
+
+
+def test_index_finds_fingerprints_within_the_distance():
+    index = SimHashIndex(distance=3)
+    value = simhash(WORDS)
+    index.add(value, "https://example.com/a")
+    # Flip one bit in each of three different bands
+    near = value ^ (1 << 0) ^ (1 << 20) ^ (1 << 40)
+    assert index.find(near) == "https://example.com/a"
+    assert index.find(near ^ (1 << 60)) is None
+
+
+def test_duplicate_patterns_are_learned():
+    dupes = NearDuplicates(pattern_min=3, pattern_ratio=0.9)
+    assert dupes.check("https://example.com/", WORDS) is None
+    assert dupes.check("https://example.com/short", WORDS[:10]) is None
+    for i in range(3):
+        url = f"https://example.com/print/{i}"
+        assert dupes.check(url, WORDS) == "https://example.com/"
+    assert dupes.learned("https://example.com/print/2") == "example.com/print/{n}"
+    assert dupes.learned("https://example.com/print/2") is None
+    assert dupes.should_skip("https://example.com/print/9")
+    assert not dupes.should_skip("https://example.com/about")
@@ -0,0 +1,131 @@
+# tests/test_state.py
+
+import json
+from types import SimpleNamespace
+
+import scrapy
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from spidercore.state import CrawlHistory, CrawlState, SqliteScheduler, http_date_to_iso
+
+
+class Spider(scrapy.Spider):
+    name = "test"
+    max_pages = 250
+
+    def parse(self, response):
+        pass
+
+    def download_file(self, response):
+        pass
+
+
+def scheduler_for(state, max_pages=250):
+    crawler = get_crawler(Spider)
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(active=set()))
+    spider = Spider()
+    spider.state = state
+    spider.max_pages = max_pages
+    spider.visited_urls = state.stored_set("visited")
+    scheduler = SqliteScheduler.from_crawler(crawler)
+    scheduler.open(spider)
+    return scheduler, spider
+
+
+def test_stored_sets_and_pages(tmp_path):
+    state = CrawlState(tmp_path)
+    visited = state.stored_set("visited")
+    visited.add("https://example.com/")
+    visited.add("https://example.com/")
+    assert "https://example.com/" in visited and len(visited) == 1 and list(visited) == ["https://example.com/"]
+    state.add_page({"url": "https://example.com/", "title": "Home"})
+    state.add_page({"url": "https://example.com/", "title": "Home page"})
+    state.close()
+    state = CrawlState(tmp_path)
+    assert list(state.iter_pages()) == [{"url": "https://example.com/", "title": "Home page"}]
+    state.close()
+
+
+def test_frontier_is_deduplicated_ordered_and_resumed(tmp_path):
+    state = CrawlState(tmp_path)
+    scheduler, spider = scheduler_for(state)
+    assert scheduler.enqueue_request(scrapy.Request("https://example.com/low", callback=spider.parse, priority=-5))
+    assert scheduler.enqueue_request(scrapy.Request("https://example.com/high", callback=spider.parse, priority=5))
+    assert not scheduler.enqueue_request(scrapy.Request("https://example.com/high", callback=spider.parse))
+    assert len(scheduler) == 2
+
+    request = scheduler.next_request()
+    assert request.url == "https://example.com/high" and request.callback == spider.parse
+    scheduler.request_done(request, spider)
+    # Taken but never finished: the next run queues it again
+    assert scheduler.next_request().url == "https://example.com/low"
+    assert not scheduler.has_pending_requests()
+    state.close()
+
+    state = CrawlState(tmp_path)
+    scheduler, spider = scheduler_for(state)
+    assert len(scheduler) == 1
+    assert scheduler.next_request().url == "https://example.com/low"
+    assert not scheduler.enqueue_request(scrapy.Request("https://example.com/high"))
+    state.close()
+
+
+def test_page_budget_drops_requests_over_max_pages(tmp_path):
+    state = CrawlState(tmp_path)
+    state.stored_set("visited").add("https://example.com/")
+    scheduler, spider = scheduler_for(state, max_pages=2)
+    for path in ("a", "b", "c"):
+        scheduler.enqueue_request(scrapy.Request(f"https://example.com/{path}", callback=spider.parse))
+    scheduler.enqueue_request(scrapy.Request("https://example.com/f.zip", callback=spider.download_file, priority=-100))
+    urls = []
+    while (request := scheduler.next_request()) is not None:
+        urls.append(request.url)
+    assert urls == ["https://example.com/a", "https://example.com/f.zip"]
+    assert scheduler.stats.get_value("spidercore/over_budget") == 2
+    state.close()
+
+
+def response(url, body=b"", **headers):
+    return Response(url, body=body, headers=headers)
+
+
+def test_history_diffs_runs(tmp_path):
+    path = tmp_path / "crawl-history.sqlite3"
+    history = CrawlHistory(path)
+    for url in ("https://example.com/", "https://example.com/a", "https://example.com/b"):
+        history.save(url, response(url, ETag='"1"'), "hash-1", entry={"url": url})
+    history.save("https://example.com/f.zip", response("https://example.com/f.zip"), "zip")
+    history.close()
+
+    history = CrawlHistory(path)
+    assert (history.previous_run, history.run_id) == (1, 2)
+    assert history.validators("https://example.com/a") == ('"1"', None)
+    assert history.validators("https://example.com/new") == (None, None)
+    history.touch("https://example.com/")
+    history.save("https://example.com/a", response("https://example.com/a"), "hash-2", entry={"url": "a"})
+    history.save("https://example.com/c", response("https://example.com/c"), "hash-1", entry={"url": "c"})
+    counts = history.write_diff(tmp_path / "crawl-diff.json")
+    history.close()
+
+    diff = json.loads((tmp_path / "crawl-diff.json").read_text(encoding="utf-8"))
+    assert counts == {"added": 1, "removed": 1, "changed": 1}
+    assert diff == {
+        "run": 2,
+        "previous_run": 1,
+        "added": ["https://example.com/c"],
+        "removed": ["https://example.com/b"],
+        "changed": ["https://example.com/a"],
+    }
+
+
+def test_lastmod(tmp_path):
+    history = CrawlHistory(tmp_path / "crawl-history.sqlite3")
+    url = "https://example.com/"
+    dated = response(url, **{"Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    assert history.lastmod(url, dated, "h") == "2015-10-21T07:28:00+00:00"
+    history.save(url, response(url), "h", lastmod="2020-01-01T00:00:00+00:00")
+    assert history.lastmod(url, response(url), "h") == "2020-01-01T00:00:00+00:00"
+    assert history.lastmod(url, response(url), "other") != "2020-01-01T00:00:00+00:00"
+    assert http_date_to_iso("yesterday") is None
+    history.close()
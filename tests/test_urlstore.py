@@ -0,0 +1,44 @@
+# tests/test_urlstore.py
+
+from spidercore.urlstore import PageList, UrlSet, UrlStore
+
+
+def test_urls_are_interned_once():
+    urls = UrlStore()
+    first = urls.add("https://example.com/docs/a.html?x=1")
+    assert urls.add("https://example.com/docs/a.html?x=1") == first
+    second = urls.add("https://example.com/docs/b.html")
+    assert second == first + 1 and len(urls) == 2
+    # Pages of one directory share its prefix
+    assert urls.prefixes == ["https://example.com/docs/"]
+    assert urls.url(first) == "https://example.com/docs/a.html?x=1"
+    assert urls.get("https://example.com/docs/c.html") is None
+    assert "https://example.com/other/" not in urls and len(urls) == 2
+    # Lone surrogates from badly encoded links survive the round trip
+    odd = urls.add("https://example.com/\udcff")
+    assert urls.url(odd) == "https://example.com/\udcff"
+
+
+def test_url_set():
+    urls = UrlStore()
+    visited = UrlSet(urls)
+    for i in range(20):
+        urls.add(f"https://example.com/{i}")
+    visited.add("https://example.com/3")
+    visited.add("https://example.com/17")
+    visited.add("https://example.com/3")
+    assert len(visited) == 2
+    assert "https://example.com/17" in visited and "https://example.com/4" not in visited
+    assert "https://example.com/never" not in visited
+    assert not visited.has_id(1000)
+    assert list(visited) == ["https://example.com/3", "https://example.com/17"]
+
+
+def test_page_list():
+    pages = PageList(UrlStore())
+    pages.append("https://example.com/", "Home")
+    pages.append("https://example.com/a", None)
+    assert len(pages) == 2
+    assert pages[0] == ("https://example.com/", "Home")
+    assert pages[1:] == [("https://example.com/a", "")]
+    assert list(pages) == [("https://example.com/", "Home"), ("https://example.com/a", "")]